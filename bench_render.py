@@ -0,0 +1,57 @@
+# bench_render.py
+import time
+
+import markdown
+
+from render import MARKDOWN_EXTENSIONS, build_preview_markdown, markdown_to_html
+
+RUNS = 200
+
+
+def make_responses(with_code: bool):
+    """Сохранённый результат: короткий текстовый ответ или ответ с таблицей и кодом"""
+    response = "Нейросеть — это модель, которая учится на примерах.\n\n- первый пункт\n- второй пункт\n"
+    if with_code:
+        code = "\n".join(f"def f{i}(x):\n    return x * {i}" for i in range(20))
+        response += (
+            "\n| Модель | Оценка |\n|--------|--------|\n| A | 5 |\n| B | 4 |\n\n"
+            f"```python\n{code}\n```\n"
+        )
+    return [
+        {"prompt": "Что такое нейросеть?", "saved_at": "2024-01-01 12:00:00",
+         "model_name": f"Модель {i}", "response": response}
+        for i in range(3)
+    ]
+
+
+def bench(name, render, md_text):
+    render(md_text)  # прогрев: импорт расширений, Pygments
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        render(md_text)
+    per_render = (time.perf_counter() - start) / RUNS * 1000
+    print(f"  ⏱️ {name}: {per_render:.3f} мс")
+    return per_render
+
+
+def main():
+    print(f"🔹 Бенчмарк отрисовки Markdown ({RUNS} документов)")
+
+    for title, with_code in (("Короткий ответ", False), ("Ответ с таблицей и кодом", True)):
+        print(f"\n{title}:")
+        md_text = build_preview_markdown(make_responses(with_code))
+
+        before = bench(
+            "markdown.markdown() на каждый документ",
+            lambda text: markdown.markdown(text, extensions=MARKDOWN_EXTENSIONS),
+            md_text,
+        )
+        after = bench("общий конвертер render.markdown_to_html()", markdown_to_html, md_text)
+
+        same = markdown.markdown(md_text, extensions=MARKDOWN_EXTENSIONS) == markdown_to_html(md_text)
+        print(f"{'✅' if same else '❌'} Результат {'совпадает' if same else 'отличается'}, "
+              f"ускорение {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
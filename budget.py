@@ -0,0 +1,137 @@
+# budget.py
+import threading
+from datetime import date
+from typing import Optional
+
+# Цены в model_prices — в рублях за миллион токенов
+PRICE_UNIT_TOKENS = 1_000_000
+# Грубая оценка токенов по длине текста, пока провайдер не прислал usage
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+class PriceList:
+    """
+    Цены моделей в памяти: model_id → (цена ввода, цена вывода), ₽ за 1M токенов.
+    Загружается из model_prices один раз; cost() и estimate() — O(1), без обращения к БД.
+    Модель без цены считается бесплатной: её расходы не учитываются и не ограничиваются.
+    """
+
+    def __init__(self, prices: Optional[dict] = None):
+        self._prices = dict(prices or {})
+
+    @classmethod
+    def from_db(cls, db) -> "PriceList":
+        return cls(db.get_model_prices())
+
+    def get(self, model_id) -> Optional[tuple]:
+        return self._prices.get(model_id)
+
+    def cost(self, model_id, prompt_tokens: int, completion_tokens: int) -> float:
+        """Стоимость запроса в рублях"""
+        price = self._prices.get(model_id)
+        if price is None:
+            return 0.0
+        input_price, output_price = price
+        return ((prompt_tokens or 0) * (input_price or 0.0)
+                + (completion_tokens or 0) * (output_price or 0.0)) / PRICE_UNIT_TOKENS
+
+    def estimate(self, model_id, prompt: str, max_tokens: int) -> float:
+        """Худшая оценка стоимости до отправки: весь промт плюс ответ длиной max_tokens"""
+        if model_id not in self._prices:
+            return 0.0
+        return self.cost(model_id, estimate_tokens(prompt), max_tokens)
+
+
+class BudgetExceeded(Exception):
+    """Запрос не отправлен: он мог бы выйти за лимит расходов"""
+    pass
+
+
+class BudgetGuard:
+    """
+    Лимит расходов на запросы к моделям.
+
+    Перед запросом резервируется худшая оценка его стоимости (reserve), после ответа
+    резерв заменяется фактической стоимостью (settle). Запрос, который мог бы
+    выйти за лимит, не отправляется — поэтому лимит не превышается даже при
+    параллельной рассылке. Проверка — O(1) под одной блокировкой.
+
+    :param limit: лимит в рублях; None или 0 — без ограничения (только учёт расходов)
+    :param spent: уже потрачено (например, сегодня — из request_metrics)
+    :param daily: потраченное обнуляется с началом нового дня
+    :param parent: вышестоящий лимит — резерв и расходы учитываются и в нём
+                   (лимит рассылки внутри дневного бюджета)
+    :param name: как называть лимит в сообщениях ("дневной бюджет")
+    """
+
+    def __init__(self, limit: Optional[float] = None, spent: float = 0.0, daily: bool = False,
+                 parent: Optional["BudgetGuard"] = None, name: str = "бюджет"):
+        self.limit = limit or None
+        self.daily = daily
+        self.parent = parent
+        self.name = name
+        self._spent = spent
+        self._reserved = 0.0
+        self._day = date.today()
+        self._lock = threading.Lock()
+
+    def set_limit(self, limit: Optional[float]):
+        with self._lock:
+            self.limit = limit or None
+
+    @property
+    def spent(self) -> float:
+        with self._lock:
+            self._roll_day()
+            return self._spent
+
+    def remaining(self) -> Optional[float]:
+        """Сколько ещё можно потратить (None — без ограничения)"""
+        with self._lock:
+            self._roll_day()
+            if self.limit is None:
+                return None
+            return max(0.0, self.limit - self._spent - self._reserved)
+
+    def reserve(self, amount: float):
+        """
+        Резервирует amount рублей под запрос.
+
+        :raises BudgetExceeded: резерв вышел бы за лимит (этот или вышестоящий)
+        """
+        if self.parent is not None:
+            self.parent.reserve(amount)
+        with self._lock:
+            self._roll_day()
+            exceeded = self.limit is not None and self._spent + self._reserved + amount > self.limit
+            if exceeded:
+                message = (f"{self.name} {self.limit:.2f} ₽ исчерпан "
+                           f"(потрачено {self._spent:.2f} ₽, ещё {self._reserved:.2f} ₽ — в идущих запросах)")
+            else:
+                self._reserved += amount
+        if exceeded:
+            if self.parent is not None:
+                self.parent.settle(amount, 0.0)
+            raise BudgetExceeded(message)
+
+    def settle(self, reserved: float, actual: float):
+        """Запрос завершён: резерв reserved снимается, фактическая стоимость actual учитывается"""
+        with self._lock:
+            self._roll_day()
+            self._reserved = max(0.0, self._reserved - reserved)
+            self._spent += actual
+        if self.parent is not None:
+            self.parent.settle(reserved, actual)
+
+    def _roll_day(self):
+        """Вызывается под блокировкой"""
+        if not self.daily:
+            return
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._spent = 0.0
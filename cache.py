@@ -0,0 +1,205 @@
+# cache.py
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from db import WriteBehindQueue
+
+# Ответы живут сутки, в БД храним не больше 1000 штук
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1000
+# Сколько последних ответов держать в памяти для мгновенной выдачи
+DEFAULT_MEMORY_ENTRIES = 200
+# Попадания в памяти отмечаются в БД (last_used_at) пачкой — по стольку штук или раз в интервал
+TOUCH_BATCH_SIZE = 50
+TOUCH_FLUSH_INTERVAL = 60.0
+# Устаревшие по ttl записи удаляются не реже, чем раз в столько секунд
+EVICT_INTERVAL = 10 * 60.0
+
+
+class ResponseCache:
+    """
+    Кэш ответов моделей: ключ — хэш (провайдер, модель, URL, промт, temperature, max_tokens).
+
+    Два уровня:
+    - LRU-словарь в памяти — повторный запрос отдаётся без обращения к диску;
+    - таблица response_cache в SQLite — кэш переживает перезапуск.
+
+    Записи старше ttl не выдаются. Таблица подрезается до max_entries (вытесняются
+    давно не использованные по last_used_at), когда выходит за предел, и раз в
+    EVICT_INTERVAL — от устаревших. Попадания в памяти тоже обновляют last_used_at
+    (пачкой, в фоновом потоке записи), иначе самые ходовые ответы вытеснялись бы из БД первыми.
+
+    Новые ответы пишутся в БД фоновым потоком (WriteBehindQueue): ответы параллельных
+    запросов уходят пачкой, одной транзакцией, и отправитель не ждёт диска.
+    Обращения к БД выполняются вне блокировки кэша. По окончании работы — close().
+    """
+
+    def __init__(self, db, ttl: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 memory_entries: int = DEFAULT_MEMORY_ENTRIES):
+        self.db = db
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # cache_key → (response, created_at)
+        self._touched = {}  # cache_key → (last_used_at, попаданий) — ещё не записано в БД
+        self._touched_flushed = time.monotonic()
+        self._touch_queued = False  # сигнал записи отметок уже в очереди _writer
+        self._db_entries = None  # сколько записей в таблице (оценка сверху; None — не считали)
+        self._evicted = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self._writer = WriteBehindQueue(self._write, name="cache-writer")
+
+    @staticmethod
+    def make_key(model: dict, prompt: str, temperature: float, max_tokens: int) -> str:
+        """Хэш параметров запроса"""
+        raw = json.dumps([
+            (model.get("provider") or "").lower(),
+            model.get("model_name") or "",
+            model.get("api_url") or "",
+            prompt,
+            temperature,
+            max_tokens,
+        ], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """Возвращает ответ из кэша или None"""
+        now = time.time()
+        min_created_at = now - self.ttl
+        touch_due = False
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is not None:
+                response, created_at = entry
+                if created_at >= min_created_at:
+                    self._memory.move_to_end(cache_key)
+                    self.hits += 1
+                    _, count = self._touched.get(cache_key, (now, 0))
+                    self._touched[cache_key] = (now, count + 1)
+                    touch_due = self._touch_due() and not self._touch_queued
+                    self._touch_queued = self._touch_queued or touch_due
+                else:
+                    del self._memory[cache_key]
+                    response = None
+            else:
+                response = None
+        if touch_due:
+            # Отметки пишет фоновый поток записи (см. _write) — get() к диску не обращается
+            self._writer.submit(None)
+        if response is not None:
+            return response
+
+        # get_cached_response сам отмечает использование записи
+        row = self.db.get_cached_response(cache_key, min_created_at)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(cache_key, row["response"], row["created_at"])
+        return row["response"]
+
+    def put(self, cache_key: str, response: str, model_id: Optional[int] = None):
+        """Сохраняет ответ: в памяти — сразу, в БД — в фоне, пачкой с ответами других запросов"""
+        now = time.time()
+        with self._lock:
+            self._remember(cache_key, response, now)
+        self._writer.submit((cache_key, model_id, response, now))
+
+    def _write(self, rows: list) -> list:
+        """
+        Пачка новых ответов — одной транзакцией (вызывается из потока WriteBehindQueue).
+        None в пачке — сигнал от get(): накопилось достаточно отметок использования.
+        Вытесняет лишнее, только если таблица переполнена или пора чистить по ttl.
+        """
+        new_rows = [row for row in rows if row is not None]
+        if new_rows:
+            self.db.save_cached_responses(new_rows)
+        with self._lock:
+            if self._db_entries is None:
+                self._db_entries = self.db.count_cached_responses()
+            else:
+                self._db_entries += len(new_rows)  # перезапись существующего ключа тоже считается — оценка сверху
+            due = (self._db_entries > self.max_entries
+                   or time.monotonic() - self._evicted >= EVICT_INTERVAL)
+            if due:
+                self._evicted = time.monotonic()
+            # Перед вытеснением last_used_at должен быть актуален
+            touched = self._take_touched(force=due)
+            self._touch_queued = False
+        if touched:
+            self.db.touch_cached_responses(touched)
+        if not due:
+            return [None] * len(rows)
+        self.db.evict_response_cache(time.time() - self.ttl, self.max_entries)
+        entries = self.db.count_cached_responses()
+        with self._lock:
+            self._db_entries = entries
+        return [None] * len(rows)
+
+    def flush(self):
+        """Дописывает в БД новые ответы и отметки использования, накопленные в памяти"""
+        self._writer.flush()
+        with self._lock:
+            touched = self._take_touched(force=True)
+        if touched:
+            self.db.touch_cached_responses(touched)
+
+    def close(self):
+        """Дописывает всё в БД и останавливает фоновую запись (при выходе, до Database.close)"""
+        self.flush()
+        self._writer.close()
+
+    def clear(self):
+        """Очищает кэш в памяти и в БД, обнуляет счётчики"""
+        self._writer.flush()  # иначе ответы из очереди появились бы в БД уже после очистки
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self._db_entries = 0
+            self.hits = 0
+            self.misses = 0
+        self.db.clear_response_cache()
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def _take_touched(self, force: bool = False) -> list:
+        """
+        Забирает накопленные отметки, если их пора записать (вызывается под блокировкой).
+        :return: [(cache_key, last_used_at, попаданий)] или пустой список
+        """
+        if not self._touched or not (force or self._touch_due()):
+            return []
+        touched = [(key, last_used_at, count) for key, (last_used_at, count) in self._touched.items()]
+        self._touched.clear()
+        self._touched_flushed = time.monotonic()
+        return touched
+
+    def _touch_due(self) -> bool:
+        """Пора ли записать накопленные отметки (вызывается под блокировкой)"""
+        return bool(self._touched) and (
+            len(self._touched) >= TOUCH_BATCH_SIZE
+            or time.monotonic() - self._touched_flushed >= TOUCH_FLUSH_INTERVAL
+        )
+
+    def _remember(self, cache_key: str, response: str, created_at: float):
+        self._memory[cache_key] = (response, created_at)
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
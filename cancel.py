@@ -0,0 +1,104 @@
+# cancel.py
+import threading
+import time
+from typing import Callable, Optional
+
+# Как часто ожидающие потоки проверяют, не отменена ли операция (секунды)
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class Cancelled(BaseException):
+    """
+    Операция отменена через CancelToken.
+
+    Наследуется от BaseException (как asyncio.CancelledError), чтобы пройти
+    сквозь обработчики `except Exception` в функциях отправки запросов.
+    """
+    pass
+
+
+class CancelToken:
+    """
+    Отмена одной рассылки: вручную (cancel) или по общему дедлайну.
+
+    Токен передаётся во все запросы рассылки: ожидание очереди (RateLimiter),
+    паузы между повторами (RetryState) и чтение потокового ответа прерываются,
+    как только токен отменён. Колбэки add_callback() вызываются один раз при отмене —
+    например, чтобы закрыть открытое соединение.
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        """:param deadline: через сколько секунд рассылка отменяется сама (None — без ограничения)"""
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = ""
+        self.deadline = deadline
+        self._expires = None if not deadline else time.monotonic() + deadline
+        self._timer = None
+        if self._expires is not None:
+            self._timer = threading.Timer(deadline, self.cancel, args=(f"нет ответа за {deadline:.0f} сек",))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self, reason: str = "отменено пользователем"):
+        """Отменяет рассылку; повторный вызов ничего не делает"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        if self._timer is not None:
+            self._timer.cancel()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[CANCEL] Ошибка при отмене: {e}")
+
+    def close(self):
+        """Рассылка закончилась сама — таймер дедлайна больше не нужен"""
+        if self._timer is not None:
+            self._timer.cancel()
+        with self._lock:
+            self._callbacks = []
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    @property
+    def message(self) -> str:
+        """Текст для строки результата, которую отменили"""
+        return f"⛔ {self.reason.capitalize()}" if self.reason else "⛔ Отменено"
+
+    def remaining(self) -> Optional[float]:
+        """Сколько секунд осталось до дедлайна (None — дедлайна нет)"""
+        if self._expires is None:
+            return None
+        return max(0.0, self._expires - time.monotonic())
+
+    def check(self):
+        """Бросает Cancelled, если рассылка уже отменена"""
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    def sleep(self, seconds: float):
+        """time.sleep, который прерывается отменой (бросает Cancelled)"""
+        if self._event.wait(seconds):
+            raise Cancelled(self.reason)
+
+    def add_callback(self, callback: Callable[[], None]):
+        """callback() будет вызван при отмене (сразу, если токен уже отменён)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
@@ -0,0 +1,315 @@
+# chatlist.py
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from budget import BudgetGuard, PriceList
+from cache import ResponseCache
+from db import DB_PATH, Database, WriteBehindQueue
+from network import DEFAULT_MAX_WORKERS, Network
+
+# Как часто печатать прогресс (секунды)
+PROGRESS_INTERVAL = 1.0
+# Сколько заданий держать в очереди пула сверх числа потоков
+QUEUE_FACTOR = 2
+
+
+def read_prompts(path: str) -> list:
+    """Промты из файла (или stdin при path == "-"): по одному на строку, пустые строки пропускаются"""
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip()]
+
+
+def select_models(db: Database, names: list) -> list:
+    """Активные модели; если заданы names — только они (по имени, без учёта регистра)"""
+    models = db.get_active_models()
+    if not names:
+        return models
+    wanted = {name.lower() for name in names}
+    return [model for model in models if model["name"].lower() in wanted]
+
+
+def percentile(values: list, p: float) -> float:
+    """p-й перцентиль (0..100) по отсортированному списку"""
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def _timed_send(model: dict, prompt: str, cache, bypass_cache: bool, budget, stream: bool = False):
+    start = time.perf_counter()
+    info = {}
+    # Потоковый режим нужен только для замеров — фрагменты не показываются
+    on_token = (lambda chunk: None) if stream else None
+    try:
+        response = Network.send_prompt_to_model(model, prompt, on_token=on_token, cache=cache,
+                                                bypass_cache=bypass_cache, info=info, budget=budget)
+    except Exception as e:
+        response = f"❌ Ошибка: {e}"
+    return response, time.perf_counter() - start, info
+
+
+def run_batch(prompts: list, models: list, concurrency: int = DEFAULT_MAX_WORKERS,
+              db: Database = None, cache: ResponseCache = None, bypass_cache: bool = False,
+              output=None, tags: str = "batch", log=None, budget: BudgetGuard = None,
+              stream: bool = False) -> dict:
+    """
+    Отправляет каждый промт в каждую модель (prompt × model) не более чем
+    в concurrency потоков.
+
+    :param db: если задан — промты и успешные ответы сохраняются в БД
+               (ответы — пачками через WriteBehindQueue)
+    :param output: открытый файл — каждый ответ пишется строкой JSONL
+    :param log: log(str) — прогресс и ошибки
+    :param budget: лимит расходов на запуск; запросы сверх него не отправляются
+    :param stream: запрашивать ответы потоком (SSE), как это делает GUI
+    :return: статистика: jobs, ok, errors, retries, elapsed, throughput, p50/p95/p99 (сек),
+             cost (₽), tokens
+    """
+    log = log or (lambda message: None)
+    prompt_ids = [db.save_prompt(prompt, tags) if db is not None else None for prompt in prompts]
+    writer = WriteBehindQueue(db.save_results, name="cli-writer") if db is not None else None
+
+    jobs = ((prompt_idx, model) for prompt_idx in range(len(prompts)) for model in models)
+    total = len(prompts) * len(models)
+    latencies = []
+    ok = errors = retries = tokens = 0
+    cost = 0.0
+    start = last_report = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            in_flight = {}
+
+            def submit_next():
+                job = next(jobs, None)
+                if job is None:
+                    return False
+                prompt_idx, model = job
+                future = pool.submit(_timed_send, model, prompts[prompt_idx], cache, bypass_cache, budget, stream)
+                in_flight[future] = job
+                return True
+
+            # Заданий в очереди — ограниченное окно, а не все prompt × model сразу
+            while len(in_flight) < concurrency * QUEUE_FACTOR and submit_next():
+                pass
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    prompt_idx, model = in_flight.pop(future)
+                    response, latency, info = future.result()
+                    attempts = info.get("attempts", 1)
+                    usage = info.get("usage") or {}
+                    latencies.append(latency)
+                    retries += max(0, attempts - 1)
+                    cost += info.get("cost") or 0.0
+                    tokens += usage.get("total_tokens") or 0
+
+                    is_error = not response or not response.strip() or Network.is_error_response(response)
+                    if is_error:
+                        errors += 1
+                        log(f"❌ {model['name']} (промт {prompt_idx + 1}): {(response or 'пустой ответ')[:200]}")
+                    else:
+                        ok += 1
+                        if writer is not None:
+                            writer.submit((prompt_ids[prompt_idx], model["id"], response.strip(),
+                                           dict(usage, cost=info.get("cost"))))
+
+                    if output is not None:
+                        output.write(json.dumps({
+                            "prompt_index": prompt_idx,
+                            "prompt": prompts[prompt_idx],
+                            "model": model["name"],
+                            "response": response,
+                            "error": is_error,
+                            "latency": round(latency, 3),
+                            "attempts": attempts,
+                            "usage": usage or None,
+                            "cost": info.get("cost"),
+                        }, ensure_ascii=False) + "\n")
+
+                    submit_next()
+
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    done_count = ok + errors
+                    log(f"⏳ {done_count}/{total} ({done_count / (now - start):.1f} запросов/с)")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "jobs": total,
+        "ok": ok,
+        "errors": errors,
+        "retries": retries,
+        "elapsed": elapsed,
+        "throughput": (ok + errors) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "cost": cost,
+        "tokens": tokens,
+    }
+
+
+def print_request_stats(db: Database, hours: float, out):
+    """Таблица замеров из request_metrics: самые медленные модели — первыми"""
+    stats = db.get_request_stats(since=time.time() - hours * 60 * 60)
+    if not stats:
+        print(f"Нет замеров за последние {hours:g} ч", file=out)
+        return
+
+    def ms(value):
+        return f"{value / 1000:.2f}" if value is not None else "—"
+
+    print(f"{'Модель':<20} {'запросов':>8} {'ошибок':>7} {'повторов':>8} "
+          f"{'p50, с':>7} {'p95, с':>7} {'p99, с':>7} {'TTFB, с':>8}", file=out)
+    for row in stats:
+        name = row["model_name"] or f"id {row['model_id']}"
+        print(f"{name[:20]:<20} {row['requests']:>8} {row['error_rate']:>7.1%} {row['retries']:>8} "
+              f"{ms(row['p50']):>7} {ms(row['p95']):>7} {ms(row['p99']):>7} {ms(row['avg_ttfb']):>8}",
+              file=out)
+
+
+def print_costs(db: Database, days: float, out):
+    """Расходы за последние days дней: по дням и по моделям"""
+    since = time.time() - days * 24 * 60 * 60
+    by_day = db.get_costs(since, group_by="day")
+    if not by_day:
+        print(f"Нет запросов за последние {days:g} дн.", file=out)
+        return
+    print(f"{'День':<12} {'запросов':>8} {'токенов':>10} {'₽':>10}", file=out)
+    for row in by_day:
+        tokens = (row["prompt_tokens"] or 0) + (row["completion_tokens"] or 0)
+        print(f"{row['day']:<12} {row['requests']:>8} {tokens:>10} {row['cost']:>10.2f}", file=out)
+    print(file=out)
+    print(f"{'Модель':<20} {'запросов':>8} {'токенов':>10} {'₽':>10}", file=out)
+    for row in db.get_costs(since, group_by="model"):
+        name = row["model_name"] or f"id {row['model_id']}"
+        tokens = (row["prompt_tokens"] or 0) + (row["completion_tokens"] or 0)
+        print(f"{name[:20]:<20} {row['requests']:>8} {tokens:>10} {row['cost']:>10.2f}", file=out)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m chatlist",
+        description="ChatList без GUI: отправляет промты во все активные модели и сохраняет ответы.",
+    )
+    parser.add_argument("prompts", nargs="?", default="-",
+                        help="файл с промтами, по одному на строку (по умолчанию — stdin)")
+    parser.add_argument("-m", "--model", action="append", default=[],
+                        help="только эта модель (имя из таблицы models); можно указать несколько раз")
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"одновременных запросов (по умолчанию {DEFAULT_MAX_WORKERS})")
+    parser.add_argument("-o", "--output", help="записать ответы в JSONL-файл (\"-\" — в stdout)")
+    parser.add_argument("--db", default=DB_PATH, help=f"путь к базе (по умолчанию {DB_PATH})")
+    parser.add_argument("--no-save", action="store_true", help="не сохранять промты и ответы в БД")
+    parser.add_argument("--tags", default="batch", help="теги сохраняемых промтов (по умолчанию batch)")
+    parser.add_argument("--no-cache", action="store_true", help="не брать ответы из кэша")
+    parser.add_argument("--stream", action="store_true", help="запрашивать ответы потоком (SSE), как GUI")
+    parser.add_argument("--list-models", action="store_true", help="показать активные модели и выйти")
+    parser.add_argument("--stats", type=float, metavar="HOURS",
+                        help="показать задержки и долю ошибок по моделям за последние HOURS часов и выйти")
+    parser.add_argument("--costs", type=float, metavar="DAYS",
+                        help="показать расходы по дням и моделям за последние DAYS дней и выйти")
+    parser.add_argument("--budget", type=float, default=0,
+                        help="лимит расходов на запуск, ₽ (по ценам моделей; 0 — без ограничения)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="подробный лог запросов (в stderr)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    stdout = sys.stdout
+
+    def log(message: str):
+        print(message, file=sys.stderr, flush=True)
+
+    with contextlib.ExitStack() as stack:
+        # Модули пишут подробный лог через print — уводим его из stdout
+        noise = sys.stderr if args.verbose else stack.enter_context(open(os.devnull, "w"))
+        stack.enter_context(contextlib.redirect_stdout(noise))
+
+        db = Database(args.db)
+        metrics_writer = None
+        cache = None
+        try:
+            if args.stats is not None:
+                print_request_stats(db, args.stats, stdout)
+                return 0
+            if args.costs is not None:
+                print_costs(db, args.costs, stdout)
+                return 0
+            models = select_models(db, args.model)
+            if args.list_models:
+                for model in models:
+                    print(f"{model['id']:>3}  {model['name']}  ({model['provider']}, {model['model_name']})",
+                          file=stdout)
+                return 0
+            if not models:
+                log("❌ Нет активных моделей" + (f" с именами: {', '.join(args.model)}" if args.model else ""))
+                return 1
+
+            prompts = read_prompts(args.prompts)
+            if not prompts:
+                log("❌ Нет промтов")
+                return 1
+
+            concurrency = max(1, args.concurrency)
+            Network.configure_pool(pool_size=max(concurrency, DEFAULT_MAX_WORKERS))
+            metrics_writer = WriteBehindQueue(db.save_request_metrics, name="cli-metrics-writer")
+            Network.configure_metrics(metrics_writer.submit)
+            cache = ResponseCache(db)
+            Network.configure_budget(prices=PriceList.from_db(db))
+            budget = BudgetGuard(args.budget, name="бюджет запуска")
+            log(f"🔹 {len(prompts)} промтов × {len(models)} моделей = {len(prompts) * len(models)} запросов, "
+                f"потоков: {concurrency}")
+
+            if args.output == "-":
+                output_cm = contextlib.nullcontext(stdout)
+            elif args.output:
+                output_cm = open(args.output, "w", encoding="utf-8")
+            else:
+                output_cm = contextlib.nullcontext(None)
+
+            with output_cm as output:
+                stats = run_batch(
+                    prompts, models, concurrency,
+                    db=None if args.no_save else db, cache=cache, bypass_cache=args.no_cache,
+                    output=output, tags=args.tags, log=log, budget=budget, stream=args.stream,
+                )
+        finally:
+            Network.configure_metrics(None)
+            if metrics_writer is not None:
+                metrics_writer.close()
+            if cache is not None:
+                cache.close()
+            Network.close_sessions()
+            db.close()
+
+    cache_stats = cache.stats()
+    log(f"✅ Готово: {stats['ok']} ответов, {stats['errors']} ошибок за {stats['elapsed']:.1f} с "
+        f"({stats['throughput']:.1f} запросов/с)")
+    log(f"⏱️ Задержка: p50 {stats['p50']:.2f} с, p95 {stats['p95']:.2f} с, p99 {stats['p99']:.2f} с; "
+        f"повторов: {stats['retries']}, из кэша: {cache_stats['hits']}")
+    if stats["cost"] or stats["tokens"]:
+        log(f"💰 Расход: {stats['cost']:.2f} ₽, токенов: {stats['tokens']}")
+    return 0 if stats["errors"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
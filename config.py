@@ -1,10 +1,158 @@
 # config.py
 import os
 import json 
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Адрес можно переопределить в .env (например, на локальный mock_server.py)
+YANDEX_IAM_URL = os.getenv("YANDEX_IAM_URL", "https://iam.api.cloud.yandex.net/iam/v1/tokens")
+# Пауза перед повтором фонового обновления токена после ошибки (секунды)
+REFRESH_RETRY_BACKOFF = 10.0
+
+
+class TokenCache:
+    """
+    Потокобезопасный кэш токена доступа.
+
+    - токен переиспользуется до expires_at;
+    - за refresh_margin секунд до истечения обновляется в фоне,
+      а вызывающие продолжают получать текущий токен;
+    - если токена нет или он истёк, обновление выполняет один поток,
+      остальные ждут его результата (single-flight);
+    - после неудачного фонового обновления следующее делается не раньше чем
+      через REFRESH_RETRY_BACKOFF секунд — иначе каждый вызов get() до истечения
+      токена порождал бы новый запрос к недоступному серверу;
+    - при указании cache_file токен сохраняется на диск между запусками.
+
+    fetch() должен вернуть (токен, время истечения в секундах Unix).
+    """
+
+    def __init__(self, fetch: Callable[[], Tuple[str, float]], cache_file: Optional[str] = None,
+                 refresh_margin: float = 60.0, token_field: str = "token", name: str = "token"):
+        self._fetch = fetch
+        self.cache_file = cache_file
+        self.refresh_margin = refresh_margin
+        self.token_field = token_field
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._inflight: Optional[threading.Event] = None
+        self._last_error: Optional[Exception] = None
+        self._next_refresh_at = 0.0  # раньше этого времени фоновое обновление не повторяем
+        self._loaded = False
+
+    def get(self) -> str:
+        """Возвращает действующий токен, при необходимости обновляя его"""
+        self._load_once()
+        now = time.time()
+        with self._lock:
+            token, expires_at = self._token, self._expires_at
+            next_refresh_at = self._next_refresh_at
+
+        if token and now < expires_at - self.refresh_margin:
+            return token
+
+        if token and now < expires_at:
+            # Скоро истечёт — обновляем в фоне, пока отдаём текущий
+            if now >= next_refresh_at:
+                self._start_refresh(background=True)
+            return token
+
+        return self._start_refresh(background=False)
+
+    def invalidate(self):
+        """Сбрасывает токен (например, если сервер ответил 401)"""
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
+
+    def _start_refresh(self, background: bool) -> Optional[str]:
+        with self._lock:
+            event = self._inflight
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._inflight = event
+
+        if leader:
+            if background:
+                threading.Thread(target=self._refresh, args=(event,), daemon=True,
+                                 name=f"{self.name}-refresh").start()
+                return None
+            self._refresh(event)
+        elif background:
+            return None
+        else:
+            event.wait()
+
+        with self._lock:
+            if self._token and time.time() < self._expires_at:
+                return self._token
+            error = self._last_error
+        raise error or RuntimeError(f"Не удалось получить {self.name}")
+
+    def _refresh(self, event: threading.Event):
+        try:
+            print(f"🔄 Обновляю {self.name}...")
+            token, expires_at = self._fetch()
+            with self._lock:
+                self._token, self._expires_at = token, float(expires_at)
+                self._last_error = None
+                self._next_refresh_at = 0.0
+            self._save(token, expires_at)
+        except Exception as e:
+            print(f"⚠ Не удалось обновить {self.name}: {e}")
+            with self._lock:
+                self._last_error = e
+                self._next_refresh_at = time.time() + REFRESH_RETRY_BACKOFF
+        finally:
+            with self._lock:
+                self._inflight = None
+            event.set()
+
+    def _load_once(self):
+        """Читает токен из файла кэша при первом обращении"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.cache_file or not os.path.exists(self.cache_file):
+                return
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    cache = json.load(f)
+                token = cache.get(self.token_field)
+                expires_at_str = cache.get("expires_at")
+                if token and expires_at_str:
+                    expires_at = datetime.fromisoformat(expires_at_str.replace("Z", "+00:00"))
+                    self._token, self._expires_at = token, expires_at.timestamp()
+                    print(f"✅ {self.name}: загружен из кэша")
+            except Exception as e:
+                print(f"⚠ Кэш нечитаем: {e}")
+
+    def _save(self, token: str, expires_at: float):
+        if not self.cache_file:
+            return
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            expires_iso = datetime.fromtimestamp(expires_at, tz=timezone.utc).isoformat()
+            # Пишем во временный файл и атомарно подменяем — читатель не увидит половину JSON
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({self.token_field: token, "expires_at": expires_iso}, f)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            print(f"⚠ Не удалось сохранить кэш {self.name}: {e}")
+
+
 class Config:
     @staticmethod
     def get_api_key(key_var: str) -> str:
@@ -26,67 +174,54 @@ class Config:
     def get_yandex_credentials():
         """
         Возвращает IAM-токен и Folder ID.
-        При необходимости — автоматически обновляет IAM-токен через OAuth.
+        Токен хранится в памяти процесса; файл кэша читается один раз при старте
+        и перезаписывается только после обновления токена через OAuth.
         """
-        import os
+        iam_token = _yandex_iam_tokens.get()
+
+        folder_id = os.getenv("YANDEX_FOLDER_ID")
+        if not folder_id:
+            raise ValueError("YANDEX_FOLDER_ID не найден в .env")
+
+        return iam_token, folder_id
+
+    @staticmethod
+    def invalidate_yandex_token():
+        """Сбрасывает IAM-токен (сервер ответил 401) — следующий вызов получит новый"""
+        _yandex_iam_tokens.invalidate()
+
+    @staticmethod
+    def _fetch_yandex_iam_token() -> Tuple[str, float]:
+        """Обменивает OAuth-токен на IAM-токен; возвращает (токен, истечение в секундах Unix)"""
         import requests
-        from datetime import datetime, timezone
+        from retry import DEFAULT_REQUEST_TIMEOUT
 
         # Получаем OAuth-токен из .env
         oauth_token = os.getenv("YANDEX_OAUTH_TOKEN")
         if not oauth_token:
             raise ValueError("YANDEX_OAUTH_TOKEN не найден в .env")
 
-        # Путь к кэшу IAM-токена (можно использовать временный файл)
-        cache_file = ".yandex_iam_cache.json"
-
-        # Попробуем прочитать закэшированный токен
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, "r", encoding="utf-8") as f:
-                    cache = json.load(f)
-                iam_token = cache.get("iam_token")
-                expires_at_str = cache.get("expires_at")
-
-                if iam_token and expires_at_str:
-                    expires_at = datetime.fromisoformat(expires_at_str.replace("Z", "+00:00"))
-                    now = datetime.now(timezone.utc)
-
-                    if now < expires_at:
-                        print("✅ Используем закэшированный IAM-токен")
-                        folder_id = os.getenv("YANDEX_FOLDER_ID")
-                        if not folder_id:
-                            raise ValueError("YANDEX_FOLDER_ID не найден в .env")
-                        return iam_token, folder_id
-            except Exception as e:
-                print(f"⚠ Кэш нечитаем: {e}")
-
-        # Если кэш отсутствует или устарел — обновляем
         print("🔄 Получаем новый IAM-токен через OAuth...")
         response = requests.post(
-            "https://iam.api.cloud.yandex.net/iam/v1/tokens",
-            json={"yandexPassportOauthToken": oauth_token}
+            YANDEX_IAM_URL,
+            json={"yandexPassportOauthToken": oauth_token},
+            timeout=DEFAULT_REQUEST_TIMEOUT
         )
 
         if response.status_code != 200:
-            error = response.json().get("error", "Неизвестная ошибка")
+            try:
+                error = response.json().get("error", "Неизвестная ошибка")
+            except ValueError:
+                error = response.text
             raise Exception(f"Не удалось обновить IAM-токен: {error}")
 
         data = response.json()
         iam_token = data["iamToken"]
         expires_at = data["expiresAt"]  # Например: "2025-04-05T12:34:56Z"
+        expires_at = datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
 
-        # Сохраняем в кэш
-        with open(cache_file, "w", encoding="utf-8") as f:
-            json.dump({"iam_token": iam_token, "expires_at": expires_at}, f)
-
-        print("✅ Новый IAM-токен сохранён в кэш")
-
-        folder_id = os.getenv("YANDEX_FOLDER_ID")
-        if not folder_id:
-            raise ValueError("YANDEX_FOLDER_ID не найден в .env")
-
-        return iam_token, folder_id
+        print("✅ Новый IAM-токен получен")
+        return iam_token, expires_at.timestamp()
         
     @staticmethod
     def ensure_env_file():
@@ -109,3 +244,12 @@ class Config:
                     "YANDEX_FOLDER_ID=ваш_folder_id\n"
                 )
             print("✅ Создан файл .env (заполните API-ключи)")
+
+
+# IAM-токен Yandex: один на процесс, обновление под блокировкой
+_yandex_iam_tokens = TokenCache(
+    Config._fetch_yandex_iam_token,
+    cache_file=".yandex_iam_cache.json",
+    token_field="iam_token",
+    name="IAM-токен Yandex",
+)
@@ -1,12 +1,27 @@
 # db.py
 import sqlite3
 import os
+import queue
+import re
+import threading
+import time
+import weakref
 from datetime import datetime
 from typing import List, Tuple, Optional
 
 # Путь к базе данных
 DB_PATH = "chatlist.db"
 
+# Настройки соединения: WAL позволяет читать во время записи из другого потока
+BUSY_TIMEOUT_MS = 5000                # сколько ждать блокировку записи, прежде чем "database is locked"
+CACHE_SIZE_KIB = 16 * 1024            # страничный кэш на соединение
+MMAP_SIZE_BYTES = 256 * 1024 * 1024   # отображение файла БД в память
+
+# Постраничная загрузка истории: строк за один запрос и длина превью текста
+PAGE_SIZE = 200
+RESPONSE_PREVIEW_CHARS = 2000
+PROMPT_PREVIEW_CHARS = 300
+
 # SQL-запросы создания таблиц
 CREATE_PROMPTS_TABLE = """
 CREATE TABLE IF NOT EXISTS prompts (
@@ -50,6 +65,152 @@ CREATE TABLE IF NOT EXISTS settings (
 );
 """
 
+CREATE_RESPONSE_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS response_cache (
+    cache_key TEXT PRIMARY KEY,
+    model_id INTEGER,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Замеры запросов к моделям (см. metrics.py); время — в миллисекундах
+CREATE_REQUEST_METRICS_TABLE = """
+CREATE TABLE IF NOT EXISTS request_metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    model_id INTEGER,
+    provider TEXT,
+    stream INTEGER NOT NULL DEFAULT 0,
+    status INTEGER,
+    ok INTEGER NOT NULL,
+    attempts INTEGER NOT NULL,
+    queue_ms REAL,
+    dns_ms REAL,
+    connect_ms REAL,
+    ttfb_ms REAL,
+    total_ms REAL NOT NULL,
+    request_bytes INTEGER,
+    response_bytes INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    total_tokens INTEGER
+);
+"""
+
+# Цены моделей, ₽ за 1M токенов (см. budget.py); нет строки — модель считается бесплатной
+CREATE_MODEL_PRICES_TABLE = """
+CREATE TABLE IF NOT EXISTS model_prices (
+    model_id INTEGER PRIMARY KEY,
+    input_price REAL,
+    output_price REAL,
+    updated_at REAL NOT NULL,
+    FOREIGN KEY (model_id) REFERENCES models (id)
+);
+"""
+
+# Сколько дней хранить замеры запросов
+METRICS_RETENTION_DAYS = 30
+
+# Колонки request_metrics, по которым можно считать перцентили
+METRICS_LATENCY_COLUMNS = ("total_ms", "ttfb_ms", "queue_ms", "connect_ms")
+
+# Полнотекстовый поиск (FTS5) по промтам, тегам и ответам.
+# Индексы ссылаются на исходные таблицы (external content) и синхронизируются триггерами.
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+
+CREATE_FTS_TABLES = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(
+        prompt, tags, content='prompts', content_rowid='id', tokenize='{FTS_TOKENIZER}'
+    );
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5(
+        response, content='results', content_rowid='id', tokenize='{FTS_TOKENIZER}'
+    );
+    """,
+]
+
+CREATE_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS prompts_fts_ai AFTER INSERT ON prompts BEGIN
+        INSERT INTO prompts_fts(rowid, prompt, tags) VALUES (new.id, new.prompt, new.tags);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS prompts_fts_ad AFTER DELETE ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, prompt, tags) VALUES ('delete', old.id, old.prompt, old.tags);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS prompts_fts_au AFTER UPDATE ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, prompt, tags) VALUES ('delete', old.id, old.prompt, old.tags);
+        INSERT INTO prompts_fts(rowid, prompt, tags) VALUES (new.id, new.prompt, new.tags);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS results_fts_ai AFTER INSERT ON results BEGIN
+        INSERT INTO results_fts(rowid, response) VALUES (new.id, new.response);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS results_fts_ad AFTER DELETE ON results BEGIN
+        INSERT INTO results_fts(results_fts, rowid, response) VALUES ('delete', old.id, old.response);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS results_fts_au AFTER UPDATE ON results BEGIN
+        INSERT INTO results_fts(results_fts, rowid, response) VALUES ('delete', old.id, old.response);
+        INSERT INTO results_fts(rowid, response) VALUES (new.id, new.response);
+    END;
+    """,
+]
+
+def _add_column(table: str, column: str, definition: str):
+    """Шаг миграции: ALTER TABLE ADD COLUMN, если такой колонки ещё нет"""
+    def step(cursor):
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+# Миграции схемы: (версия, описание, шаги). Шаг — SQL-строка или функция f(cursor).
+# Номер последней применённой миграции хранится в PRAGMA user_version,
+# поэтому каждая миграция выполняется на файле chatlist.db ровно один раз.
+# Новые изменения схемы добавляются только в конец списка.
+MIGRATIONS = [
+    (1, "Индексы для выборок результатов и истории промтов", [
+        "CREATE INDEX IF NOT EXISTS idx_results_prompt_id ON results(prompt_id)",
+        "CREATE INDEX IF NOT EXISTS idx_results_model_id ON results(model_id)",
+        "CREATE INDEX IF NOT EXISTS idx_results_saved_at ON results(saved_at)",
+        "CREATE INDEX IF NOT EXISTS idx_prompts_created_at ON prompts(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_response_cache_last_used_at ON response_cache(last_used_at)",
+    ]),
+    (2, "Лимиты запросов к провайдеру для каждой модели", [
+        _add_column("models", "rate_limit_rps", "REAL"),
+        _add_column("models", "max_concurrency", "INTEGER"),
+    ]),
+    (3, "Замеры запросов к моделям", [
+        CREATE_REQUEST_METRICS_TABLE,
+        "CREATE INDEX IF NOT EXISTS idx_request_metrics_started_at ON request_metrics(started_at)",
+        "CREATE INDEX IF NOT EXISTS idx_request_metrics_model_started ON request_metrics(model_id, started_at)",
+    ]),
+    (4, "Токены и стоимость ответов, цены моделей", [
+        CREATE_MODEL_PRICES_TABLE,
+        _add_column("request_metrics", "cost", "REAL"),
+        _add_column("results", "prompt_tokens", "INTEGER"),
+        _add_column("results", "completion_tokens", "INTEGER"),
+        _add_column("results", "cost", "REAL"),
+    ]),
+    (5, "Отменённые запросы в замерах", [
+        _add_column("request_metrics", "cancelled", "INTEGER NOT NULL DEFAULT 0"),
+    ]),
+]
+
 # Начальные данные для моделей
 INITIAL_MODELS = [
     ("1", "DeepSeek", "https://api.polza.ai/v1/chat/completions", "POLZA_API_KEY", 1, "Polza", "deepseek-v3.2"),
@@ -59,12 +220,67 @@ INITIAL_MODELS = [
     ("5", "Grok", "https://api.polza.ai/v1/chat/completions", "POLZA_API_KEY", 1, "Polza", "grok-3-beta")
 ]
 
+class _Connection(sqlite3.Connection):
+    """sqlite3.Connection, на который можно держать слабую ссылку"""
+    pass
+
+
 class Database:
+    """
+    Доступ к SQLite.
+
+    Каждый поток получает своё соединение (self.conn — thread-local), БД работает
+    в режиме WAL: чтение в GUI не ждёт записи результатов из рабочих потоков,
+    а конкурирующие записи ждут друг друга до BUSY_TIMEOUT_MS.
+    """
+
     def __init__(self, db_path=DB_PATH):
         self.db_path = db_path
-        self.conn = None
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()  # все открытые соединения — для close()
+        self._connections_lock = threading.Lock()
+        self.fts_enabled = False  # True, если SQLite собран с FTS5
         self.init_db()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Соединение текущего потока (создаётся при первом обращении)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открывает соединение и настраивает прагмы производительности"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,  # только чтобы close() мог закрыть чужие соединения
+            factory=_Connection,
+        )
+        conn.row_factory = sqlite3.Row  # чтобы можно было обращаться по имени
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous = NORMAL")  # в WAL безопасно и без fsync на каждый commit
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_BYTES}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        with self._connections_lock:
+            self._connections.add(conn)
+        return conn
+
+    def close(self):
+        """Закрывает все соединения (при выходе из приложения)"""
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                print(f"[DB] Ошибка закрытия соединения: {e}")
+        self._local = threading.local()
+
     @staticmethod
     def _dict_factory(cursor, row):
         """Превращает sqlite3.Row в словарь"""
@@ -73,14 +289,19 @@ class Database:
     def init_db(self):
         """Инициализирует БД: создаёт таблицы и добавляет начальные данные"""
         try:
-            # Создаём соединение
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row  # чтобы можно было обращаться по имени
-            print(f"[DB] Подключено к {self.db_path}")
+            # Режим WAL сохраняется в файле БД — включаем один раз при старте
+            journal_mode = self.conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            print(f"[DB] Подключено к {self.db_path} (journal_mode={journal_mode})")
 
             # Создаём все таблицы
             self._create_tables()
 
+            # Индексы и изменения схемы для существующих БД
+            self._apply_migrations()
+
+            # Индексы полнотекстового поиска
+            self._create_fts()
+
             # Добавляем стандартные модели, если таблица пуста
             self.init_default_models()
 
@@ -96,12 +317,69 @@ class Database:
             cursor.execute(CREATE_MODELS_TABLE)
             cursor.execute(CREATE_RESULTS_TABLE)
             cursor.execute(CREATE_SETTINGS_TABLE)
+            cursor.execute(CREATE_RESPONSE_CACHE_TABLE)
             self.conn.commit() 
             print("[DB] Таблицы проверены/созданы")
         except Exception as e:
             print(f"[DB] Ошибка создания таблиц: {e}")
             raise
 
+    def get_schema_version(self) -> int:
+        """Номер последней применённой миграции"""
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def _apply_migrations(self):
+        """Применяет миграции из MIGRATIONS, которых ещё нет в этой БД"""
+        current = self.get_schema_version()
+        pending = [m for m in MIGRATIONS if m[0] > current]
+        if not pending:
+            return
+
+        for version, description, steps in pending:
+            cursor = self.conn.cursor()
+            try:
+                # Каждая миграция — отдельная транзакция вместе с user_version:
+                # при ошибке БД остаётся на предыдущей версии
+                cursor.execute("BEGIN")
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(f"PRAGMA user_version = {int(version)}")
+                self.conn.commit()
+                print(f"[DB] Миграция {version}: {description}")
+            except Exception as e:
+                self.conn.rollback()
+                print(f"[DB] Ошибка миграции {version} ({description}): {e}")
+                raise
+
+    def _create_fts(self):
+        """Создаёт FTS5-индексы и триггеры; при первом создании индексирует существующие данные"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('prompts_fts', 'results_fts')"
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+
+            for sql in CREATE_FTS_TABLES + CREATE_FTS_TRIGGERS:
+                cursor.execute(sql)
+
+            # Индексы только что созданы — заполняем их из таблиц
+            if "prompts_fts" not in existing:
+                cursor.execute("INSERT INTO prompts_fts(prompts_fts) VALUES ('rebuild')")
+            if "results_fts" not in existing:
+                cursor.execute("INSERT INTO results_fts(results_fts) VALUES ('rebuild')")
+
+            self.conn.commit()
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            # SQLite без FTS5 — поиск будет работать через LIKE
+            self.conn.rollback()
+            self.fts_enabled = False
+            print(f"[DB] FTS5 недоступен, полнотекстовый поиск отключён: {e}")
+
     def init_default_models(self):
         """Добавляет стандартные модели, если таблица пуста"""
         try:
@@ -128,8 +406,10 @@ class Database:
         try:
             cursor = self.conn.cursor()
             cursor.execute("""
-                SELECT id, name, api_url, api_key_var, is_active, provider, model_name
-                FROM models WHERE id = ?
+                SELECT m.id, m.name, m.api_url, m.api_key_var, m.is_active, m.provider, m.model_name,
+                       m.rate_limit_rps, m.max_concurrency, p.input_price, p.output_price
+                FROM models m LEFT JOIN model_prices p ON p.model_id = m.id
+                WHERE m.id = ?
             """, (model_id,))
             row = cursor.fetchone()
             if row:
@@ -140,7 +420,11 @@ class Database:
                     "api_key_var": row[3],
                     "is_active": row[4],
                     "provider": row[5],
-                    "model_name": row[6]
+                    "model_name": row[6],
+                    "rate_limit_rps": row[7],
+                    "max_concurrency": row[8],
+                    "input_price": row[9],
+                    "output_price": row[10]
                 }
             return None
         except Exception as e:
@@ -173,6 +457,40 @@ class Database:
             print(f"[DB] Ошибка загрузки промтов: {e}")
             return []
 
+    def get_prompt(self, prompt_id: int) -> Optional[dict]:
+        """Один промт по ID"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id, created_at, prompt, tags FROM prompts WHERE id = ?", (prompt_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            print(f"[DB] Ошибка загрузки промта: {e}")
+            return None
+
+    def get_prompts_page(self, after: Optional[Tuple[str, int]] = None,
+                         limit: int = PAGE_SIZE) -> List[dict]:
+        """
+        Страница промтов, от новых к старым.
+
+        :param after: (created_at, id) последней строки предыдущей страницы;
+                      None — первая страница
+        """
+        query = "SELECT id, created_at, prompt, tags FROM prompts"
+        params = []
+        if after is not None:
+            query += " WHERE (created_at, id) < (?, ?)"
+            params.extend(after)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"[DB] Ошибка загрузки промтов: {e}")
+            return []
+
     def search_prompts(self, query: str) -> List[Tuple]:
         """Поиск промтов по тексту или тегам"""
         try:
@@ -186,6 +504,71 @@ class Database:
             print(f"[DB] Ошибка поиска промтов: {e}")
             return []
         
+    @staticmethod
+    def _build_fts_query(text: str) -> str:
+        """
+        Превращает пользовательский ввод в запрос FTS5:
+        каждое слово — префиксный поиск, все слова обязательны.
+        """
+        words = re.findall(r"\w+", text, flags=re.UNICODE)
+        return " ".join(f'"{word}"*' for word in words)
+
+    def full_text_search(self, query: str, limit: int = 200,
+                         highlight: Tuple[str, str] = ("<b>", "</b>")) -> List[dict]:
+        """
+        Полнотекстовый поиск по промтам, тегам и ответам моделей.
+
+        Слова ищутся по префиксу ("нейро" найдёт "нейросеть").
+        Результаты упорядочены по релевантности (bm25); промт, у которого совпал
+        только ответ, тоже попадает в выдачу.
+
+        :return: список словарей id, created_at, prompt, tags, snippet, rank, matched_in
+        """
+        fts_query = self._build_fts_query(query)
+        if not fts_query:
+            return []
+
+        if not self.fts_enabled:
+            return [
+                dict(row, snippet="", rank=0.0, matched_in="prompt")
+                for row in self.search_prompts(query)[:limit]
+            ]
+
+        start, end = highlight
+        sql = """
+            WITH hits AS (
+                SELECT rowid AS prompt_id,
+                       bm25(prompts_fts, 10.0, 5.0) AS rank,
+                       snippet(prompts_fts, -1, :start, :end, '…', 12) AS snippet,
+                       'prompt' AS matched_in
+                FROM prompts_fts
+                WHERE prompts_fts MATCH :query
+                UNION ALL
+                SELECT r.prompt_id,
+                       bm25(results_fts) AS rank,
+                       snippet(results_fts, 0, :start, :end, '…', 12) AS snippet,
+                       'response' AS matched_in
+                FROM results_fts
+                JOIN results r ON r.id = results_fts.rowid
+                WHERE results_fts MATCH :query
+            )
+            SELECT p.id, p.created_at, p.prompt, p.tags,
+                   MIN(h.rank) AS rank, h.snippet, h.matched_in
+            FROM hits h
+            JOIN prompts p ON p.id = h.prompt_id
+            GROUP BY p.id
+            ORDER BY rank
+            LIMIT :limit
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(sql, {"query": fts_query, "start": start, "end": end, "limit": limit})
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            if str(e) != "interrupted":  # Поиск отменён более новым запросом (SearchWorker)
+                print(f"[DB] Ошибка полнотекстового поиска: {e}")
+            return []
+
     def delete_prompt(self, prompt_id: int):
         """Удаляет промт и все связанные результаты"""
         try:
@@ -218,6 +601,121 @@ class Database:
             print(f"[DB] Ошибка при загрузке результатов: {e}")
             return []
 
+    def get_saved_results_page(self, after: Optional[Tuple[str, int]] = None,
+                               limit: int = PAGE_SIZE) -> List[dict]:
+        """
+        Страница сохранённых результатов, от новых к старым (keyset-пагинация).
+
+        Возвращает только сводку: промт и ответ обрезаны до PROMPT_PREVIEW_CHARS
+        и RESPONSE_PREVIEW_CHARS, truncated = ответ длиннее превью.
+        Полный текст — get_result_response(id).
+
+        :param after: (saved_at, id) последней строки предыдущей страницы;
+                      None — первая страница
+        :return: список словарей id, prompt_id, model_id, model_name, saved_at,
+                 prompt, response, truncated
+        """
+        query = """
+            SELECT
+                r.id,
+                r.prompt_id,
+                r.model_id,
+                m.name AS model_name,
+                r.saved_at,
+                substr(p.prompt, 1, ?) AS prompt,
+                substr(r.response, 1, ?) AS response
+            FROM results r
+            JOIN prompts p ON r.prompt_id = p.id
+            JOIN models m ON r.model_id = m.id
+        """
+        # На символ больше превью — чтобы узнать, обрезан ли ответ, не считая length()
+        params = [PROMPT_PREVIEW_CHARS, RESPONSE_PREVIEW_CHARS + 1]
+        if after is not None:
+            query += " WHERE (r.saved_at, r.id) < (?, ?)"
+            params.extend(after)
+        query += " ORDER BY r.saved_at DESC, r.id DESC LIMIT ?"
+        params.append(limit)
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(query, params)
+            rows = []
+            for row in cursor.fetchall():
+                row = dict(row)
+                row["truncated"] = len(row["response"]) > RESPONSE_PREVIEW_CHARS
+                row["response"] = row["response"][:RESPONSE_PREVIEW_CHARS]
+                rows.append(row)
+            return rows
+        except Exception as e:
+            print(f"[DB] Ошибка при загрузке результатов: {e}")
+            return []
+
+    def get_saved_result(self, result_id: int) -> Optional[dict]:
+        """Один сохранённый результат целиком: id, saved_at, prompt, model_name, response"""
+        query = """
+            SELECT r.id, r.saved_at, p.prompt, m.name AS model_name, r.response
+            FROM results r
+            JOIN prompts p ON r.prompt_id = p.id
+            JOIN models m ON r.model_id = m.id
+            WHERE r.id = ?
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(query, (result_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            print(f"[DB] Ошибка загрузки результата: {e}")
+            return None
+
+    def count_saved_results(self) -> int:
+        """Сколько всего сохранённых результатов"""
+        try:
+            return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        except Exception as e:
+            print(f"[DB] Ошибка подсчёта результатов: {e}")
+            return 0
+
+    def iter_saved_results(self, batch_size: int = PAGE_SIZE, group_by_prompt: bool = False):
+        """
+        Все сохранённые результаты (от новых к старым) по одному, без загрузки
+        всей истории в память: строки читаются курсором пачками по batch_size.
+
+        Вызывать в том потоке, где результат будет перебираться (соединение — своё у потока).
+        :param group_by_prompt: ответы на один промт идут подряд (от новых промтов к старым) —
+                                для форматов с разделом на промт (HTML, Markdown)
+        :return: генератор словарей id, saved_at, prompt, model_name, response
+        """
+        order = "p.id DESC, r.saved_at DESC, r.id DESC" if group_by_prompt else "r.saved_at DESC, r.id DESC"
+        query = f"""
+            SELECT r.id, r.saved_at, p.prompt, m.name AS model_name, r.response
+            FROM results r
+            JOIN prompts p ON r.prompt_id = p.id
+            JOIN models m ON r.model_id = m.id
+            ORDER BY {order}
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+
+    def get_result_response(self, result_id: int) -> Optional[str]:
+        """Полный текст одного сохранённого ответа"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT response FROM results WHERE id = ?", (result_id,))
+            row = cursor.fetchone()
+            return row["response"] if row else None
+        except Exception as e:
+            print(f"[DB] Ошибка загрузки ответа: {e}")
+            return None
+
     def get_saved_results_with_models(self):
         """Возвращает список сохранённых результатов с промтами и моделями"""
         query = """
@@ -246,9 +744,11 @@ class Database:
         SELECT 
             r.response,
             m.name as model_name,
-            r.saved_at
+            r.saved_at,
+            p.prompt
         FROM results r
         JOIN models m ON r.model_id = m.id
+        JOIN prompts p ON r.prompt_id = p.id
         WHERE r.id = ?
         ORDER BY m.name
         """
@@ -275,7 +775,11 @@ class Database:
     def get_all_models(self):
         try:
             cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM models ORDER BY name")
+            cursor.execute("""
+                SELECT m.*, p.input_price, p.output_price
+                FROM models m LEFT JOIN model_prices p ON p.model_id = m.id
+                ORDER BY m.name
+            """)
             rows = cursor.fetchall()
             models = []
             for row in rows:
@@ -286,7 +790,11 @@ class Database:
                     "api_key_var": row["api_key_var"],
                     "is_active": row["is_active"],  # ← Должно быть 0 или 1
                     "provider": row["provider"],
-                    "model_name": row["model_name"]
+                    "model_name": row["model_name"],
+                    "rate_limit_rps": row["rate_limit_rps"],
+                    "max_concurrency": row["max_concurrency"],
+                    "input_price": row["input_price"],
+                    "output_price": row["output_price"]
                 })
             return models
         except Exception as e:
@@ -317,7 +825,9 @@ class Database:
                             api_key_var = ?,
                             is_active = ?, 
                             provider = ?, 
-                            model_name = ?
+                            model_name = ?,
+                            rate_limit_rps = ?,
+                            max_concurrency = ?
                         WHERE id = ?
                     """, (
                         model["name"],
@@ -326,22 +836,30 @@ class Database:
                         int(model["is_active"]),
                         model["provider"],
                         model["model_name"],
+                        model.get("rate_limit_rps"),
+                        model.get("max_concurrency"),
                         model["id"]  # ← id в конце
                     ))
+                    model_id = model["id"]
                 else:
                     # ✅ Новая модель — правильный порядок
                     cursor.execute("""
-                        INSERT INTO models (name, api_url, api_key_var, is_active, provider, model_name)
-                        VALUES (?, ?, ?, ?, ?, ?)
+                        INSERT INTO models (name, api_url, api_key_var, is_active, provider, model_name,
+                                            rate_limit_rps, max_concurrency)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                     """, (
                         model["name"],
                         model["api_url"],
                         model["api_key_var"],
                         int(model["is_active"]),
                         model["provider"],
-                        model["model_name"]
+                        model["model_name"],
+                        model.get("rate_limit_rps"),
+                        model.get("max_concurrency")
                         # id не указываем — AUTOINCREMENT
                     ))
+                    model_id = cursor.lastrowid
+                self._save_model_price(cursor, model_id, model.get("input_price"), model.get("output_price"))
             self.conn.commit()
             print(f"[DB] Обновлено/добавлено {len(models)} моделей")
             return True
@@ -350,11 +868,32 @@ class Database:
             self.conn.rollback()
             raise
 
+    @staticmethod
+    def _save_model_price(cursor, model_id: int, input_price: Optional[float], output_price: Optional[float]):
+        """Цена модели: обе цены пустые — строка удаляется (модель без учёта расходов)"""
+        if input_price is None and output_price is None:
+            cursor.execute("DELETE FROM model_prices WHERE model_id = ?", (model_id,))
+            return
+        cursor.execute("""
+            INSERT OR REPLACE INTO model_prices (model_id, input_price, output_price, updated_at)
+            VALUES (?, ?, ?, ?)
+        """, (model_id, input_price, output_price, time.time()))
+
+    def get_model_prices(self) -> dict:
+        """Цены всех моделей: {model_id: (цена ввода, цена вывода)}, ₽ за 1M токенов"""
+        try:
+            rows = self.conn.execute("SELECT model_id, input_price, output_price FROM model_prices")
+            return {row["model_id"]: (row["input_price"], row["output_price"]) for row in rows}
+        except Exception as e:
+            print(f"[DB] Ошибка загрузки цен моделей: {e}")
+            return {}
+
     def delete_model(self, model_id: int):
         """Удаляет модель и все связанные результаты"""
         try:
             cursor = self.conn.cursor()
             cursor.execute("DELETE FROM results WHERE model_id = ?", (model_id,))
+            cursor.execute("DELETE FROM model_prices WHERE model_id = ?", (model_id,))
             cursor.execute("DELETE FROM models WHERE id = ?", (model_id,))
             self.conn.commit()  # ✅ Обязательно!
             print(f"[DB] Модель с ID {model_id} удалена")
@@ -376,6 +915,43 @@ class Database:
         except Exception as e:
             print(f"[DB] Ошибка сохранения результата: {e}")
 
+    def save_results(self, rows: List[tuple]) -> List[int]:
+        """
+        Сохраняет несколько результатов одной транзакцией (один commit на всю пачку).
+
+        :param rows: список (prompt_id, model_id, response) или
+                     (prompt_id, model_id, response, usage), где usage —
+                     {prompt_tokens, completion_tokens, cost} из info запроса
+        :return: id вставленных строк в том же порядке
+        """
+        if not rows:
+            return []
+        saved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = self.conn
+        try:
+            cursor = conn.cursor()
+            # IMMEDIATE сразу берёт блокировку записи: никто не вклинится между
+            # нашими INSERT, и id получатся подряд
+            cursor.execute("BEGIN IMMEDIATE")
+            values = []
+            for row in rows:
+                prompt_id, model_id, response = row[:3]
+                usage = (row[3] if len(row) > 3 else None) or {}
+                values.append((prompt_id, model_id, response, saved_at, usage.get("prompt_tokens"),
+                               usage.get("completion_tokens"), usage.get("cost")))
+            cursor.executemany("""
+                INSERT INTO results (prompt_id, model_id, response, saved_at,
+                                     prompt_tokens, completion_tokens, cost)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, values)
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            conn.commit()
+            return list(range(last_id - len(rows) + 1, last_id + 1))
+        except Exception as e:
+            conn.rollback()
+            print(f"[DB] Ошибка пакетного сохранения результатов: {e}")
+            raise
+
     def get_results_by_prompt(self, prompt_id: int) -> List[Tuple]:
         """Получает все сохранённые результаты для промта"""
         try:
@@ -416,3 +992,335 @@ class Database:
             self.conn.commit()
         except Exception as e:
             print(f"[DB] Ошибка сохранения настройки: {e}")
+
+    # === Методы для response_cache ===
+    def get_cached_response(self, cache_key: str, min_created_at: float) -> Optional[dict]:
+        """Возвращает {response, created_at} из кэша, если запись не старше min_created_at, и отмечает использование"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT response, created_at FROM response_cache WHERE cache_key = ? AND created_at >= ?",
+                (cache_key, min_created_at)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            cursor.execute(
+                "UPDATE response_cache SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?",
+                (time.time(), cache_key)
+            )
+            self.conn.commit()
+            return dict(row)
+        except Exception as e:
+            print(f"[DB] Ошибка чтения кэша ответов: {e}")
+            return None
+
+    def save_cached_responses(self, rows: List[tuple]):
+        """
+        Сохраняет ответы в кэш одной транзакцией (перезаписывает существующие).
+
+        :param rows: [(cache_key, model_id, response, created_at)]
+        """
+        try:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO response_cache (cache_key, model_id, response, created_at, last_used_at, hits)
+                VALUES (?, ?, ?, ?, ?, 0)
+            """, [(cache_key, model_id, response, created_at, created_at)
+                  for cache_key, model_id, response, created_at in rows])
+            self.conn.commit()
+        except Exception as e:
+            print(f"[DB] Ошибка сохранения в кэш ответов: {e}")
+
+    def touch_cached_responses(self, touched: List[tuple]):
+        """
+        Отмечает использование записей кэша одной транзакцией.
+
+        :param touched: [(cache_key, last_used_at, сколько попаданий)]
+        """
+        try:
+            self.conn.executemany(
+                "UPDATE response_cache SET last_used_at = MAX(last_used_at, ?), hits = hits + ? "
+                "WHERE cache_key = ?",
+                [(last_used_at, count, cache_key) for cache_key, last_used_at, count in touched]
+            )
+            self.conn.commit()
+        except Exception as e:
+            print(f"[DB] Ошибка обновления кэша ответов: {e}")
+
+    def count_cached_responses(self) -> int:
+        try:
+            return self.conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        except Exception as e:
+            print(f"[DB] Ошибка чтения кэша ответов: {e}")
+            return 0
+
+    def evict_response_cache(self, min_created_at: float, max_entries: int) -> int:
+        """Удаляет устаревшие записи и самые давно использованные сверх max_entries"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM response_cache WHERE created_at < ?", (min_created_at,))
+            removed = cursor.rowcount
+            cursor.execute("""
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache
+                    ORDER BY last_used_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (max_entries,))
+            removed += cursor.rowcount
+            self.conn.commit()
+            return removed
+        except Exception as e:
+            print(f"[DB] Ошибка очистки кэша ответов: {e}")
+            return 0
+
+    def clear_response_cache(self):
+        """Полностью очищает кэш ответов"""
+        try:
+            self.conn.execute("DELETE FROM response_cache")
+            self.conn.commit()
+        except Exception as e:
+            print(f"[DB] Ошибка очистки кэша ответов: {e}")
+
+    # === Методы для request_metrics ===
+    def save_request_metrics(self, rows: List[dict]) -> List[int]:
+        """
+        Сохраняет замеры запросов одной транзакцией (flush_func для WriteBehindQueue).
+
+        :param rows: словари RequestMetrics.to_row()
+        """
+        if not rows:
+            return []
+        conn = self.conn
+        try:
+            conn.executemany("""
+                INSERT INTO request_metrics (
+                    started_at, model_id, provider, stream, status, ok, attempts,
+                    queue_ms, dns_ms, connect_ms, ttfb_ms, total_ms,
+                    request_bytes, response_bytes, prompt_tokens, completion_tokens, total_tokens, cost,
+                    cancelled
+                ) VALUES (
+                    :started_at, :model_id, :provider, :stream, :status, :ok, :attempts,
+                    :queue_ms, :dns_ms, :connect_ms, :ttfb_ms, :total_ms,
+                    :request_bytes, :response_bytes, :prompt_tokens, :completion_tokens, :total_tokens, :cost,
+                    :cancelled
+                )
+            """, rows)
+            conn.commit()
+            return [None] * len(rows)
+        except Exception as e:
+            conn.rollback()
+            print(f"[DB] Ошибка сохранения замеров запросов: {e}")
+            raise
+
+    def get_request_stats(self, since: Optional[float] = None, until: Optional[float] = None,
+                          model_id: Optional[int] = None, metric: str = "total_ms") -> List[dict]:
+        """
+        Сводка по моделям за окно времени: сколько запросов, доля ошибок и перцентили задержки.
+
+        :param since, until: границы окна (секунды Unix, started_at); None — без границы
+        :param model_id: только эта модель
+        :param metric: колонка задержки из METRICS_LATENCY_COLUMNS
+        :return: [{model_id, model_name, provider, requests, errors, error_rate, cancelled, retries,
+                   p50, p95, p99, avg_ttfb, prompt_tokens, completion_tokens, cost}],
+                 самые медленные (по p95) — первыми; перцентили считаются по успешным запросам,
+                 отменённые запросы ошибками не считаются
+        """
+        if metric not in METRICS_LATENCY_COLUMNS:
+            raise ValueError(f"Неизвестная метрика: {metric}")
+        conditions, params = [], {}
+        if since is not None:
+            conditions.append("started_at >= :since")
+            params["since"] = since
+        if until is not None:
+            conditions.append("started_at < :until")
+            params["until"] = until
+        if model_id is not None:
+            conditions.append("model_id = :model_id")
+            params["model_id"] = model_id
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # Перцентиль "по ближайшему рангу": наименьшее значение, ранг которого >= p * n
+        query = f"""
+            WITH selected AS (
+                SELECT * FROM request_metrics {where}
+            ),
+            ranked AS (
+                SELECT model_id, {metric} AS value,
+                       ROW_NUMBER() OVER (PARTITION BY model_id ORDER BY {metric}) AS rank,
+                       COUNT(*) OVER (PARTITION BY model_id) AS n
+                FROM selected
+                WHERE ok = 1 AND {metric} IS NOT NULL
+            ),
+            percentiles AS (
+                SELECT model_id,
+                       MIN(CASE WHEN rank >= 0.50 * n THEN value END) AS p50,
+                       MIN(CASE WHEN rank >= 0.95 * n THEN value END) AS p95,
+                       MIN(CASE WHEN rank >= 0.99 * n THEN value END) AS p99
+                FROM ranked
+                GROUP BY model_id
+            ),
+            totals AS (
+                SELECT model_id, MAX(provider) AS provider,
+                       COUNT(*) AS requests,
+                       SUM(ok = 0 AND cancelled = 0) AS errors,
+                       SUM(cancelled) AS cancelled,
+                       SUM(attempts - 1) AS retries,
+                       AVG(ttfb_ms) AS avg_ttfb,
+                       SUM(prompt_tokens) AS prompt_tokens,
+                       SUM(completion_tokens) AS completion_tokens,
+                       SUM(cost) AS cost
+                FROM selected
+                GROUP BY model_id
+            )
+            SELECT t.model_id, m.name AS model_name, t.provider, t.requests, t.errors,
+                   1.0 * t.errors / t.requests AS error_rate, t.cancelled, t.retries,
+                   p.p50, p.p95, p.p99, t.avg_ttfb, t.prompt_tokens, t.completion_tokens, t.cost
+            FROM totals t
+            LEFT JOIN percentiles p ON p.model_id IS t.model_id
+            LEFT JOIN models m ON m.id = t.model_id
+            ORDER BY p.p95 IS NULL, p.p95 DESC
+        """
+        try:
+            return [dict(row) for row in self.conn.execute(query, params)]
+        except Exception as e:
+            print(f"[DB] Ошибка чтения статистики запросов: {e}")
+            return []
+
+    def get_costs(self, since: Optional[float] = None, group_by: str = "day") -> List[dict]:
+        """
+        Расходы на запросы из request_metrics.
+
+        :param since: начиная с (секунды Unix); None — за всё время хранения
+        :param group_by: "day" — по дням (новые первыми), "model" — по моделям (дорогие первыми)
+        :return: [{day или model_id/model_name, requests, prompt_tokens, completion_tokens, cost}]
+        """
+        if group_by == "day":
+            key = "date(r.started_at, 'unixepoch', 'localtime') AS day"
+            group, order = "day", "day DESC"
+        elif group_by == "model":
+            key = "r.model_id, m.name AS model_name"
+            group, order = "r.model_id", "cost DESC"
+        else:
+            raise ValueError(f"Неизвестная группировка: {group_by}")
+        try:
+            rows = self.conn.execute(f"""
+                SELECT {key}, COUNT(*) AS requests,
+                       SUM(r.prompt_tokens) AS prompt_tokens,
+                       SUM(r.completion_tokens) AS completion_tokens,
+                       COALESCE(SUM(r.cost), 0) AS cost
+                FROM request_metrics r LEFT JOIN models m ON m.id = r.model_id
+                WHERE r.started_at >= ?
+                GROUP BY {group}
+                ORDER BY {order}
+            """, (since or 0,))
+            return [dict(row) for row in rows]
+        except Exception as e:
+            print(f"[DB] Ошибка подсчёта расходов: {e}")
+            return []
+
+    def get_spent_since(self, since: float) -> float:
+        """Сколько рублей потрачено на запросы начиная с since (для дневного бюджета)"""
+        try:
+            row = self.conn.execute(
+                "SELECT COALESCE(SUM(cost), 0) FROM request_metrics WHERE started_at >= ?", (since,)
+            ).fetchone()
+            return row[0]
+        except Exception as e:
+            print(f"[DB] Ошибка подсчёта расходов: {e}")
+            return 0.0
+
+    def purge_request_metrics(self, days: float = METRICS_RETENTION_DAYS) -> int:
+        """Удаляет замеры старше days дней"""
+        try:
+            cursor = self.conn.execute("DELETE FROM request_metrics WHERE started_at < ?",
+                                       (time.time() - days * 24 * 60 * 60,))
+            self.conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            print(f"[DB] Ошибка очистки замеров запросов: {e}")
+            return 0
+
+
+class WriteBehindQueue:
+    """
+    Отложенная пакетная запись в БД из фонового потока.
+
+    Потоки-отправители кладут строки через submit() и не ждут диска; фоновый поток
+    собирает всё, что накопилось за flush_interval (но не больше batch_size),
+    и передаёт пачку в flush_func одним вызовом — то есть одной транзакцией.
+
+    flush_func(rows) -> list: результат (например, id строк) раздаётся в callback'и.
+    """
+
+    def __init__(self, flush_func, batch_size: int = 100, flush_interval: float = 0.2,
+                 name: str = "db-writer"):
+        self.flush_func = flush_func
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, row, callback=None):
+        """Ставит строку в очередь; callback(результат) вызовется из фонового потока после записи"""
+        if self._closed:
+            raise RuntimeError("Очередь записи закрыта")
+        self._queue.put((row, callback))
+
+    def flush(self):
+        """Ждёт, пока всё поставленное в очередь будет записано"""
+        self._queue.join()
+
+    def close(self):
+        """Дописывает очередь и останавливает поток"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    next_item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if next_item is None:
+                    stop = True
+                    break
+                batch.append(next_item)
+
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _write(self, batch):
+        rows = [row for row, _ in batch]
+        try:
+            results = self.flush_func(rows) or [None] * len(rows)
+        except Exception as e:
+            print(f"[DB] Ошибка отложенной записи ({len(rows)} строк): {e}")
+            results = [None] * len(rows)
+        for (_, callback), result in zip(batch, results):
+            if callback is not None:
+                try:
+                    callback(result)
+                except Exception as e:
+                    print(f"[DB] Ошибка в обработчике записи: {e}")
@@ -0,0 +1,304 @@
+# exporter.py
+import csv
+import html
+import json
+import os
+from datetime import datetime
+
+from render import markdown_to_html
+
+try:
+    from version import __version__
+except ImportError:
+    __version__ = "dev"
+
+# Прогресс сообщается не чаще, чем раз в столько строк
+PROGRESS_EVERY = 200
+# Размер буфера записи в файл
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+# Поля строки экспорта (JSONL, CSV)
+EXPORT_FIELDS = ["saved_at", "prompt", "model_name", "response"]
+
+# Цвета HTML-экспорта для каждой темы
+HTML_COLORS = {
+    "dark": {"bg": "#2b2b2b", "text": "#ffffff", "block_bg": "#3c3c3c", "border": "#555", "accent": "#007acc"},
+    "light": {"bg": "#ffffff", "text": "#333333", "block_bg": "#f9f9f9", "border": "#ddd", "accent": "#0056b3"},
+}
+
+
+class ExportCancelled(Exception):
+    """Экспорт прерван пользователем"""
+    pass
+
+
+class HtmlWriter:
+    """
+    HTML-страница со встроенными стилями: раздел на промт, под ним ответы моделей цитатами.
+    Markdown ответов отрисовывается общим конвертером render.markdown_to_html — как в предпросмотре.
+    """
+
+    # Строки должны приходить сгруппированными по промту (см. groups_by_prompt)
+    GROUPS_BY_PROMPT = True
+
+    def __init__(self, f, theme: str = "light"):
+        self.f = f
+        self.colors = HTML_COLORS.get(theme, HTML_COLORS["light"])
+        self._prompt = None
+
+    def header(self):
+        bg = self.colors["bg"]
+        text = self.colors["text"]
+        block_bg = self.colors["block_bg"]
+        border = self.colors["border"]
+        accent = self.colors["accent"]
+        self.f.write(f'''<!DOCTYPE html>
+    <html lang="ru">
+    <head>
+        <meta charset="UTF-8">
+        <title>ChatList — Результаты</title>
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <style>
+            body {{
+                background-color: {bg};
+                color: {text};
+                font-family: Arial, sans-serif;
+                line-height: 1.6;
+                margin: 0;
+                padding: 20px;
+            }}
+            .container {{
+                max-width: 900px;
+                margin: 0 auto;
+                padding: 20px;
+            }}
+            h1 {{
+                color: {accent};
+                border-bottom: 2px solid {accent};
+                padding-bottom: 10px;
+            }}
+            h2 {{
+                color: {accent};
+                margin-top: 30px;
+            }}
+            h3 {{
+                color: {accent};
+                margin-top: 20px;
+            }}
+            .prompt {{
+                white-space: pre-wrap;
+            }}
+            .date {{
+                color: #777;
+                font-size: 0.9em;
+            }}
+            blockquote {{
+                background-color: {block_bg};
+                border-left: 4px solid {accent};
+                margin: 15px 0;
+                padding: 12px 15px;
+                border-radius: 0 4px 4px 0;
+                font-style: italic;
+            }}
+            pre {{
+                border: 1px solid {border};
+                border-radius: 6px;
+                padding: 10px;
+                overflow: auto;
+                font-style: normal;
+            }}
+            table {{
+                border-collapse: collapse;
+            }}
+            th, td {{
+                border: 1px solid {border};
+                padding: 6px;
+            }}
+            .footer {{
+                margin-top: 30px;
+                color: #777;
+                font-size: 0.9em;
+                text-align: center;
+            }}
+            .divider {{
+                border: 0;
+                border-top: 1px solid {border};
+                margin: 20px 0;
+            }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>ChatList — Результаты</h1>
+            <p><strong>Дата:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+            <p><strong>Версия:</strong> {__version__}</p>
+            <hr class="divider">
+    ''')
+
+    def row(self, row: dict):
+        prompt = row.get("prompt")
+        if prompt and prompt != self._prompt:
+            # Строки идут сгруппированными по промту — заголовок пишется при смене промта
+            self._prompt = prompt
+            date = f'<p class="date">{html.escape(str(row["saved_at"]))}</p>' if row.get("saved_at") else ""
+            self.f.write(f'''
+            <h2>Промт</h2>
+            {date}
+            <p class="prompt">{html.escape(prompt)}</p>
+    ''')
+        response_html = markdown_to_html(row["response"])
+        self.f.write(f'''
+            <h3>{html.escape(row["model_name"])}</h3>
+            <blockquote>
+                {response_html}
+            </blockquote>
+            <hr class="divider">
+    ''')
+
+    def footer(self):
+        self.f.write(f'''
+            <div class="footer">
+                Экспорт сгенерирован ChatList • <a href="https://github.com/fedorkrs33-web/ChatList" style="color: {self.colors["accent"]}; text-decoration: none;">GitHub</a>
+            </div>
+        </div>
+    </body>
+    </html>
+    ''')
+
+
+class MarkdownWriter:
+    """Markdown: раздел на промт, под ним заголовок на модель, ответ — цитатой"""
+
+    GROUPS_BY_PROMPT = True
+
+    def __init__(self, f, theme: str = "light"):
+        self.f = f
+        self._prompt = None
+
+    def header(self):
+        self.f.write("# Результаты ChatList\n\n")
+        self.f.write(f"**Дата:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        self.f.write("---\n\n")
+
+    def row(self, row: dict):
+        prompt = row.get("prompt")
+        if prompt and prompt != self._prompt:
+            self._prompt = prompt
+            date = f" ({row['saved_at']})" if row.get("saved_at") else ""
+            self.f.write(f"## Промт{date}\n\n")
+            self.f.write(prompt.strip() + "\n\n")
+        quoted = row["response"].replace("\n", "  \n> ")
+        self.f.write(f"### Модель: {row['model_name']}\n\n")
+        self.f.write(f"> {quoted}\n\n")
+        self.f.write("---\n\n")
+
+    def footer(self):
+        pass
+
+
+class JsonlWriter:
+    """JSON Lines: одна строка — один ответ"""
+
+    GROUPS_BY_PROMPT = False
+
+    def __init__(self, f, theme: str = "light"):
+        self.f = f
+
+    def header(self):
+        pass
+
+    def row(self, row: dict):
+        self.f.write(json.dumps({field: row.get(field) for field in EXPORT_FIELDS}, ensure_ascii=False))
+        self.f.write("\n")
+
+    def footer(self):
+        pass
+
+
+class CsvWriter:
+    """CSV с заголовком; открывается в Excel (UTF-8 с BOM)"""
+
+    GROUPS_BY_PROMPT = False
+
+    def __init__(self, f, theme: str = "light"):
+        self.f = f
+        self.writer = csv.writer(f)
+
+    def header(self):
+        self.f.write("\ufeff")
+        self.writer.writerow(EXPORT_FIELDS)
+
+    def row(self, row: dict):
+        self.writer.writerow([row.get(field) for field in EXPORT_FIELDS])
+
+    def footer(self):
+        pass
+
+
+# Формат экспорта → класс записи; формат определяется по расширению файла
+WRITERS = {
+    "html": HtmlWriter,
+    "md": MarkdownWriter,
+    "jsonl": JsonlWriter,
+    "csv": CsvWriter,
+}
+
+FILE_EXTENSIONS = {
+    ".html": "html",
+    ".htm": "html",
+    ".md": "md",
+    ".txt": "md",
+    ".jsonl": "jsonl",
+    ".csv": "csv",
+}
+
+
+def format_from_path(file_path: str) -> str:
+    """Формат экспорта по расширению файла (по умолчанию — Markdown)"""
+    return FILE_EXTENSIONS.get(os.path.splitext(file_path)[1].lower(), "md")
+
+
+def groups_by_prompt(file_path: str) -> bool:
+    """Нужны ли формату файла строки, сгруппированные по промту (заголовок раздела — при смене промта)"""
+    return WRITERS[format_from_path(file_path)].GROUPS_BY_PROMPT
+
+
+def export_rows(rows, file_path: str, fmt: str = None, theme: str = "light",
+                progress=None, is_cancelled=None) -> int:
+    """
+    Пишет строки в файл по мере их поступления — в памяти одна строка, а не весь документ.
+
+    :param rows: итерируемое словарей model_name, response (+ saved_at, prompt);
+                 например, Database.iter_saved_results(). Для HTML и Markdown ответы
+                 на один промт должны идти подряд (см. groups_by_prompt)
+    :param fmt: html, md, jsonl или csv; None — по расширению file_path
+    :param progress: progress(сколько записано) — вызывается каждые PROGRESS_EVERY строк
+    :param is_cancelled: is_cancelled() -> True прерывает экспорт (ExportCancelled),
+                         недописанный файл удаляется
+    :return: число записанных строк
+    """
+    writer_class = WRITERS[fmt or format_from_path(file_path)]
+    count = 0
+    try:
+        newline = "" if writer_class is CsvWriter else None  # csv сам пишет концы строк
+        with open(file_path, "w", encoding="utf-8", newline=newline, buffering=WRITE_BUFFER_BYTES) as f:
+            writer = writer_class(f, theme)
+            writer.header()
+            for row in rows:
+                if is_cancelled is not None and is_cancelled():
+                    raise ExportCancelled()
+                writer.row(row)
+                count += 1
+                if progress is not None and count % PROGRESS_EVERY == 0:
+                    progress(count)
+            writer.footer()
+    except BaseException:
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+        raise
+
+    if progress is not None:
+        progress(count)
+    return count
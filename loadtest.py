@@ -0,0 +1,158 @@
+# loadtest.py
+"""
+Нагрузочный тест Network без интернета: запросы идут в mock_server.py.
+
+    python loadtest.py -n 200 -j 32                       # мок запускается здесь же, на свободном порту
+    python loadtest.py -n 200 -j 32 --stream --no-limits  # потоком и без RateLimiter
+    python loadtest.py -n 100 --latency 500 --latency-dist exponential --throttle-rate 0.1
+    python loadtest.py -n 100 --url http://127.0.0.1:8900 # уже запущенный python mock_server.py
+
+Параметры, которых нет ниже (--latency, --error-rate, --stream-chunks...), передаются
+встроенному мок-серверу — см. python mock_server.py --help.
+Ничего не пишет ни в chatlist.db, ни в файлы кэша токенов.
+"""
+import argparse
+import os
+import sys
+import time
+
+import mock_server
+
+PROVIDERS = ("openai", "gigachat", "yandex")
+# Переменная с ключом для OpenAI-совместимых моделей теста
+MOCK_API_KEY_VAR = "MOCK_API_KEY"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Network на локальном мок-сервере")
+    parser.add_argument("-n", "--prompts", type=int, default=50, help="промтов (каждый — в каждую модель)")
+    parser.add_argument("-j", "--concurrency", type=int, default=16, help="одновременных запросов")
+    parser.add_argument("-p", "--provider", action="append", choices=PROVIDERS,
+                        help="провайдеры тестовых моделей; можно указать несколько раз (по умолчанию все)")
+    parser.add_argument("--stream", action="store_true", help="запрашивать ответы потоком (SSE)")
+    parser.add_argument("--no-limits", action="store_true",
+                        help="снять лимиты RateLimiter (rate_limit_rps и max_concurrency = 0)")
+    parser.add_argument("--url", help="адрес уже запущенного mock_server.py (иначе — встроенный)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="подробный лог запросов")
+    args, mock_argv = parser.parse_known_args(argv)
+    mock_options = mock_server.parse_args(["--port", "0"] + mock_argv)
+    return args, mock_options
+
+
+def mock_env(base_url: str) -> dict:
+    """Адреса провайдеров и фиктивные учётные данные — мок принимает любые"""
+    base_url = base_url.rstrip("/")
+    return {
+        "GIGACHAT_AUTH_URL": base_url + mock_server.GIGACHAT_AUTH_PATH,
+        "GIGACHAT_CHAT_URL": base_url + mock_server.GIGACHAT_CHAT_PATH,
+        "YANDEX_IAM_URL": base_url + mock_server.YANDEX_IAM_PATH,
+        "YANDEX_COMPLETION_URL": base_url + mock_server.YANDEX_COMPLETION_PATH,
+        "GIGACHAT_CLIENT_ID": "mock",
+        "GIGACHAT_CLIENT_SECRET": "mock",
+        "YANDEX_OAUTH_TOKEN": "mock",
+        "YANDEX_FOLDER_ID": "mock-folder",
+        MOCK_API_KEY_VAR: "mock-key",
+    }
+
+
+def mock_models(base_url: str, providers, no_limits: bool) -> list:
+    """Модели в формате строк таблицы models, направленные на мок"""
+    models = []
+    for i, provider in enumerate(providers, start=1):
+        model = {
+            "id": -i,  # отрицательные id не пересекаются с моделями из БД
+            "name": f"mock-{provider}",
+            "api_url": base_url.rstrip("/") + "/v1/chat/completions",
+            "api_key_var": MOCK_API_KEY_VAR,
+            "model_name": f"mock-{provider}",
+            "provider": provider,
+            "is_active": 1,
+        }
+        if no_limits:
+            model["rate_limit_rps"] = 0
+            model["max_concurrency"] = 0
+        models.append(model)
+    return models
+
+
+def summarize(metrics_rows: list) -> dict:
+    """Средние и перцентили по замерам RequestMetrics (мс)"""
+    from chatlist import percentile
+
+    summary = {}
+    for field in ("queue_ms", "connect_ms", "ttfb_ms", "total_ms"):
+        values = sorted(row[field] for row in metrics_rows if row[field] is not None)
+        summary[field] = (percentile(values, 50), percentile(values, 95), percentile(values, 99))
+    summary["connections"] = sum(1 for row in metrics_rows if row["connect_ms"])
+    return summary
+
+
+def main(argv=None) -> int:
+    args, mock_options = parse_args(argv)
+
+    server = None
+    if args.url:
+        base_url = args.url
+    else:
+        server = mock_server.MockServer(mock_options).start()
+        base_url = server.base_url
+
+    # Адреса провайдеров читаются при импорте network и config — окружение задаём до него
+    os.environ.update(mock_env(base_url))
+    import config
+    import network
+    from chatlist import run_batch
+
+    # Токены мока не должны попасть в файлы кэша настоящих токенов
+    network._gigachat_tokens.cache_file = None
+    config._yandex_iam_tokens.cache_file = None
+
+    models = mock_models(base_url, args.provider or PROVIDERS, args.no_limits)
+    prompts = [f"Нагрузочный промт {i + 1}" for i in range(args.prompts)]
+    concurrency = max(1, args.concurrency)
+    metrics_rows = []
+
+    def log(message: str):
+        print(message, file=sys.stderr, flush=True)
+
+    log(f"🧪 {base_url}: {len(prompts)} промтов × {len(models)} моделей, потоков: {concurrency}"
+        f"{', поток (SSE)' if args.stream else ''}{', без лимитов' if args.no_limits else ''}")
+
+    network.Network.configure_pool(pool_size=max(concurrency, network.DEFAULT_MAX_WORKERS))
+    network.Network.configure_metrics(lambda row: metrics_rows.append(row))
+    devnull = open(os.devnull, "w")
+    stdout = sys.stdout
+    try:
+        # Network пишет подробный лог через print — без --verbose он только мешает
+        if not args.verbose:
+            sys.stdout = devnull
+        stats = run_batch(prompts, models, concurrency, log=log, stream=args.stream)
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+        network.Network.configure_metrics(None)
+        network.Network.close_sessions()
+        if server is not None:
+            server.stop()
+
+    print(f"✅ {stats['ok']} ответов, {stats['errors']} ошибок, {stats['retries']} повторов "
+          f"за {stats['elapsed']:.2f} с — {stats['throughput']:.1f} запросов/с")
+    print(f"⏱️ Задержка вызова: p50 {stats['p50'] * 1000:.0f} мс, p95 {stats['p95'] * 1000:.0f} мс, "
+          f"p99 {stats['p99'] * 1000:.0f} мс")
+    if metrics_rows:
+        summary = summarize(metrics_rows)
+        print(f"{'Замер, мс':<12} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for field, title in (("queue_ms", "очередь"), ("connect_ms", "соединение"),
+                             ("ttfb_ms", "TTFB"), ("total_ms", "запрос")):
+            p50, p95, p99 = summary[field]
+            print(f"{title:<12} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+        print(f"🔌 Новых соединений: {summary['connections']} на {len(metrics_rows)} запросов")
+    if server is not None:
+        print("📊 Ответы мок-сервера:")
+        for (route, status), count in sorted(server.stats.items()):
+            print(f"   {route:<16} {status}: {count}")
+    return 0 if stats["errors"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
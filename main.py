@@ -1,20 +1,30 @@
 # main.py
 import sys
 import os
-import markdown
 import re
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QTextEdit, QTableWidget, QTableWidgetItem,
     QCheckBox, QLabel, QLineEdit, QHeaderView, QTabWidget,
     QFileDialog, QMessageBox, QScrollArea, QComboBox,
-    QInputDialog, QDialog, QSpinBox, QProgressBar
+    QInputDialog, QDialog, QSpinBox, QDoubleSpinBox, QProgressBar, QFrame,
+    QAbstractScrollArea
 )
-from db import Database
+from db import Database, WriteBehindQueue, PAGE_SIZE
 from dotenv import load_dotenv, set_key, get_key
-from themes import apply_theme, get_font, get_label_style
+from themes import apply_theme, get_font
 from functools import partial
-from network import Network
+from network import Network, DEFAULT_MAX_WORKERS
+from workers import (
+    PromptDispatcher, SearchWorker, PreviewRenderer, ExportWorker, EnhanceWorker, ENHANCE_TIMEOUT_SEC
+)
+from render import PreviewCache
+from cache import ResponseCache
+from budget import BudgetGuard, PriceList
+from views import (
+    ResultsTableModel, ResultsProxyModel, ResultsView, PromptsTableModel, PromptsProxyModel,
+    PromptsView, ROW_ROLE, html_to_plain
+)
 from datetime import datetime
 from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QCursor, QGuiApplication, QIcon, QPixmap  # ✅ Добавлен QPixmap
@@ -26,11 +36,60 @@ try:
 except ImportError:
     __version__ = "dev"  # fallback, если нет файла
 
+# Поиск запускается, когда пользователь перестал печатать на столько миллисекунд
+SEARCH_DEBOUNCE_MS = 250
+
+# Через сколько секунд рассылка бросает модели, которые ещё не ответили (0 — ждать всех)
+DEFAULT_RUN_DEADLINE_SEC = 120
+
+# Фильтр диалога экспорта, выбранный по умолчанию для расширения файла
+EXPORT_FILTERS = {
+    ".html": "HTML Files (*.html)",
+    ".md": "Markdown Files (*.md)",
+    ".jsonl": "JSON Lines (*.jsonl)",
+    ".csv": "CSV Files (*.csv)",
+}
+
 class ChatListApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.db = Database()
         self.network = Network()
+        self.dispatcher = None  # Фоновая рассылка промта (PromptDispatcher)
+        self.export_worker = None  # Фоновый экспорт в файл (ExportWorker)
+        self.enhance_worker = None  # Фоновый запрос улучшения промта (EnhanceWorker)
+        self.enhance_dialog = None  # Окно AI-ассистента, пока оно открыто
+        self.enhance_original = ""
+        self.sent_prompt = ""  # Промт, по которому получены текущие результаты
+        self.response_cache = ResponseCache(self.db)
+
+        # Замеры запросов к моделям пишутся в request_metrics пачками, не задерживая ответы
+        self.db.purge_request_metrics()
+        self.metrics_writer = WriteBehindQueue(self.db.save_request_metrics, name="metrics-writer")
+        Network.configure_metrics(self.metrics_writer.submit)
+
+        # Цены моделей и дневной бюджет; потраченное сегодня берём из request_metrics
+        midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        Network.configure_budget(
+            prices=PriceList.from_db(self.db),
+            budget=BudgetGuard(float(self.db.get_setting("budget_daily", "0")),
+                               spent=self.db.get_spent_since(midnight), daily=True, name="дневной бюджет"),
+        )
+
+        # Поиск промтов — в фоновом потоке, устаревшие запросы отменяются
+        self.search_worker = SearchWorker(self.db, self)
+        self.search_worker.results_ready.connect(self._on_search_results)
+        self.search_worker.start()
+        self._search_generation = 0
+        self._search_active = False  # в таблице промтов — выдача поиска, а не история
+
+        # Предпросмотр Markdown: отрисованный HTML кэшируется, рисуется в фоне
+        self.preview_cache = PreviewCache()
+        self.preview_renderer = PreviewRenderer(self.db, self.preview_cache, self)
+        self.preview_renderer.rendered.connect(self._on_preview_rendered)
+        self.preview_renderer.start()
+        self._preview_key = None  # (result_id, тема) предпросмотра, который сейчас ждёт пользователь
+        self._preview_shown = None  # ключ кэша показанного предпросмотра
 
         # Загружаем настройки
         self.load_theme()
@@ -51,6 +110,10 @@ class ChatListApp(QMainWindow):
         self.progress_bar.setRange(0, 100)
         self.progress_bar.hide()
         self.statusBar().addPermanentWidget(self.progress_bar)
+        self.export_cancel_btn = QPushButton("⛔ Отменить экспорт")
+        self.export_cancel_btn.clicked.connect(self.cancel_export)
+        self.export_cancel_btn.hide()
+        self.statusBar().addPermanentWidget(self.export_cancel_btn)
         # === Конец ===
 
         # Загружаем .env
@@ -63,6 +126,10 @@ class ChatListApp(QMainWindow):
                 f.write("POLZA_API_KEY=\nGIGACHAT=\nYANDEX_OAUTH_TOKEN=\nOPENROUTER_API_KEY=\n")
             print(f"[ENV] Создан файл {self.env_path}")
 
+        # Курсор постраничной загрузки предпросмотра: (дата, id) последней загруженной строки
+        self._preview_after = None
+        self._preview_has_more = False
+
         self.init_ui()
         self.apply_font_size(font_size)
 
@@ -70,11 +137,9 @@ class ChatListApp(QMainWindow):
         self.load_prompts()
         self.load_models()
 
-        # Хранение временных результатов: model_id → (response, checkbox)
-        self.temp_results = {}
-
     def load_theme(self):
         theme = self.db.get_setting("theme", "light")
+        self.current_theme = theme
         apply_theme(self, theme)
 
     def apply_font_size(self, size: int):
@@ -115,17 +180,25 @@ class ChatListApp(QMainWindow):
         # Поиск
         search_layout = QHBoxLayout()
         self.search_input = QLineEdit()
-        self.search_input.setPlaceholderText("Поиск по промтам и тегам...")
+        self.search_input.setPlaceholderText("Поиск по промтам, тегам и ответам...")
         self.search_input.textChanged.connect(self.on_search)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self._run_search)
         search_layout.addWidget(QLabel("Поиск:"))
         search_layout.addWidget(self.search_input)
         prompts_layout.addLayout(search_layout)
 
-        # Таблица промтов
-        self.prompts_table = QTableWidget()
+        # Таблица промтов: модель/представление, кнопки рисует делегат
+        self.prompts_model = PromptsTableModel(self)
+        self.prompts_proxy = PromptsProxyModel(self)
+        self.prompts_proxy.setSourceModel(self.prompts_model)
+
+        self.prompts_table = PromptsView()
+        self.prompts_table.setModel(self.prompts_proxy)
         self.prompts_table.setSortingEnabled(True)  # ✅ сортировка
-        self.prompts_table.setColumnCount(5)
-        self.prompts_table.setHorizontalHeaderLabels(["ID", "Дата", "Промт", "Теги", "Действия"])
+        self.prompts_table.sortByColumn(-1, Qt.SortOrder.AscendingOrder)  # Порядок — как из БД
         header = self.prompts_table.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)  # ID
         header.setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)  # Дата
@@ -134,9 +207,8 @@ class ChatListApp(QMainWindow):
         self.prompts_table.setColumnWidth(3,40)
         header.setSectionResizeMode(4, QHeaderView.ResizeMode.Fixed)             # Действия
         self.prompts_table.setColumnWidth(4, 230)
-        self.prompts_table.setWordWrap(True)
-        self.prompts_table.resizeRowsToContents()
-        self.prompts_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.prompts_table.copy_requested.connect(lambda p: self.copy_prompt_to_input(p["prompt"]))
+        self.prompts_table.delete_requested.connect(lambda p: self.delete_prompt_by_id(p["id"]))
         prompts_layout.addWidget(self.prompts_table)
 
         # Поле ввода промта
@@ -151,39 +223,42 @@ class ChatListApp(QMainWindow):
 
         btn_layout = QHBoxLayout()
         btn_layout.addWidget(self.enhance_prompt_btn)
+        self.bypass_cache_check = QCheckBox("Без кэша")
+        self.bypass_cache_check.setToolTip("Запросить свежие ответы, не используя сохранённые в кэше")
+        btn_layout.addWidget(self.bypass_cache_check)
         self.send_btn = QPushButton("📤 Отправить во все активные модели")
         self.send_btn.clicked.connect(self.send_prompt)
         btn_layout.addWidget(self.send_btn)
+        self.stop_btn = QPushButton("⛔ Остановить")
+        self.stop_btn.setToolTip("Прервать рассылку: полученные ответы останутся, остальные будут отменены")
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.clicked.connect(self.stop_sending)
+        btn_layout.addWidget(self.stop_btn)
         prompts_layout.addLayout(btn_layout)
 
         # ============= ВКЛАДКА 2: РЕЗУЛЬТАТЫ =============
         results_layout = QVBoxLayout()
         self.tab_results.setLayout(results_layout)
 
-        # Таблица результатов
-        self.results_table = QTableWidget()
-        self.results_table.setSortingEnabled(True)  # ✅ сортировка
-        self.results_table.setColumnCount(3)
-        self.results_table.setHorizontalHeaderLabels(["Модель", "Ответ", "Выбрать"])
-        # Разрешить перенос текста в ячейке "Ответ"
-        self.results_table.setWordWrap(True)
-        self.results_table.setTextElideMode(Qt.TextElideMode.ElideNone)
-
-        # Включить автоматическую высоту строк
-        self.results_table.resizeRowsToContents()
+        # Таблица результатов: модель/представление, строки рисует делегат
+        self.results_model = ResultsTableModel(self)
+        self.results_model.response_loader = self.db.get_result_response
+        self.results_proxy = ResultsProxyModel(self)
+        self.results_proxy.setSourceModel(self.results_model)
 
-        # Опционально: включить прокрутку внутри ячейки
+        self.results_table = ResultsView()
+        self.results_table.setModel(self.results_proxy)
+        self.results_table.setSortingEnabled(True)  # ✅ сортировка
+        self.results_table.sortByColumn(-1, Qt.SortOrder.AscendingOrder)  # Порядок — как пришли ответы
         self.results_table.verticalHeader().setVisible(True)
 
-
-        
         # 🔧 Настройка ширины
         results_header = self.results_table.horizontalHeader()
         results_header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
         results_header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
         results_header.setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
 
-        self.results_table.cellDoubleClicked.connect(self.view_full_response)
+        self.results_table.doubleClicked.connect(self.view_full_response)
         results_layout.addWidget(self.results_table)
 
 
@@ -209,78 +284,53 @@ class ChatListApp(QMainWindow):
         self.export_html_btn.clicked.connect(self.export_to_html)
         action_layout.addWidget(self.export_html_btn)
 
+        self.export_history_btn = QPushButton("📚 Экспорт всей истории")
+        self.export_history_btn.clicked.connect(self.export_history)
+        action_layout.addWidget(self.export_history_btn)
+
         results_layout.addLayout(action_layout)
 
         # ============= СОБЫТИЯ =============
     def load_prompts(self):
-        """Загружает все промты в таблицу"""
-        # Полная очистка таблицы (включая виджеты)
-        self._clear_table_widgets(self.prompts_table)
-        self.prompts_table.setRowCount(0)
-        self.prompts_table.setSortingEnabled(False)  # Отключаем на время
-
-        prompts = self.db.get_all_prompts()
-
-        self.prompts_table.setRowCount(len(prompts))
-
-        for row_idx, p in enumerate(prompts):
-            self.prompts_table.setItem(row_idx, 0, QTableWidgetItem(str(p["id"])))
-            self.prompts_table.setItem(row_idx, 1, QTableWidgetItem(p["created_at"]))
-            self.prompts_table.setItem(row_idx, 2, QTableWidgetItem(p["prompt"]))
-            self.prompts_table.setItem(row_idx, 3, QTableWidgetItem(p["tags"] or ""))
-
-            self.prompts_table.setRowHeight(row_idx, 45)
-
-            # Контейнер для кнопок
-            btn_widget = QWidget()
-            btn_layout = QHBoxLayout(btn_widget)
-            btn_layout.setContentsMargins(2, 0, 0, 2)
-            btn_layout.setSpacing(3)
-            btn_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
-
-            # Кнопки
-            copy_btn = QPushButton("📋 Копировать")
-            copy_btn.setFixedSize(90, 30)
-
-            delete_btn = QPushButton("🗑️ Удалить")
-            delete_btn.setFixedSize(90, 30)
-            delete_btn.setStyleSheet("QPushButton { color: #a00; }")
-
-            # Сохраняем ссылки, чтобы Python не удалил
-            btn_widget.copy_btn = copy_btn
-            btn_widget.delete_btn = delete_btn
+        """Загружает первую страницу промтов в таблицу, остальные — при прокрутке"""
+        self.prompts_model.set_page_source(self._fetch_prompts_page)
 
-            # Подключаем сигналы
-            copy_btn.clicked.connect(partial(self.copy_prompt_to_input, p["prompt"]))
-            delete_btn.clicked.connect(partial(self.delete_prompt_by_id, p["id"]))
+    def _fetch_prompts_page(self, last_row):
+        """Следующая страница промтов для таблицы (после last_row)"""
+        after = (last_row["created_at"], last_row["id"]) if last_row else None
+        return self.db.get_prompts_page(after)
 
-            btn_layout.addWidget(copy_btn)
-            btn_layout.addWidget(delete_btn)
-            btn_widget.setLayout(btn_layout)
+    def add_prompt_to_table(self, prompt_id: int):
+        """Показывает только что сохранённый промт, не перечитывая таблицу"""
+        prompt = self.db.get_prompt(prompt_id)
+        if prompt:
+            self.prompts_model.insert_prompt(prompt)
 
-            self.prompts_table.setCellWidget(row_idx, 4, btn_widget)
+    def _fetch_more_on_scroll(self, view: QAbstractScrollArea, fetch_more):
+        """Вызывает fetch_more, когда список прокрутили до конца"""
+        scrollbar = view.verticalScrollBar()
 
-        self.prompts_table.setSortingEnabled(True)  # Включаем обратно
+        def on_scroll(value):
+            if value >= scrollbar.maximum() - 5:
+                fetch_more()
 
-    def _clear_table_widgets(self, table: QTableWidget):
-        """Полная очистка виджетов в таблице"""
-        for row in range(table.rowCount()):
-            for col in range(table.columnCount()):
-                widget = table.cellWidget(row, col)
-                if widget:
-                    widget.deleteLater()  # Помечаем на удаление
-        table.clearContents()  # Очищаем содержимое
+        scrollbar.valueChanged.connect(on_scroll)
 
     def enhance_prompt(self):
-        """Запускает AI-ассистент для улучшения промта"""
+        """Запускает AI-ассистент для улучшения промта (запрос выполняется в фоне)"""
+        if self.enhance_worker is not None and self.enhance_worker.isRunning():
+            if self.enhance_dialog is not None:
+                self.enhance_dialog.raise_()
+            return
+
         original = self.prompt_input.toPlainText().strip()
         if not original:
             QMessageBox.warning(self, "Пусто", "Введите промт для улучшения.")
             return
 
-        # Диалог выбора модели
-        model = self.select_model_for_enhancement()
-        if not model:
+        # Диалог выбора модели (или всех активных сразу)
+        models = self.select_models_for_enhancement()
+        if not models:
             return
 
         # Формируем системный промт
@@ -313,51 +363,81 @@ class ChatListApp(QMainWindow):
     🔹 Креатив: [текст]
     """
 
-        # Показываем "ожидание"
-        self.show_wait_cursor()
-        try:
-            enhanced = self.network.send_prompt_to_model(model, system_prompt)
-            print("🔹 [DEBUG] Полный ответ от AI:")
-            print(enhanced)  # ← Выводим весь ответ
-        finally:
-            self.restore_cursor()
-
-        if not enhanced or not enhanced.strip():
-            QMessageBox.critical(self, "Ошибка", "Не удалось получить улучшенный промт.")
-            return
+        # Окно результатов открывается сразу, ответы добавляются по мере прихода
+        self.enhance_original = original
+        self._open_enhancement_dialog(len(models))
 
-        print("🔹 [DEBUG] Перед вызовом show_enhancement_result")  # ← Добавьте это
-        # Показываем результат
-        self.show_enhancement_result(original, enhanced)
+        timeout = int(self.db.get_setting("enhance_timeout", str(ENHANCE_TIMEOUT_SEC)))
+        self.enhance_worker = EnhanceWorker(models, system_prompt, timeout, parent=self)
+        self.enhance_worker.variant_ready.connect(self._on_enhancement_ready)
+        self.enhance_worker.finished.connect(self._on_enhancement_finished)
+        self.enhance_prompt_btn.setEnabled(False)
+        self.enhance_worker.start()
 
-    def select_model_for_enhancement(self):
+    def select_models_for_enhancement(self) -> list:
+        """Модель для улучшения промта — или все активные модели параллельно"""
         try:
             models = self.db.get_active_models()  # ✅ Через self.db
             if not models:
                 QMessageBox.warning(self, "Нет моделей", "Нет активных моделей для улучшения промта.")
-                return None
+                return []
 
+            all_models_item = f"🔀 Все активные модели ({len(models)}, параллельно)"
             items = [model["name"] for model in models]
+            if len(models) > 1:
+                items.append(all_models_item)
             item, ok = QInputDialog.getItem(self, "Выбор модели", "Выберите модель для улучшения промта:", items, 0, False)
-            if ok and item:
-                selected_model = next(m for m in models if m["name"] == item)
-                return selected_model
-            return None
+            if not ok or not item:
+                return []
+            if item == all_models_item:
+                return models
+            return [next(m for m in models if m["name"] == item)]
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось выбрать модель:\n{e}")
-            return None
+            return []
 
+    def _on_enhancement_ready(self, idx: int, model: dict, response: str):
+        """Ответ одной модели на запрос улучшения (сигнал EnhanceWorker)"""
+        if self.enhance_dialog is None or self.enhance_worker.is_cancelled():
+            return  # Окно закрыто или запрос отменён — ответ больше не нужен
 
-    def show_enhancement_result(self, original: str, enhanced: str):
-        """Показывает улучшенный промт, варианты и адаптации — каждый в отдельном блоке с кнопкой 'Принять'"""
-        from PyQt6.QtWidgets import (
-            QDialog, QVBoxLayout, QHBoxLayout, QLabel, QTextEdit,
-            QPushButton, QFrame, QScrollArea, QWidget
-        )
-        from PyQt6.QtCore import Qt
+        self._enhance_done += 1
+        model_name = model["name"] if self._enhance_total > 1 else None
+        if not response or not response.strip() or Network.is_error_response(response):
+            self._add_enhancement_error(model["name"], response or "Пустой ответ")
+        else:
+            self.show_enhancement_result(self.enhance_original, response, model_name)
+        self._update_enhancement_status()
+
+    def _on_enhancement_finished(self):
+        """Фоновый запрос улучшения завершён (все ответы получены, отменён или истёк таймаут)"""
+        self.enhance_prompt_btn.setEnabled(True)
+        if self.enhance_dialog is not None:
+            self.enhance_cancel_btn.setEnabled(False)
+            self._update_enhancement_status()
+
+    def cancel_enhancement(self):
+        """Отменяет ожидание ответов AI-ассистента"""
+        if self.enhance_worker is not None and self.enhance_worker.isRunning():
+            self.enhance_worker.cancel()
+            if self.enhance_dialog is not None:
+                self.enhance_cancel_btn.setEnabled(False)
+                self._update_enhancement_status()
+
+    def _update_enhancement_status(self):
+        done, total = self._enhance_done, self._enhance_total
+        if self.enhance_worker is not None and self.enhance_worker.is_cancelled():
+            text = f"⛔ Отменено (получено ответов: {done} из {total})"
+        elif done < total:
+            text = f"⏳ Ожидание ответов... {done}/{total}"
+        else:
+            text = f"✅ Готово: {done}/{total}"
+        self.enhance_status_label.setText(text)
 
-        # Парсим ответ
-        result = self.parse_enhancement_response(enhanced)
+    def _open_enhancement_dialog(self, total: int = 1):
+        """Немодальное окно AI-ассистента: блоки с вариантами добавляются по мере прихода ответов"""
+        if self.enhance_dialog is not None:
+            self.enhance_dialog.close()
 
         dialog = QDialog(self)
         dialog.setWindowTitle("🧠 AI-ассистент: Улучшение промта")
@@ -366,11 +446,61 @@ class ChatListApp(QMainWindow):
         # Главный layout
         main_layout = QVBoxLayout()
 
+        self.enhance_status_label = QLabel()
+        main_layout.addWidget(self.enhance_status_label)
+
         # Скролл-область
         scroll = QScrollArea()
         scroll.setWidgetResizable(True)
         scroll_content = QWidget()
-        scroll_layout = QVBoxLayout(scroll_content)
+        self.enhance_blocks_layout = QVBoxLayout(scroll_content)
+        scroll.setWidget(scroll_content)
+        main_layout.addWidget(scroll)
+
+        # Кнопки "Отменить" и "Закрыть" — внизу
+        btn_layout = QHBoxLayout()
+        self.enhance_cancel_btn = QPushButton("⛔ Отменить")
+        self.enhance_cancel_btn.clicked.connect(self.cancel_enhancement)
+        close_btn = QPushButton("❌ Закрыть")
+        close_btn.clicked.connect(dialog.reject)
+        btn_layout.addWidget(self.enhance_cancel_btn)
+        btn_layout.addWidget(close_btn)
+        main_layout.addLayout(btn_layout)
+
+        dialog.setLayout(main_layout)
+        # Закрытие окна отменяет запрос
+        dialog.finished.connect(lambda _: self._on_enhancement_dialog_closed(dialog))
+
+        self.enhance_dialog = dialog
+        self._enhance_total = total
+        self._enhance_done = 0
+        self._update_enhancement_status()
+        dialog.show()
+
+    def _on_enhancement_dialog_closed(self, dialog: QDialog):
+        if self.enhance_dialog is dialog:
+            self.cancel_enhancement()
+            self.enhance_dialog = None
+        dialog.deleteLater()
+
+    def _add_enhancement_error(self, model_name: str, error: str):
+        """Строка с ошибкой модели в окне AI-ассистента"""
+        label = QLabel(f"⚠️ {model_name}: {html_to_plain(error)}")
+        label.setWordWrap(True)
+        label.setStyleSheet("color: #cc4444; margin: 4px;")
+        self.enhance_blocks_layout.addWidget(label)
+
+    def show_enhancement_result(self, original: str, enhanced: str, model_name: str = None):
+        """Показывает улучшенный промт, варианты и адаптации — каждый в отдельном блоке с кнопкой 'Принять'.
+        Блоки добавляются в окно AI-ассистента; model_name подписывается, когда отвечают несколько моделей"""
+        if self.enhance_dialog is None:
+            self._open_enhancement_dialog()
+        dialog = self.enhance_dialog
+        scroll_layout = self.enhance_blocks_layout
+        prefix = f"[{model_name}] " if model_name else ""
+
+        # Парсим ответ
+        result = self.parse_enhancement_response(enhanced)
 
         def add_block(title: str, text: str):
             """Добавляет блок: заголовок, текст, кнопку 'Принять' — с сохранением в БД"""
@@ -394,7 +524,7 @@ class ChatListApp(QMainWindow):
             # Левая часть: заголовок + текст
             left_layout = QVBoxLayout()
 
-            label = QLabel(title)
+            label = QLabel(prefix + title)
             label.setStyleSheet("font-weight: bold; color: #ffffff; background: transparent;")
             label.setAlignment(Qt.AlignmentFlag.AlignLeft)
             left_layout.addWidget(label)
@@ -441,8 +571,9 @@ class ChatListApp(QMainWindow):
             accept_btn.clicked.connect(
                 lambda: [
                     self.prompt_input.setPlainText(text.strip()),  # Вставить в редактор
-                    self.db.save_prompt(text.strip(), tags="улучшенный"),  # Сохранить в БД
-                    self.load_prompts(),  # ✅ Обновить таблицу
+                    self.add_prompt_to_table(  # ✅ Сохранить в БД и показать в таблице
+                        self.db.save_prompt(text.strip(), tags="улучшенный")
+                    ),
                     QMessageBox.information(dialog, "Сохранено", "Промт сохранён в историю")
                 ]
             )
@@ -471,19 +602,6 @@ class ChatListApp(QMainWindow):
         if "Креатив" in adapted:
             add_block("🎨 Адаптация: Креатив", adapted["Креатив"])
 
-        # ===
-
-        scroll.setWidget(scroll_content)
-        main_layout.addWidget(scroll)
-
-        # Кнопка "Закрыть" — внизу
-        close_btn = QPushButton("❌ Закрыть")
-        close_btn.clicked.connect(dialog.reject)
-        main_layout.addWidget(close_btn)
-
-        dialog.setLayout(main_layout)
-        dialog.exec()
-
     def parse_enhancement_response(self, text: str):
         """Разбирает ответ от AI — устойчиво к markdown форматированию"""
         text = text.strip()
@@ -588,220 +706,164 @@ class ChatListApp(QMainWindow):
         # Очищаем текущие результаты
         self.clear_results()
 
-        # Получаем все сохранённые результаты
-        saved_results = self.db.get_all_saved_results()
+        # Первая страница; следующие таблица запросит сама при прокрутке
+        self.results_model.set_page_source(self._fetch_saved_results_page)
 
-        if not saved_results:
+        loaded = self.results_model.rowCount()
+        if not loaded:
             QMessageBox.information(self, "Нет данных", "Нет сохранённых результатов.")
             return
 
-        # Устанавливаем количество строк
-        self.results_table.setRowCount(len(saved_results))
-
-        self.temp_results.clear()
-
-        for row_idx, result in enumerate(saved_results):
-            prompt_text = result["prompt"]
-            model_name = result["model_name"]
-            response = result["response"]
-            saved_at = result["saved_at"]
-
-            # Столбец 0: Модель
-            self.results_table.setItem(row_idx, 0, QTableWidgetItem(model_name))
-
-            # Столбец 1: Ответ — с прокруткой
-            label = QLabel(response)
-            label.setWordWrap(True)
-            label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
-            label.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
-            label.setStyleSheet(get_label_style())
-
-            scroll = QScrollArea()
-            scroll.setWidget(label)
-            scroll.setWidgetResizable(True)
-            scroll.setMaximumHeight(200)
-            scroll.setMinimumHeight(60)
-            self.results_table.setCellWidget(row_idx, 1, scroll)
-
-            # Столбец 2: Чекбокс (уже сохранено)
-            checkbox = QCheckBox()
-            checkbox.setChecked(True)
-            checkbox.setEnabled(False)  # Нельзя снять — уже в БД
-            checkbox_widget = QWidget()
-            layout = QHBoxLayout(checkbox_widget)
-            layout.addWidget(checkbox)
-            layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            layout.setContentsMargins(0, 0, 0, 0)
-            checkbox_widget.setLayout(layout)
-            self.results_table.setCellWidget(row_idx, 2, checkbox_widget)
-
-            # Сохраняем в temp_results для совместимости (например, экспорт)
-            self.temp_results[row_idx] = (None, response, checkbox)
-
-        # Подстраиваем высоту строк
-        QTimer.singleShot(100, self.resize_all_rows)
-
         # Обновляем статус
-        self.statusBar().showMessage(f"Загружено {len(saved_results)} сохранённых ответов", 3000)
+        self.statusBar().showMessage(
+            f"Загружено {loaded} сохранённых ответов, остальные подгрузятся при прокрутке", 3000
+        )
+
+    def _fetch_saved_results_page(self, last_row):
+        """Следующая страница сохранённых результатов для таблицы (после last_row)"""
+        after = (last_row["saved_at"], last_row["result_id"]) if last_row else None
+        return [
+            ResultsTableModel.make_row(
+                result["model_id"], result["model_name"], result["response"],
+                checked=True, saved=True, result_id=result["id"],
+                saved_at=result["saved_at"], truncated=result["truncated"],
+            )
+            for result in self.db.get_saved_results_page(after)
+        ]
 
     def export_to_html(self):
         """Экспортирует выбранные ответы в HTML-файл"""
-        if not self.temp_results:
+        self._export_selected("Сохранить как HTML", "results.html")
+
+    def export_to_markdown(self):
+        """Экспортирует выбранные ответы в Markdown-файл"""
+        self._export_selected("Сохранить как", "results.md")
+
+    def export_history(self):
+        """Экспортирует все сохранённые результаты из БД"""
+        total = self.db.count_saved_results()
+        if not total:
+            QMessageBox.information(self, "Нет данных", "Нет сохранённых результатов.")
+            return
+        # Генератор создаётся в потоке экспорта и читает БД курсором
+        self._start_export("Экспорт всей истории", "chatlist_history.jsonl",
+                           lambda group_by_prompt: self.db.iter_saved_results(group_by_prompt=group_by_prompt),
+                           total)
+
+    def _export_selected(self, title: str, default_name: str):
+        """Экспорт отмеченных в таблице результатов"""
+        if self.results_model.rowCount() == 0:
             QMessageBox.warning(self, "Экспорт", "Нет результатов для экспорта.")
             return
 
-        # Собираем выбранные ответы
-        selected_responses = []
-        for row_idx, (model_id, response, checkbox) in self.temp_results.items():
-            if checkbox.isChecked():
-                model_name = self.results_table.item(row_idx, 0).text()
-                selected_responses.append((model_name, response))
+        # Собираем выбранные ответы; полный текст сохранённых дочитает поток экспорта
+        selected = [
+            {
+                "result_id": row["result_id"],
+                "saved_at": row["saved_at"],
+                "prompt": self.sent_prompt,
+                "model_name": row["model_name"],
+                "response": row["response"],
+            }
+            for row in self.results_model.checked_rows()
+        ]
 
-        if not selected_responses:
+        if not selected:
             QMessageBox.warning(self, "Экспорт", "Ничего не выбрано для экспорта.")
             return
 
-        # Диалог сохранения
+        def rows(group_by_prompt):
+            # Все выбранные ответы — на один промт, порядок таблицы сохраняем
+            for row in selected:
+                if row["result_id"] is not None:
+                    row = self.db.get_saved_result(row["result_id"]) or row
+                yield row
+
+        self._start_export(title, default_name, rows, len(selected))
+
+    def _start_export(self, title: str, default_name: str, rows_factory, total: int):
+        """Спрашивает файл и запускает ExportWorker; формат — по расширению файла"""
+        if self.export_worker is not None and self.export_worker.isRunning():
+            QMessageBox.information(self, "Подождите", "Предыдущий экспорт ещё выполняется.")
+            return
+
         file_path, _ = QFileDialog.getSaveFileName(
             self,
-            "Сохранить как HTML",
-            "results.html",
-            "HTML Files (*.html);;All Files (*)"
+            title,
+            default_name,
+            "HTML Files (*.html);;Markdown Files (*.md);;JSON Lines (*.jsonl);;CSV Files (*.csv);;All Files (*)",
+            EXPORT_FILTERS.get(os.path.splitext(default_name)[1], "")
         )
         if not file_path:
+            return  # Отменили
+
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.export_cancel_btn.setEnabled(True)
+        self.export_cancel_btn.show()
+        self.statusBar().showMessage(f"Экспорт {total} ответов...")
+        self._set_export_buttons_enabled(False)
+
+        self.export_worker = ExportWorker(rows_factory, file_path, theme=self.current_theme, parent=self)
+        self.export_worker.progress.connect(self._on_export_progress)
+        self.export_worker.export_finished.connect(self._on_export_finished)
+        self.export_worker.export_failed.connect(self._on_export_failed)
+        self.export_worker.start()
+
+    def cancel_export(self):
+        """Прерывает идущий экспорт; недописанный файл удаляется"""
+        if self.export_worker is not None and self.export_worker.isRunning():
+            self.export_worker.cancel()
+            self.export_cancel_btn.setEnabled(False)
+            self.statusBar().showMessage("Экспорт отменяется...")
+
+    def _set_export_buttons_enabled(self, enabled: bool):
+        for button in (self.export_btn, self.export_html_btn, self.export_history_btn):
+            button.setEnabled(enabled)
+
+    def _on_export_progress(self, count: int):
+        self.progress_bar.setValue(count)
+        self.statusBar().showMessage(f"Экспорт: записано {count} из {self.progress_bar.maximum()}")
+
+    def _on_export_finished(self, file_path: str, count: int):
+        self._set_export_buttons_enabled(True)
+        self.progress_bar.hide()
+        self.export_cancel_btn.hide()
+        self.statusBar().showMessage(f"Экспортировано {count} ответов", 5000)
+        QMessageBox.information(self, "Готово", f"Результаты экспортированы в:\n{file_path}")
+
+    def _on_export_failed(self, error: str):
+        self._set_export_buttons_enabled(True)
+        self.progress_bar.hide()
+        self.export_cancel_btn.hide()
+        if self.export_worker is not None and self.export_worker.is_cancelled():
+            self.statusBar().showMessage(f"⛔ {error}", 5000)
             return
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл:\n{error}")
 
-        # Получаем текущую тему для стилей
-        theme = self.db.get_setting("theme", "light")
-        html_content = self.generate_html(selected_responses, theme)
+    def view_full_response(self, index):
+        """Показывает ответ целиком (двойной щелчок по строке результатов)"""
+        source_index = self.results_proxy.mapToSource(index)
+        if not source_index.isValid():
+            return
+        row = self.results_model.row(source_index.row())
+        if row["pending"]:
+            return
 
-        try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(html_content)
-            QMessageBox.information(self, "Готово", f"Экспорт в HTML сохранён:\n{file_path}")
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл:\n{str(e)}")
+        response_text = self.results_model.full_response(row)
+        if row["is_error"]:
+            response_text = html_to_plain(response_text)
+        QApplication.clipboard().setText(response_text)
 
-    def generate_html(self, responses: list, theme: str) -> str:
-        """Генерирует HTML с встроенными стилями"""
-        # 🔹 Объявляем переменные
-        if theme == "dark":
-            bg = "#2b2b2b"
-            text = "#ffffff"
-            block_bg = "#3c3c3c"
-            border = "#555"
-            accent = "#007acc"
-        else:
-            bg = "#ffffff"
-            text = "#333333"
-            block_bg = "#f9f9f9"
-            border = "#ddd"
-            accent = "#0056b3"
-
-        # 🔹 Теперь безопасно создаём html
-        html = f'''<!DOCTYPE html>
-    <html lang="ru">
-    <head>
-        <meta charset="UTF-8">
-        <title>ChatList — Результаты</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <style>
-            body {{
-                background-color: {bg};
-                color: {text};
-                font-family: Arial, sans-serif;
-                line-height: 1.6;
-                margin: 0;
-                padding: 20px;
-            }}
-            .container {{
-                max-width: 900px;
-                margin: 0 auto;
-                padding: 20px;
-            }}
-            h1 {{
-                color: {accent};
-                border-bottom: 2px solid {accent};
-                padding-bottom: 10px;
-            }}
-            h2 {{
-                color: {accent};
-                margin-top: 20px;
-            }}
-            blockquote {{
-                background-color: {block_bg};
-                border-left: 4px solid {accent};
-                margin: 15px 0;
-                padding: 12px 15px;
-                border-radius: 0 4px 4px 0;
-                font-style: italic;
-            }}
-            .footer {{
-                margin-top: 30px;
-                color: #777;
-                font-size: 0.9em;
-                text-align: center;
-            }}
-            .divider {{
-                border: 0;
-                border-top: 1px solid {border};
-                margin: 20px 0;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>ChatList — Результаты</h1>
-            <p><strong>Дата:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-            <p><strong>Версия:</strong> {__version__}</p>
-            <hr class="divider">
-    '''
-
-        # Добавляем ответы
-        for model_name, response in responses:
-            response_escaped = (
-                response
-                .replace("&", "&amp;")
-                .replace("<", "&lt;")
-                .replace(">", "&gt;")
-                .replace("\n", "<br>")
-            )
-            html += f'''
-            <h2>{model_name}</h2>
-            <blockquote>
-                {response_escaped}
-            </blockquote>
-            <hr class="divider">
-    '''
-
-        # Завершение HTML
-        html += f'''
-            <div class="footer">
-                Экспорт сгенерирован ChatList • <a href="https://github.com/fedorkrs33-web/ChatList" style="color: {accent}; text-decoration: none;">GitHub</a>
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-
-        return html
-    
-    def view_full_response(self, row, column):
-        if column == 1:  # Только по столбцу "Ответ"
-            scroll_area = self.results_table.cellWidget(row, 1)
-            if scroll_area and isinstance(scroll_area, QScrollArea):
-                label = scroll_area.widget()
-                if label and isinstance(label, QLabel):
-                    model_name = self.results_table.item(row, 0).text()
-                    rresponse_text = label.text() if label else ""
-
-                msg_box = QMessageBox(self)
-                msg_box.setWindowTitle(f"Полный ответ: {model_name}")
-                msg_box.setText("Ответ скопирован в буфер. Нажмите 'Показать подробности' для просмотра.")
-                msg_box.setDetailedText(response_text)
-                msg_box.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
-                msg_box.setIcon(QMessageBox.Icon.Information)
-                msg_box.exec()
+        msg_box = QMessageBox(self)
+        msg_box.setWindowTitle(f"Полный ответ: {row['model_name']}")
+        msg_box.setText("Ответ скопирован в буфер. Нажмите 'Показать подробности' для просмотра.")
+        msg_box.setDetailedText(response_text)
+        msg_box.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        msg_box.setIcon(QMessageBox.Icon.Information)
+        msg_box.exec()
 
 
     #============= ВКЛАДКА 3: МОДЕЛИ =============
@@ -860,13 +922,19 @@ class ChatListApp(QMainWindow):
         manager = ModelsManager(db=self.db, parent=self)
         manager.open_editor()  # ← модальное окно
 
-        # После закрытия — обновляем таблицу
+        # После закрытия — обновляем таблицу и цены моделей
         self.load_models()
+        Network.configure_budget(prices=PriceList.from_db(self.db))
             
     def load_models(self):
         """Загружает модели в таблицу"""
-        # Полная очистка
-        self._clear_table_widgets(self.models_table)
+        # Полная очистка: виджеты ячеек (переключатели) помечаем на удаление
+        for row in range(self.models_table.rowCount()):
+            for col in range(self.models_table.columnCount()):
+                widget = self.models_table.cellWidget(row, col)
+                if widget:
+                    widget.deleteLater()
+        self.models_table.clearContents()
         self.models_table.setRowCount(0)
         self.models_table.setSortingEnabled(False)
 
@@ -951,6 +1019,7 @@ class ChatListApp(QMainWindow):
         # Кнопка: обновить список
         refresh_btn = QPushButton("🔄 Обновить")
         refresh_btn.clicked.connect(self.load_preview_list)
+        self._fetch_more_on_scroll(self.preview_table, self.load_more_preview)
         layout.addWidget(refresh_btn)
 
         return tab
@@ -971,163 +1040,57 @@ class ChatListApp(QMainWindow):
         self.load_preview(selected_row, 0)
 
     def load_preview_list(self):
-        """Загружает список сохранённых результатов в таблицу"""
+        """Загружает первую страницу сохранённых результатов, остальные — при прокрутке"""
         self.preview_table.setRowCount(0)
-        data = self.db.get_saved_results_with_models()
+        self._preview_after = None
+        self._preview_has_more = True
+        self.load_more_preview()
 
-        for row_idx, item in enumerate(data):
-            self.preview_table.insertRow(row_idx)
+    def load_more_preview(self):
+        """Дописывает в список следующую страницу сохранённых результатов"""
+        if not self._preview_has_more:
+            return
 
+        data = self.db.get_saved_results_page(self._preview_after)
+        self._preview_has_more = len(data) == PAGE_SIZE
+        if not data:
+            return
+        self._preview_after = (data[-1]["saved_at"], data[-1]["id"])
+
+        first_row = self.preview_table.rowCount()
+        self.preview_table.setRowCount(first_row + len(data))
+        for row_idx, item in enumerate(data, start=first_row):
             self.preview_table.setItem(row_idx, 0, QTableWidgetItem(str(item["id"])))
             self.preview_table.setItem(row_idx, 1, QTableWidgetItem(item["prompt"]))
-            self.preview_table.setItem(row_idx, 2, QTableWidgetItem(item["models"]))
+            self.preview_table.setItem(row_idx, 2, QTableWidgetItem(item["model_name"]))
             self.preview_table.setItem(row_idx, 3, QTableWidgetItem(item["saved_at"]))
 
     def load_preview(self, row, column):
-        """Загружает и отображает Markdown-предпросмотр с поддержкой форматирования"""
+        """Показывает Markdown-предпросмотр: из кэша сразу, иначе — после фоновой отрисовки"""
         result_id = int(self.preview_table.item(row, 0).text())
-        prompt = self.preview_table.item(row, 1).text()
-
-        responses = self.db.get_responses_by_result_id(result_id)
-        if not responses:
-            self.preview_text.setHtml("<p><i>Нет данных</i></p>")
-            return
+        self._preview_key = (result_id, self.current_theme)
 
-        # Формируем Markdown
-        md_lines = []
-        md_lines.append(f"# {prompt.strip()}")
-        md_lines.append(f"*Дата: {responses[0]['saved_at']}*")
-        md_lines.append("")  # Пустая строка
-
-        for r in responses:
-            md_lines.append(f"## {r['model_name']}")
-            response_text = r['response'].strip()
-            # Экранируем, чтобы не сломать Markdown
-            lines = response_text.splitlines()
-            for line in lines:
-                if line.strip() == '':
-                    md_lines.append("")  # Пустая строка
-                else:
-                    md_lines.append(f"> {line}")
-            md_lines.append("")  # Отступ между моделями
-
-        # 🔥 Здесь определяем md_text
-        md_text = "\n".join(md_lines)
-
-        # Используем библиотеку markdown
-        import markdown
-        html = markdown.markdown(md_text, extensions=[
-            'fenced_code',
-            'tables',
-            'codehilite'  # ← подсветка синтаксиса
-        ])
-
-        # Добавляем стили и обёртку
-        theme = self.db.get_setting("theme", "light")
-        
-        if theme == "dark":
-            bg = "#2b2b2b"
-            text = "#ffffff"
-            code_bg = "#1e1e1e"
-            code_color = "#dcdcdc"
-            blockquote_bg = "#3c3c3c"
-            blockquote_border = "#007acc"
-            heading = "#00aaff"
-            link = "#64b5f6"
+        # Текст из БД читает поток отрисовки: он же заново отрисует результат, если тот изменился
+        cached = self.preview_cache.latest(result_id, self.current_theme)
+        if cached is not None:
+            self._preview_shown, html = cached
+            self.preview_text.setHtml(html)
         else:
-            bg = "#ffffff"
-            text = "#333333"
-            code_bg = "#f5f5f5"
-            code_color = "#000000"
-            blockquote_bg = "#f9f9f9"
-            blockquote_border = "#ccc"
-            heading = "#007acc"
-            link = "#1976d2"
-
-        styled_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <style>
-                body, html {{
-                    margin: 0;
-                    padding: 20px;
-                    background: {bg};
-                    color: {text};
-                    font-family: 'Segoe UI', Arial, sans-serif;
-                    line-height: 1.6;
-                    font-size: 14px;
-                }}
-                h1, h2, h3 {{
-                    color: {heading};
-                    border-bottom: 1px solid {blockquote_border};
-                    padding-bottom: 5px;
-                }}
-                a {{
-                    color: {link};
-                    text-decoration: none;
-                }}
-                a:hover {{
-                    text-decoration: underline;
-                }}
-                code {{
-                    font-family: 'Consolas', 'Courier New', monospace;
-                    background: {code_bg};
-                    color: {code_color};
-                    padding: 2px 6px;
-                    border-radius: 3px;
-                    font-size: 0.9em;
-                }}
-                pre {{
-                    background: {code_bg};
-                    color: {code_color};
-                    padding: 15px;
-                    border-radius: 6px;
-                    overflow: auto;
-                    margin: 10px 0;
-                    border: 1px solid {blockquote_border};
-                }}
-                pre code {{
-                    background: none;
-                    color: inherit;
-                    padding: 0;
-                    font-size: inherit;
-                }}
-                blockquote {{
-                    background: {blockquote_bg};
-                    border-left: 4px solid {blockquote_border};
-                    margin: 15px 0;
-                    padding: 12px 15px;
-                    font-style: italic;
-                    border-radius: 0 4px 4px 0;
-                }}
-                ul, ol {{
-                    margin: 10px 0;
-                    padding-left: 25px;
-                }}
-                table {{
-                    border-collapse: collapse;
-                    width: 100%;
-                    margin: 15px 0;
-                }}
-                table th, table td {{
-                    border: 1px solid {blockquote_border};
-                    padding: 8px;
-                    text-align: left;
-                }}
-                table th {{
-                    background: {blockquote_bg};
-                    color: {heading};
-                }}
-            </style>
-        </head>
-        <body>
-            {html}
-        </body>
-        </html>
-        """
-        self.preview_text.setHtml(styled_html)
+            self._preview_shown = None
+            self.preview_text.setHtml("<p><i>⏳ Формирование предпросмотра...</i></p>")
+        self.preview_renderer.render(result_id, self.current_theme)
+
+        # Соседние строки отрисуем заранее — их, скорее всего, откроют следующими
+        for neighbour in (row + 1, row - 1):
+            item = self.preview_table.item(neighbour, 0) if neighbour >= 0 else None
+            if item is not None:
+                self.preview_renderer.prefetch(int(item.text()), self.current_theme)
+
+    def _on_preview_rendered(self, key, html: str):
+        """Фоновая отрисовка готова — показываем, если пользователь всё ещё ждёт этот результат"""
+        if key[:2] == self._preview_key and key != self._preview_shown:
+            self._preview_shown = key
+            self.preview_text.setHtml(html)
 
     def escape_html(self, text: str) -> str:
         """Экранирует HTML-символы"""
@@ -1209,52 +1172,33 @@ class ChatListApp(QMainWindow):
         return ''.join(html_lines)
 
     def on_search(self):
-        """Поиск в промтах"""
+        """Поиск в промтах: уже загруженные строки фильтруются сразу, запрос к БД — после паузы в наборе"""
         query = self.search_input.text().strip()
-        if not query:
-            self.load_prompts()
+        self.prompts_proxy.set_filter_text(query)
+        if query:
+            self.search_timer.start()
             return
 
-        self.prompts_table.setRowCount(0)
-        results = self.db.search_prompts(query)
-        for row_idx, p in enumerate(results):
-            self.prompts_table.insertRow(row_idx)
-            self.prompts_table.setItem(row_idx, 0, QTableWidgetItem(str(p["id"])))
-            self.prompts_table.setItem(row_idx, 1, QTableWidgetItem(p["created_at"]))
-            self.prompts_table.setItem(row_idx, 2, QTableWidgetItem(p["prompt"]))
-            self.prompts_table.setItem(row_idx, 3, QTableWidgetItem(p["tags"] or ""))
+        # Поле очищено — отменяем поиск и возвращаем историю
+        self.search_timer.stop()
+        self._search_generation = self.search_worker.cancel()
+        if self._search_active:
+            self._search_active = False
+            self.load_prompts()
 
-            # Контейнер для кнопок
-            btn_widget = QWidget()
-            btn_layout = QHBoxLayout(btn_widget)
-            btn_layout.setContentsMargins(4, 2, 4, 2)
-            btn_layout.setSpacing(6)
-            btn_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
-
-            # Создаём кнопки
-            copy_btn = QPushButton("📋 Копировать")
-            copy_btn.setFixedSize(90, 26)
-
-            delete_btn = QPushButton("🗑️ Удалить")
-            delete_btn.setFixedSize(90, 26)
-            delete_btn.setStyleSheet("QPushButton { color: #a00; }")
-
-            # Сохраняем ссылки на кнопки внутри виджета, чтобы Python не удалил
-            btn_widget.copy_btn = copy_btn
-            btn_widget.delete_btn = delete_btn
-
-            # Подключаем сигналы
-            from functools import partial
-            copy_btn.clicked.connect(partial(self.copy_prompt_to_input, p["prompt"]))
-            delete_btn.clicked.connect(partial(self.delete_prompt_by_id, p["id"]))
-
-            # Добавляем в макет
-            btn_layout.addWidget(copy_btn)
-            btn_layout.addWidget(delete_btn)
-            btn_widget.setLayout(btn_layout)
+    def _run_search(self):
+        """Отправляет запрос в SearchWorker (по таймеру после ввода)"""
+        query = self.search_input.text().strip()
+        if query:
+            self._search_generation = self.search_worker.search(query)
 
-            # Устанавливаем в таблицу
-            self.prompts_table.setCellWidget(row_idx, 4, btn_widget)
+    def _on_search_results(self, generation: int, query: str, rows: list):
+        """Показывает выдачу поиска, меняя в таблице только отличающиеся строки"""
+        if generation != self._search_generation:
+            return  # Пока искали, запрос уже сменился
+        self._search_active = True
+        self.prompts_model.sync_rows(rows)  # Порядок строк — по релевантности
+        self.statusBar().showMessage(f"Найдено промтов: {len(rows)}", 3000)
 
     def copy_prompt_to_input(self, text):
         """Копирует переданный текст промта в поле ввода"""
@@ -1264,19 +1208,12 @@ class ChatListApp(QMainWindow):
     def delete_prompt_by_id(self, prompt_id: int):
         """Удаляет промт по ID через db.delete_prompt"""
         # Сначала получим текст промта для отображения в предупреждении
-        try:
-            # Получаем промт из БД
-            prompt_row = self.db.cursor.execute(
-                "SELECT prompt FROM prompts WHERE id = ?", (prompt_id,)
-            ).fetchone()
-
-            if not prompt_row:
-                QMessageBox.warning(self, "Ошибка", "Промт не найден.")
-                return
+        prompt_row = self.db.get_prompt(prompt_id)
+        if not prompt_row:
+            QMessageBox.warning(self, "Ошибка", "Промт не найден.")
+            return
 
-            prompt_text = prompt_row["prompt"][:50] + "..." if len(prompt_row["prompt"]) > 50 else prompt_row["prompt"]
-        except Exception as e:
-            prompt_text = str(prompt_id)
+        prompt_text = prompt_row["prompt"][:50] + "..." if len(prompt_row["prompt"]) > 50 else prompt_row["prompt"]
 
         # Диалог подтверждения
         reply = QMessageBox.question(
@@ -1290,8 +1227,8 @@ class ChatListApp(QMainWindow):
                 # Удаляем через db.py
                 self.db.delete_prompt(prompt_id)  # ✅ Вызов метода из db.py
 
-                # Обновляем таблицу
-                self.load_prompts()
+                # Убираем строку из таблицы
+                self.prompts_model.remove_prompt(prompt_id)
 
                 # Уведомление
                 QMessageBox.information(self, "Успешно", "Промт удалён из базы")
@@ -1301,21 +1238,25 @@ class ChatListApp(QMainWindow):
         
     def load_prompt_to_input(self):
         """Загружает выбранный промт в поле ввода"""
-        selected = self.prompts_table.currentRow()
-        if selected >= 0:
-            prompt_item = self.prompts_table.item(selected, 2)
-            if prompt_item:
-                self.prompt_input.setPlainText(prompt_item.text())
+        index = self.prompts_table.currentIndex()
+        if index.isValid():
+            self.prompt_input.setPlainText(index.data(ROW_ROLE)["prompt"])
 
     def send_prompt(self):
-        """Отправляет промт в модели по одной через QTimer для плавного прогресса"""
+        """Отправляет промт во все активные модели параллельно, ответы появляются по мере готовности"""
         prompt = self.prompt_input.toPlainText().strip()
         if not prompt:
             QMessageBox.warning(self, "Внимание", "Введите промт!")
             return
 
+        if self.dispatcher is not None and self.dispatcher.isRunning():
+            QMessageBox.information(self, "Подождите", "Предыдущий запрос ещё выполняется.")
+            return
+
         # Сохраняем промт
+        self.sent_prompt = prompt
         prompt_id = self.db.save_prompt(prompt)
+        self.add_prompt_to_table(prompt_id)
 
         # Очищаем результаты
         self.clear_results()
@@ -1326,88 +1267,89 @@ class ChatListApp(QMainWindow):
             QMessageBox.warning(self, "Ошибка", "Нет активных моделей.")
             return
 
-        # Подготавливаем таблицу
-        self.results_table.setRowCount(len(self.models_to_send))
-        self.temp_results.clear()
+        # Подготавливаем таблицу: строки заполняются по мере прихода ответов
+        self.results_model.reset_rows([
+            ResultsTableModel.make_row(model["id"], model["name"], pending=True)
+            for model in self.models_to_send
+        ])
 
         # Настройка прогресс-бара
         self.progress_bar.setRange(0, len(self.models_to_send))
         self.progress_bar.setValue(0)
         self.progress_bar.show()
-        self.statusBar().showMessage("Отправка запросов...")
-
-        # Запускаем первую итерацию
-        self.current_model_index = 0
-        self.prompt_for_sending = prompt
-        self._send_next_model()
-
-    def _send_next_model(self):
-        """Отправляет промт следующей модели"""
-        if self.current_model_index >= len(self.models_to_send):
-            # Завершено
-            self.statusBar().showMessage("Готово!", 3000)
-            QTimer.singleShot(800, self.progress_bar.hide)
-            QTimer.singleShot(100, self.resize_all_rows)
-            return
-
-        model = self.models_to_send[self.current_model_index]
-        row_idx = self.current_model_index
-
-        self.statusBar().showMessage(f"Запрос: {model['name']}")
-
-        # Отправляем запрос
-        response = self.network.send_prompt_to_model(model, self.prompt_for_sending)
-
+        self.statusBar().showMessage(f"Отправка запросов в {len(self.models_to_send)} моделей...")
+        self.send_btn.setEnabled(False)
+
+        # Запускаем параллельную рассылку в фоне
+        max_workers = int(self.db.get_setting("max_parallel_requests", str(DEFAULT_MAX_WORKERS)))
+        stream = self.db.get_setting("stream_responses", "0") == "1"
+        deadline = int(self.db.get_setting("run_deadline", str(DEFAULT_RUN_DEADLINE_SEC)))
+        # Лимит рассылки действует внутри дневного бюджета
+        run_budget = BudgetGuard(float(self.db.get_setting("budget_run", "0")), parent=Network.budget(),
+                                 name="бюджет рассылки")
+        self.dispatcher = PromptDispatcher(self.models_to_send, prompt, max_workers,
+                                           stream=stream, cache=self.response_cache,
+                                           bypass_cache=self.bypass_cache_check.isChecked(),
+                                           deadline=deadline or None, budget=run_budget, parent=self)
+        self.dispatcher.token_received.connect(self._on_model_token)
+        self.dispatcher.result_ready.connect(self._on_model_response)
+        self.dispatcher.finished.connect(self._on_send_finished)
+        self.dispatcher.start()
+        self.stop_btn.setEnabled(True)
+
+    def stop_sending(self):
+        """Прерывает текущую рассылку, не дожидаясь медленных моделей"""
+        if self.dispatcher is not None and self.dispatcher.isRunning():
+            self.dispatcher.cancel()
+            self.stop_btn.setEnabled(False)
+            self.statusBar().showMessage("Рассылка прерывается...")
+
+    def _on_model_token(self, row_idx: int, chunk: str):
+        """Дописывает очередной фрагмент потокового ответа в ячейку"""
+        if not self.results_model.row(row_idx)["pending"]:
+            return  # Ответ уже получен целиком
+        self.results_model.append_text(row_idx, chunk)
+
+    def _on_model_response(self, row_idx: int, model: dict, response: str, info: dict):
+        """Заполняет строку таблицы ответом модели (вызывается из сигнала PromptDispatcher)"""
         print(f"[DEBUG] {model['name']}: {repr(response[:100] if response else None)}")
 
+        cancelled = info.get("cancelled", False)
+        partial = self.results_model.row(row_idx)["response"].strip()
+
         # Нормализуем ответ
-        if not response or not response.strip():
+        if cancelled and partial:
+            # Отменён на середине потока — оставляем то, что успело прийти
+            response, is_error = partial, False
+        elif not response or not response.strip():
             response = f"[Ошибка] Пустой ответ от {model['name']}"
+            is_error = True
         else:
             response = response.strip()
+            is_error = Network.is_error_response(response)
 
-        # Заполняем строку
-        item = QTableWidgetItem(model["name"])
-        item.setTextAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
-        self.results_table.setItem(row_idx, 0, item)
-
-        label = QLabel(response)
-        label.setWordWrap(True)
-        label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
-        label.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
-        label.setOpenExternalLinks(True)  # ✅ Кликабельные ссылки
-        
-        if "❌" in response or "Ошибка" in response or "402" in response:
-            label.setText(f"<b style='color: #a00;'>{response}</b>")
-        else:
-            label.setText(response)
-
-        scroll = QScrollArea()
-        scroll.setWidget(label)
-        scroll.setWidgetResizable(True)
-        scroll.setMaximumHeight(200)
-        scroll.setMinimumHeight(60)
-        self.results_table.setCellWidget(row_idx, 1, scroll)
-
-        checkbox = QCheckBox()
-        checkbox_widget = QWidget()
-        layout = QHBoxLayout(checkbox_widget)
-        layout.addWidget(checkbox)
-        layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        layout.setContentsMargins(0, 0, 0, 0)
-        checkbox_widget.setLayout(layout)
-        self.results_table.setCellWidget(row_idx, 2, checkbox_widget)
-
-        self.temp_results[row_idx] = (model["id"], response, checkbox)
+        self.results_model.set_response(row_idx, response, is_error=is_error,
+                                        attempts=info.get("attempts", 1), cancelled=cancelled,
+                                        usage=info.get("usage"), cost=info.get("cost"))
 
         # Обновляем прогресс
-        self.progress_bar.setValue(self.current_model_index + 1)
-
-        # Следующая модель — в следующем цикле обработки событий
-        self.current_model_index += 1
-        QTimer.singleShot(50, self._send_next_model)  # ← Делает интерфейс отзывчивым
-
-
+        done = self.results_model.completed_count()
+        self.progress_bar.setValue(done)
+        self.statusBar().showMessage(f"Получен ответ: {model['name']} ({done}/{len(self.models_to_send)})")
+
+    def _on_send_finished(self):
+        """Все модели ответили (или рассылка прервана)"""
+        stats = self.response_cache.stats()
+        cancelled = self.results_model.cancelled_count()
+        cancelled_text = f", прервано: {cancelled}" if cancelled else ""
+        spent = self.dispatcher.budget.spent if self.dispatcher.budget is not None else 0.0
+        cost_text = f" 💰 {spent:.2f} ₽ (сегодня {Network.budget().spent:.2f} ₽)." if spent else ""
+        self.statusBar().showMessage(
+            f"Готово{cancelled_text}!{cost_text} Кэш: попаданий {stats['hits']}, промахов {stats['misses']}", 5000
+        )
+        self.send_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
+        QTimer.singleShot(800, self.progress_bar.hide)
 
     def save_selected(self):
         """Сохраняет выбранные результаты в БД"""
@@ -1417,82 +1359,28 @@ class ChatListApp(QMainWindow):
 
         # Сохраняем промт (если ещё не сохранён)
         prompt_id = self.db.save_prompt(prompt_text)
+        self.add_prompt_to_table(prompt_id)
 
-        saved_count = 0
-        for row_idx, (model_id, response, checkbox) in self.temp_results.items():
-            if checkbox.isChecked():
-                self.db.save_result(prompt_id, model_id, response)
-                saved_count += 1
+        # Все отмеченные ответы — одной транзакцией
+        rows = [
+            (prompt_id, row["model_id"], row["response"], dict(row["usage"], cost=row["cost"]))
+            for row in self.results_model.checked_rows()
+            if not row["saved"]
+        ]
+        try:
+            saved_count = len(self.db.save_results(rows))
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить ответы:\n{e}")
+            return
 
         if saved_count > 0:
             QMessageBox.information(self, "Готово", f"Сохранено {saved_count} ответов!")
         else:
             QMessageBox.information(self, "Внимание", "Ничего не выбрано.")
     
-    def export_to_markdown(self):
-        """Экспортирует выбранные ответы в Markdown-файл"""
-        if not self.temp_results:
-            QMessageBox.warning(self, "Экспорт", "Нет результатов для экспорта.")
-            return
-
-        # Собираем выбранные чекбоксы
-        selected_responses = []
-        for row_idx, (model_id, response, checkbox) in self.temp_results.items():
-            if checkbox.isChecked():
-                model_name = self.results_table.item(row_idx, 0).text()
-                selected_responses.append((model_name, response))
-
-        if not selected_responses:
-            QMessageBox.warning(self, "Экспорт", "Ничего не выбрано для экспорта.")
-            return
-
-        # Диалог выбора файла
-        file_path, _ = QFileDialog.getSaveFileName(
-            self,
-            "Сохранить как",
-            "results.md",
-            "Markdown Files (*.md);;Text Files (*.txt)"
-        )
-
-        if not file_path:
-            return  # Отменили
-
-        try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write("# Результаты ChatList\n\n")
-                f.write(f"**Дата:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                f.write("---\n\n")
-
-                for model_name, response in selected_responses:
-                    f.write(f"## Модель: {model_name}\n\n")
-                    f.write(f"> {response.replace(chr(10), '  \n> ')}\n\n")
-                    f.write("---\n\n")
-
-            QMessageBox.information(self, "Готово", f"Результаты экспортированы в:\n{file_path}")
-
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл:\n{str(e)}")
-
     def clear_results(self):
-        """Очищает таблицу результатов и удаляет виджеты"""
-        # Очищаем все ячейки с виджетами
-        for row in range(self.results_table.rowCount()):
-            for col in range(self.results_table.columnCount()):
-                widget = self.results_table.cellWidget(row, col)
-                if widget:
-                    widget.deleteLater()
-
-        # Очищаем содержимое и количество строк
-        self.results_table.clearContents()
-        self.results_table.setRowCount(0)
-        self.temp_results.clear()
-
-    def resize_all_rows(self):
-        """Подстраивает высоту всех строк под содержимое"""
-        for row in range(self.results_table.rowCount()):
-            self.results_table.resizeRowToContents(row)
-        # Принудительно обновляем отображение
-        self.results_table.viewport().update()
+        """Очищает таблицу результатов"""
+        self.results_model.clear()
 
     #============= ВКЛАДКА 5: Настройки =============
     def create_settings_tab(self):
@@ -1508,7 +1396,7 @@ class ChatListApp(QMainWindow):
         # Таблица настроек
         self.settings_table = QTableWidget()
         self.settings_table.setColumnCount(2)
-        self.settings_table.setRowCount(2)
+        self.settings_table.setRowCount(9)
         self.settings_table.setHorizontalHeaderLabels(["Параметр", "Значение"])
         self.settings_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.settings_table.verticalHeader().setVisible(False)
@@ -1536,6 +1424,70 @@ class ChatListApp(QMainWindow):
         self.settings_table.setItem(1, 0, font_label)
         self.settings_table.setCellWidget(1, 1, self.font_spin)
 
+        # 3. Число параллельных запросов
+        workers_label = QTableWidgetItem("Параллельных запросов")
+        workers_label.setFlags(workers_label.flags() ^ Qt.ItemFlag.ItemIsEditable)
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 32)
+        self.workers_spin.setValue(int(self.db.get_setting("max_parallel_requests", DEFAULT_MAX_WORKERS)))
+        self.workers_spin.valueChanged.connect(self.on_max_workers_changed)
+
+        self.settings_table.setItem(2, 0, workers_label)
+        self.settings_table.setCellWidget(2, 1, self.workers_spin)
+
+        # 4. Потоковый вывод ответов
+        stream_label = QTableWidgetItem("Потоковый вывод ответов")
+        stream_label.setFlags(stream_label.flags() ^ Qt.ItemFlag.ItemIsEditable)
+        self.stream_check = QCheckBox()
+        self.stream_check.setChecked(self.db.get_setting("stream_responses", "0") == "1")
+        self.stream_check.toggled.connect(self.on_stream_toggled)
+
+        self.settings_table.setItem(3, 0, stream_label)
+        self.settings_table.setCellWidget(3, 1, self.stream_check)
+
+        # 5. Кэш ответов
+        cache_label = QTableWidgetItem("Кэш ответов")
+        cache_label.setFlags(cache_label.flags() ^ Qt.ItemFlag.ItemIsEditable)
+        clear_cache_btn = QPushButton("🗑️ Очистить кэш")
+        clear_cache_btn.clicked.connect(self.on_clear_cache)
+
+        self.settings_table.setItem(4, 0, cache_label)
+        self.settings_table.setCellWidget(4, 1, clear_cache_btn)
+
+        # 6. Сколько ждать ответа AI-ассистента
+        enhance_label = QTableWidgetItem("Таймаут улучшения промта (сек)")
+        enhance_label.setFlags(enhance_label.flags() ^ Qt.ItemFlag.ItemIsEditable)
+        self.enhance_timeout_spin = QSpinBox()
+        self.enhance_timeout_spin.setRange(10, 600)
+        self.enhance_timeout_spin.setValue(int(self.db.get_setting("enhance_timeout", ENHANCE_TIMEOUT_SEC)))
+        self.enhance_timeout_spin.valueChanged.connect(self.on_enhance_timeout_changed)
+
+        self.settings_table.setItem(5, 0, enhance_label)
+        self.settings_table.setCellWidget(5, 1, self.enhance_timeout_spin)
+
+        # 7. Общее ограничение времени рассылки
+        deadline_label = QTableWidgetItem("Ограничение времени рассылки (сек, 0 — нет)")
+        deadline_label.setFlags(deadline_label.flags() ^ Qt.ItemFlag.ItemIsEditable)
+        self.run_deadline_spin = QSpinBox()
+        self.run_deadline_spin.setRange(0, 3600)
+        self.run_deadline_spin.setValue(int(self.db.get_setting("run_deadline", DEFAULT_RUN_DEADLINE_SEC)))
+        self.run_deadline_spin.valueChanged.connect(self.on_run_deadline_changed)
+
+        self.settings_table.setItem(6, 0, deadline_label)
+        self.settings_table.setCellWidget(6, 1, self.run_deadline_spin)
+
+        # 8–9. Лимиты расходов (по ценам моделей из редактора моделей)
+        self.budget_daily_spin = self._create_budget_spin("budget_daily", self.on_budget_daily_changed)
+        self.budget_run_spin = self._create_budget_spin("budget_run", self.on_budget_run_changed)
+        for row, (text, spin) in enumerate([
+            ("Дневной бюджет (₽, 0 — нет)", self.budget_daily_spin),
+            ("Бюджет одной рассылки (₽, 0 — нет)", self.budget_run_spin),
+        ], start=7):
+            label = QTableWidgetItem(text)
+            label.setFlags(label.flags() ^ Qt.ItemFlag.ItemIsEditable)
+            self.settings_table.setItem(row, 0, label)
+            self.settings_table.setCellWidget(row, 1, spin)
+
         layout.addWidget(self.settings_table)
         layout.addStretch()
         tab.setLayout(layout)
@@ -1544,13 +1496,54 @@ class ChatListApp(QMainWindow):
     def on_theme_changed(self, theme: str):
         """Смена темы"""
         self.db.set_setting("theme", theme)
+        self.current_theme = theme
         apply_theme(self, theme)
+        self.update_preview_on_theme_change()
 
     def on_font_size_changed(self, size: int):
         """Изменение размера шрифта"""
         self.db.set_setting("font_size", str(size))
         self.apply_font_size(size)
 
+    def on_max_workers_changed(self, value: int):
+        """Изменение числа одновременных запросов к моделям"""
+        self.db.set_setting("max_parallel_requests", str(value))
+
+    def _create_budget_spin(self, key: str, handler) -> QDoubleSpinBox:
+        spin = QDoubleSpinBox()
+        spin.setRange(0, 1_000_000)
+        spin.setDecimals(2)
+        spin.setSuffix(" ₽")
+        spin.setValue(float(self.db.get_setting(key, "0")))
+        spin.valueChanged.connect(handler)
+        return spin
+
+    def on_budget_daily_changed(self, value: float):
+        """Изменение дневного бюджета — действует сразу, в том числе на идущую рассылку"""
+        self.db.set_setting("budget_daily", str(value))
+        Network.budget().set_limit(value)
+
+    def on_budget_run_changed(self, value: float):
+        """Изменение бюджета рассылки — со следующей рассылки"""
+        self.db.set_setting("budget_run", str(value))
+
+    def on_run_deadline_changed(self, value: int):
+        """Изменение общего ограничения времени рассылки"""
+        self.db.set_setting("run_deadline", str(value))
+
+    def on_enhance_timeout_changed(self, value: int):
+        """Изменение времени ожидания ответа AI-ассистента"""
+        self.db.set_setting("enhance_timeout", str(value))
+
+    def on_clear_cache(self):
+        """Очищает кэш ответов моделей"""
+        self.response_cache.clear()
+        self.statusBar().showMessage("Кэш ответов очищен", 3000)
+
+    def on_stream_toggled(self, checked: bool):
+        """Включает/выключает потоковый (SSE) вывод ответов"""
+        self.db.set_setting("stream_responses", "1" if checked else "0")
+
     def apply_font_size(self, size: int):
         """Применяет шрифт ко всему приложению"""
         font = get_font(size)
@@ -1767,6 +1760,23 @@ class ChatListApp(QMainWindow):
         reply = QMessageBox.question(self, 'Выход', 'Закрыть приложение?',
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
+            # Прерываем фоновую рассылку и ждём её потока, иначе он будет уничтожен на ходу
+            if self.dispatcher is not None and self.dispatcher.isRunning():
+                self.dispatcher.cancel()
+                self.dispatcher.wait()
+            if self.enhance_worker is not None and self.enhance_worker.isRunning():
+                self.enhance_worker.cancel()
+                self.enhance_worker.wait()
+            self.search_worker.stop()
+            self.preview_renderer.stop()
+            if self.export_worker is not None and self.export_worker.isRunning():
+                self.export_worker.cancel()
+                self.export_worker.wait()
+            Network.configure_metrics(None)
+            self.metrics_writer.close()
+            self.response_cache.close()
+            Network.close_sessions()
+            self.db.close()
             event.accept()
         else:
             event.ignore()    
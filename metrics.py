@@ -0,0 +1,233 @@
+# metrics.py
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+# Замеры текущего запроса к модели — у каждого потока свои
+_local = threading.local()
+
+
+class RequestMetrics:
+    """
+    Замеры одного вызова Network.send_prompt_to_model — строка таблицы request_metrics.
+
+    Время в миллисекундах:
+    - queue_ms — ожидание очереди к провайдеру (RateLimiter);
+    - dns_ms, connect_ms — разрешение имени и TCP+TLS для новых соединений
+      (0, если запрос ушёл по уже открытому keep-alive соединению);
+    - ttfb_ms — от отправки запроса до заголовков ответа (последняя попытка);
+    - total_ms — от начала отправки до последнего байта ответа, со всеми повторами.
+    """
+
+    def __init__(self, model_data: dict, stream: bool = False):
+        self.model_id = model_data.get("id")
+        self.provider = (model_data.get("provider") or "").lower()
+        self.stream = stream
+        self.started_at = time.time()
+        self._created = time.perf_counter()
+        self._sent = None
+        self.queue_ms = 0.0
+        self.dns_ms = 0.0
+        self.connect_ms = 0.0
+        self.ttfb_ms = None
+        self.total_ms = None
+        self.status = None
+        self.ok = False
+        self.attempts = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.usage = {}
+        self.cost = None
+        self.cancelled = False
+        self._attempt_handshake_ms = 0.0
+        self._response = None
+
+    def start_sending(self):
+        """Очередь пройдена — дальше время уходит на сам запрос"""
+        self._sent = time.perf_counter()
+        self.queue_ms = (self._sent - self._created) * 1000
+
+    def begin_attempt(self):
+        self._attempt_handshake_ms = 0.0
+
+    def add_connection(self, dns_ms: float, connect_ms: float):
+        """Открыто новое соединение"""
+        self.dns_ms += dns_ms
+        self.connect_ms += connect_ms
+        self._attempt_handshake_ms += dns_ms + connect_ms
+
+    def observe(self, response: requests.Response):
+        """Получены заголовки ответа (очередная попытка)"""
+        self.status = response.status_code
+        # elapsed у requests включает установку соединения — её вычитаем
+        self.ttfb_ms = max(0.0, response.elapsed.total_seconds() * 1000 - self._attempt_handshake_ms)
+        self.request_bytes += len(response.request.body or b"")
+        self._response = response
+
+    def set_usage(self, usage: Optional[dict]):
+        """Блок usage из ответа провайдера (OpenAI: prompt_tokens..., Yandex: inputTextTokens...)"""
+        parsed = parse_usage(usage)
+        if parsed:
+            self.usage = parsed
+
+    def finish(self, ok: bool, attempts: int):
+        now = time.perf_counter()
+        self.total_ms = (now - (self._sent or self._created)) * 1000
+        self.ok = ok
+        self.attempts = attempts
+        if self._response is not None:
+            # tell() не считает тело в chunked-ответах — там остаётся счёт по строкам потока
+            try:
+                self.response_bytes = max(self.response_bytes, self._response.raw.tell())
+            except Exception:
+                pass
+            self._response = None
+
+    def to_row(self) -> dict:
+        """Строка для Database.save_request_metrics"""
+        return {
+            "started_at": self.started_at,
+            "model_id": self.model_id,
+            "provider": self.provider,
+            "stream": int(self.stream),
+            "status": self.status,
+            "ok": int(self.ok),
+            "attempts": self.attempts,
+            "queue_ms": round(self.queue_ms, 2),
+            "dns_ms": round(self.dns_ms, 2),
+            "connect_ms": round(self.connect_ms, 2),
+            "ttfb_ms": None if self.ttfb_ms is None else round(self.ttfb_ms, 2),
+            "total_ms": round(self.total_ms, 2),
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "prompt_tokens": self.usage.get("prompt_tokens"),
+            "completion_tokens": self.usage.get("completion_tokens"),
+            "total_tokens": self.usage.get("total_tokens"),
+            "cost": self.cost,
+            "cancelled": int(self.cancelled),
+        }
+
+
+def parse_usage(usage: Optional[dict]) -> dict:
+    """Приводит usage разных провайдеров к {prompt_tokens, completion_tokens, total_tokens}"""
+    if not isinstance(usage, dict):
+        return {}
+    fields = {
+        "prompt_tokens": usage.get("prompt_tokens", usage.get("inputTextTokens")),
+        "completion_tokens": usage.get("completion_tokens", usage.get("completionTokens")),
+        "total_tokens": usage.get("total_tokens", usage.get("totalTokens")),
+    }
+    parsed = {}
+    for key, value in fields.items():
+        try:
+            parsed[key] = int(value)  # Yandex присылает числа строками
+        except (TypeError, ValueError):
+            pass
+    if "total_tokens" not in parsed and "prompt_tokens" in parsed and "completion_tokens" in parsed:
+        parsed["total_tokens"] = parsed["prompt_tokens"] + parsed["completion_tokens"]
+    return parsed
+
+
+@contextmanager
+def collect_metrics(metrics: RequestMetrics):
+    """Делает metrics текущими замерами потока: HTTP-слой пишет в них время соединения"""
+    previous = getattr(_local, "metrics", None)
+    _local.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _local.metrics = previous
+
+
+def current_metrics() -> Optional[RequestMetrics]:
+    """Замеры запроса, который выполняется в этом потоке (None — замеры не ведутся)"""
+    return getattr(_local, "metrics", None)
+
+
+def record_stream_line(line: str):
+    """Учитывает строку потокового ответа в response_bytes"""
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.response_bytes += len(line.encode("utf-8")) + 1
+
+
+def record_usage(usage: Optional[dict]):
+    """Записывает usage ответа в текущие замеры (если они ведутся)"""
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.set_usage(usage)
+
+
+# === Замер DNS и установки соединения на уровне urllib3 ===
+class _TimedConnectionMixin:
+    """Разрешает имя отдельно, чтобы DNS и TCP/TLS измерялись по отдельности"""
+
+    def connect(self):
+        metrics = current_metrics()
+        if metrics is None:
+            return super().connect()
+        self._dns_ms = 0.0
+        started = time.perf_counter()
+        super().connect()
+        total_ms = (time.perf_counter() - started) * 1000
+        metrics.add_connection(self._dns_ms, total_ms - self._dns_ms)
+
+    def _new_conn(self) -> socket.socket:
+        if current_metrics() is None:
+            return super()._new_conn()
+        host = self._dns_host
+        started = time.perf_counter()
+        try:
+            addresses = [info[4][0] for info in
+                         socket.getaddrinfo(host, self.port, allowed_gai_family(), socket.SOCK_STREAM)]
+        except OSError:
+            return super()._new_conn()  # ошибку разрешения имени оформит urllib3
+        self._dns_ms = (time.perf_counter() - started) * 1000
+
+        # Подключаемся уже по адресам — без второго обращения к DNS
+        try:
+            for i, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except NewConnectionError:
+                    if i == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter, соединения которого отчитываются о DNS и connect в текущие замеры"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
@@ -0,0 +1,355 @@
+# mock_server.py
+"""
+Локальная замена провайдеров для нагрузочного тестирования Network без интернета.
+
+Говорит на тех же форматах, что и network.py:
+- OpenAI-совместимый  POST .../chat/completions (Bearer-ключ, SSE при stream=true);
+- GigaChat            POST /api/v2/oauth → access_token, POST /api/v1/chat/completions;
+- Yandex GPT          POST /iam/v1/tokens → iamToken, POST /foundationModels/v1/completion
+                      (при stream=true — JSON-объекты построчно, в каждом весь текст на текущий момент).
+
+Задержка ответа выбирается из распределения (--latency-dist), часть запросов
+получает 500/503, 429 с Retry-After или 402 (--error-rate, --throttle-rate, --payment-rate).
+
+Запуск:  python mock_server.py --port 8900 --latency 300 --latency-dist lognormal --throttle-rate 0.05
+Приложение направляется на сервер переменными окружения (печатаются при старте).
+Только стандартная библиотека — сервер можно запускать где угодно.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8900
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+# Пути, на которые отвечает сервер
+GIGACHAT_AUTH_PATH = "/api/v2/oauth"
+GIGACHAT_CHAT_PATH = "/api/v1/chat/completions"
+YANDEX_IAM_PATH = "/iam/v1/tokens"
+YANDEX_COMPLETION_PATH = "/foundationModels/v1/completion"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный мок-сервер OpenAI / GigaChat / Yandex GPT")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 — любой свободный")
+    parser.add_argument("--latency", type=float, default=200, help="средняя задержка ответа, мс")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal",
+                        help="распределение задержки (uniform — от 0 до 2×latency)")
+    parser.add_argument("--sigma", type=float, default=0.6, help="разброс для lognormal (длинный хвост)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500/503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After в ответах 429, с")
+    parser.add_argument("--payment-rate", type=float, default=0.0, help="доля ответов 402 (нет баланса)")
+    parser.add_argument("--response-tokens", type=int, default=60, help="длина ответа в словах")
+    parser.add_argument("--stream-chunks", type=int, default=10, help="на сколько фрагментов делится поток")
+    parser.add_argument("--chunk-delay", type=float, default=20, help="пауза между фрагментами потока, мс")
+    parser.add_argument("--token-ttl", type=float, default=1800, help="время жизни токенов GigaChat/IAM, с")
+    parser.add_argument("--seed", type=int, help="зерно генератора случайных чисел")
+    return parser.parse_args(argv)
+
+
+def sample_latency(options) -> float:
+    """Задержка одного ответа в секундах"""
+    mean = max(0.0, options.latency) / 1000
+    if mean == 0 or options.latency_dist == "fixed":
+        return mean
+    if options.latency_dist == "uniform":
+        return random.uniform(0, 2 * mean)
+    if options.latency_dist == "exponential":
+        return random.expovariate(1 / mean)
+    # lognormal с тем же средним: mu подбирается под sigma
+    sigma = max(0.0, options.sigma)
+    return random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+
+
+class MockServer(ThreadingHTTPServer):
+    """HTTP-сервер с настройками (options) и счётчиками ответов; можно запускать в фоне (start)"""
+
+    daemon_threads = True
+    # Очередь listen() по умолчанию — 5: при всплеске подключений ядро отбрасывает SYN,
+    # и клиент ждёт повтора секунду — такая задержка была бы ошибкой мока, а не Network
+    request_queue_size = 256
+
+    def __init__(self, options):
+        super().__init__((options.host, options.port), MockHandler)
+        self.options = options
+        self.tokens = {}  # выданные токены GigaChat и IAM → время истечения
+        self.stats = Counter()  # (маршрут, статус) → сколько ответов
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict:
+        """Переменные окружения, которые направляют network.py и config.py на этот сервер"""
+        return {
+            "GIGACHAT_AUTH_URL": self.base_url + GIGACHAT_AUTH_PATH,
+            "GIGACHAT_CHAT_URL": self.base_url + GIGACHAT_CHAT_PATH,
+            "YANDEX_IAM_URL": self.base_url + YANDEX_IAM_PATH,
+            "YANDEX_COMPLETION_URL": self.base_url + YANDEX_COMPLETION_PATH,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # Клиент закрыл keep-alive соединение — обычное дело под нагрузкой, не ошибка
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def issue_token(self) -> tuple:
+        token = uuid.uuid4().hex
+        expires_at = time.time() + self.options.token_ttl
+        with self.lock:
+            self.tokens[token] = expires_at
+        return token, expires_at
+
+    def token_valid(self, token: str) -> bool:
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def count(self, route: str, status: int):
+        with self.lock:
+            self.stats[(route, status)] += 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящих провайдеров
+
+    def log_message(self, format, *args):
+        pass  # лог каждого запроса мешает нагрузочному тесту
+
+    # === Разбор запроса ===
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        path = self.path.split("?", 1)[0]
+
+        if path == GIGACHAT_AUTH_PATH:
+            return self._gigachat_oauth()
+        if path == YANDEX_IAM_PATH:
+            return self._yandex_iam(raw)
+
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"message": "invalid JSON"}}, "bad-request")
+
+        if path == GIGACHAT_CHAT_PATH:
+            route = "gigachat"
+        elif path == YANDEX_COMPLETION_PATH:
+            route = "yandex"
+        elif path.endswith("/chat/completions") or path.rstrip("/").endswith("/v1"):
+            route = "openai"
+        else:
+            return self._send_json(404, {"error": {"message": f"unknown path {path}"}}, "not-found")
+
+        token = (self.headers.get("Authorization") or "").removeprefix("Bearer ").strip()
+        if not token or (route != "openai" and not self.server.token_valid(token)):
+            return self._send_json(401, {"error": {"message": "unauthorized"}}, route)
+
+        time.sleep(sample_latency(self.server.options))
+        if self._maybe_fail(route):
+            return
+
+        stream = body.get("stream") or (body.get("completionOptions") or {}).get("stream")
+        if route == "yandex":
+            prompt = " ".join(m.get("text", "") for m in body.get("messages", []))
+            if stream:
+                return self._yandex_stream(prompt)
+            return self._send_json(200, self._yandex_result(self._answer(prompt), prompt, final=True), route)
+
+        prompt = " ".join(m.get("content", "") for m in body.get("messages", []))
+        if stream:
+            return self._openai_stream(prompt, body.get("model", "mock"), route)
+        answer = self._answer(prompt)
+        return self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                         "finish_reason": "stop"}],
+            "usage": self._usage(prompt, answer),
+        }, route)
+
+    def _maybe_fail(self, route: str) -> bool:
+        """Случайная ошибка по долям из настроек; True — ответ уже отправлен"""
+        options = self.server.options
+        roll = random.random()
+        if roll < options.throttle_rate:
+            self._send_json(429, {"error": {"message": "Too Many Requests"}}, route,
+                            headers={"Retry-After": f"{options.retry_after:g}"})
+            return True
+        roll -= options.throttle_rate
+        if roll < options.error_rate:
+            status = random.choice((500, 503))
+            self._send_json(status, {"error": {"message": "mock server error"}}, route)
+            return True
+        roll -= options.error_rate
+        if roll < options.payment_rate:
+            self._send_json(402, {"error": {"message": "Insufficient balance"}}, route)
+            return True
+        return False
+
+    # === Авторизация ===
+    def _gigachat_oauth(self):
+        if not (self.headers.get("Authorization") or "").startswith("Basic "):
+            return self._send_json(401, {"message": "no credentials"}, "gigachat-oauth")
+        token, expires_at = self.server.issue_token()
+        self._send_json(200, {"access_token": token, "expires_at": int(expires_at * 1000)}, "gigachat-oauth")
+
+    def _yandex_iam(self, raw: bytes):
+        try:
+            oauth = json.loads(raw or b"{}").get("yandexPassportOauthToken")
+        except ValueError:
+            oauth = None
+        if not oauth:
+            return self._send_json(400, {"error": "yandexPassportOauthToken required"}, "yandex-iam")
+        token, expires_at = self.server.issue_token()
+        expires_iso = datetime.fromtimestamp(expires_at, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+        self._send_json(200, {"iamToken": token, "expiresAt": expires_iso}, "yandex-iam")
+
+    # === Ответы ===
+    def _answer(self, prompt: str) -> str:
+        words = max(1, self.server.options.response_tokens)
+        head = f"Ответ мок-сервера на «{prompt[:40]}»."
+        return " ".join([head] + [f"слово{i}" for i in range(words - 1)])
+
+    @staticmethod
+    def _usage(prompt: str, answer: str) -> dict:
+        prompt_tokens, completion_tokens = len(prompt.split()) + 1, len(answer.split())
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _yandex_result(self, text: str, prompt: str, final: bool) -> dict:
+        usage = self._usage(prompt, text)
+        return {"result": {
+            "alternatives": [{
+                "message": {"role": "assistant", "text": text},
+                "status": "ALTERNATIVE_STATUS_FINAL" if final else "ALTERNATIVE_STATUS_PARTIAL",
+            }],
+            # Yandex присылает числа строками
+            "usage": {"inputTextTokens": str(usage["prompt_tokens"]),
+                      "completionTokens": str(usage["completion_tokens"]),
+                      "totalTokens": str(usage["total_tokens"])},
+            "modelVersion": "mock",
+        }}
+
+    def _chunks(self, answer: str) -> list:
+        words = answer.split(" ")
+        count = max(1, min(self.server.options.stream_chunks, len(words)))
+        size = math.ceil(len(words) / count)
+        return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "")
+                for i in range(0, len(words), size)]
+
+    def _openai_stream(self, prompt: str, model: str, route: str):
+        """SSE: data: {choices[0].delta.content}, в последнем фрагменте — usage, затем [DONE]"""
+        answer = self._answer(prompt)
+        self._start_chunked(200, "text/event-stream", route)
+        chunks = self._chunks(answer)
+        for i, chunk in enumerate(chunks):
+            event = {"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": chunk}}]}
+            if i == len(chunks) - 1:
+                event["choices"][0]["finish_reason"] = "stop"
+                event["usage"] = self._usage(prompt, answer)
+            if not self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n"):
+                return
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_chunked()
+
+    def _yandex_stream(self, prompt: str):
+        answer = self._answer(prompt)
+        self._start_chunked(200, "application/json", "yandex")
+        text = ""
+        chunks = self._chunks(answer)
+        for i, chunk in enumerate(chunks):
+            text += chunk
+            line = json.dumps(self._yandex_result(text, prompt, final=i == len(chunks) - 1), ensure_ascii=False)
+            if not self._write_chunk(line + "\n"):
+                return
+        self._end_chunked()
+
+    # === Отправка ===
+    def _send_json(self, status: int, payload: dict, route: str, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.server.count(route, status)
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # клиент ушёл, не дождавшись ответа
+
+    def _start_chunked(self, status: int, content_type: str, route: str):
+        self.server.count(route, status)
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, text: str) -> bool:
+        """Отправляет фрагмент потока; False — клиент закрыл соединение"""
+        data = text.encode("utf-8")
+        try:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            return False
+        time.sleep(self.server.options.chunk_delay / 1000)
+        return True
+
+    def _end_chunked(self):
+        try:
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.seed is not None:
+        random.seed(options.seed)
+    server = MockServer(options)
+    print(f"🧪 Мок-сервер провайдеров: {server.base_url}")
+    print("   OpenAI-совместимые модели: api_url = " + server.base_url + "/v1/chat/completions")
+    print("   Переменные окружения для GigaChat и Yandex GPT:")
+    for name, value in server.env().items():
+        print(f"   {name}={value}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for (route, status), count in sorted(server.stats.items()):
+            print(f"   {route:<16} {status}: {count}")
+
+
+if __name__ == "__main__":
+    main()
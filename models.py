@@ -25,6 +25,35 @@ def get_provider_url(provider: str) -> str:
     }
     return urls.get(provider, "")
 
+def _format_limit(value) -> str:
+    """Лимит для поля ввода: None — пустая строка"""
+    if value is None:
+        return ""
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def _parse_limit(text: str, kind):
+    """Лимит из поля ввода: пусто — None (по умолчанию), иначе положительное число"""
+    text = text.strip().replace(",", ".")
+    if not text:
+        return None
+    value = kind(text)
+    if value <= 0:
+        raise ValueError(text)
+    return value
+
+
+def _parse_price(text: str):
+    """Цена из поля ввода: пусто — None (расходы модели не считаются), иначе число >= 0"""
+    text = text.strip().replace(",", ".")
+    if not text:
+        return None
+    value = float(text)
+    if value < 0:
+        raise ValueError(text)
+    return value
+
+
 class ModelsManager:
     """Редактор моделей с поддержкой БД"""
 
@@ -231,6 +260,28 @@ class ModelsManager:
         provider_input.setPlaceholderText("Polza, gigachat, yandex и т.д.")
         form.addRow("Провайдер:", provider_input)
 
+        # Лимиты запросов: пусто — по умолчанию для провайдера
+        rate_input = QLineEdit(_format_limit(model.get("rate_limit_rps")))
+        rate_input.setPlaceholderText("по умолчанию")
+        rate_input.setToolTip("Запросов в секунду — общий лимит для всех моделей с этим провайдером и ключом")
+        form.addRow("Запросов в секунду:", rate_input)
+
+        concurrency_input = QLineEdit(_format_limit(model.get("max_concurrency")))
+        concurrency_input.setPlaceholderText("по умолчанию")
+        concurrency_input.setToolTip("Сколько запросов к провайдеру (с этим ключом) может идти одновременно")
+        form.addRow("Одновременных запросов:", concurrency_input)
+
+        # Цены: пусто — модель не учитывается в расходах и бюджете
+        input_price_input = QLineEdit(_format_limit(model.get("input_price")))
+        input_price_input.setPlaceholderText("не учитывать")
+        input_price_input.setToolTip("Рублей за 1 млн токенов промта")
+        form.addRow("Цена ввода (₽ за 1M токенов):", input_price_input)
+
+        output_price_input = QLineEdit(_format_limit(model.get("output_price")))
+        output_price_input.setPlaceholderText("не учитывать")
+        output_price_input.setToolTip("Рублей за 1 млн токенов ответа")
+        form.addRow("Цена вывода (₽ за 1M токенов):", output_price_input)
+
         layout.addLayout(form)
 
         # Кнопки
@@ -258,6 +309,18 @@ class ModelsManager:
             if not api_key_var:
                 QMessageBox.warning(dialog, "Ошибка", "API Key Variable обязателен")
                 return
+            try:
+                rate_limit_rps = _parse_limit(rate_input.text(), float)
+                max_concurrency = _parse_limit(concurrency_input.text(), int)
+            except ValueError:
+                QMessageBox.warning(dialog, "Ошибка", "Лимиты должны быть положительными числами (или пустыми)")
+                return
+            try:
+                input_price = _parse_price(input_price_input.text())
+                output_price = _parse_price(output_price_input.text())
+            except ValueError:
+                QMessageBox.warning(dialog, "Ошибка", "Цены должны быть неотрицательными числами (или пустыми)")
+                return
 
             # Обновляем модель
             model.update({
@@ -267,7 +330,11 @@ class ModelsManager:
                 "api_key_var": api_key_var,
                 "is_active": model["is_active"],
                 "provider": provider,
-                "model_name": model_name
+                "model_name": model_name,
+                "rate_limit_rps": rate_limit_rps,
+                "max_concurrency": max_concurrency,
+                "input_price": input_price,
+                "output_price": output_price
             })
 
             # Обновляем в списке
@@ -351,7 +418,11 @@ class ModelsManager:
                     "api_key_var": api_key_var,
                     "is_active": 1 if model["is_active"] else 0,
                     "provider": provider,
-                    "model_name": model_name
+                    "model_name": model_name,
+                    "rate_limit_rps": model.get("rate_limit_rps"),
+                    "max_concurrency": model.get("max_concurrency"),
+                    "input_price": model.get("input_price"),
+                    "output_price": model.get("output_price")
                 })
 
             # Сохраняем в БД
@@ -4,10 +4,43 @@ import os
 import uuid
 import json
 import base64
+import threading
+import time
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-from typing import Dict, Any, Optional
-from config import Config
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, Optional, Iterator, Tuple, Callable
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+from config import Config, TokenCache
+from budget import CHARS_PER_TOKEN, BudgetExceeded, BudgetGuard, PriceList, estimate_tokens
+from cancel import CANCEL_POLL_INTERVAL, Cancelled, CancelToken
+from metrics import (
+    RequestMetrics, TimedHTTPAdapter, collect_metrics, current_metrics, record_stream_line, record_usage
+)
+from ratelimit import RateLimiterRegistry, RateLimitTimeout
+from retry import DEFAULT_REQUEST_TIMEOUT, RetryState, policy_for
+
+# Сколько запросов к моделям выполняется одновременно
+DEFAULT_MAX_WORKERS = 8
+
+# Параметры генерации (входят и в ключ кэша ответов)
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 1024
+
+# Ответы с такими префиксами — сообщения об ошибках, а не текст модели
+ERROR_PREFIXES = ("❌", "⚠️", "🔑", "⛔", "💸")
+
+# Пул HTTP-соединений: максимум keep-alive соединений на один хост
+DEFAULT_POOL_SIZE = 16
+# Повторы только при ошибке установки соединения (запрос ещё не отправлен)
+DEFAULT_CONNECT_RETRIES = 2
+
+# Адреса провайдеров; переменные окружения направляют запросы, например, на mock_server.py
+GIGACHAT_AUTH_URL = os.getenv("GIGACHAT_AUTH_URL", "https://ngw.devices.sberbank.ru:9443/api/v2/oauth")
+GIGACHAT_CHAT_URL = os.getenv("GIGACHAT_CHAT_URL", "https://gigachat.devices.sberbank.ru/api/v1/chat/completions")
+YANDEX_COMPLETION_URL = os.getenv("YANDEX_COMPLETION_URL",
+                                  "https://llm.api.cloud.yandex.net/foundationModels/v1/completion")
 
 
 class NetworkError(Exception):
@@ -15,26 +48,306 @@ class NetworkError(Exception):
     pass
 
 class Network:
+    # Общие для всех потоков сессии: один requests.Session на хост
+    _sessions: Dict[str, requests.Session] = {}
+    _sessions_lock = threading.Lock()
+    _pool_size = DEFAULT_POOL_SIZE
+    _connect_retries = DEFAULT_CONNECT_RETRIES
+    # Лимиты частоты и одновременных запросов — на провайдера и ключ API
+    _limiters = RateLimiterRegistry()
+    # Куда отдавать замеры запросов: sink(строка request_metrics), например WriteBehindQueue.submit
+    _metrics_sink: Optional[Callable[[dict], None]] = None
+
+    # Цены моделей и общий (дневной) лимит расходов
+    _prices = PriceList()
+    _budget: Optional[BudgetGuard] = None
+
+    @classmethod
+    def configure_metrics(cls, sink: Optional[Callable[[dict], None]]):
+        """Включает запись замеров запросов (None — выключает)"""
+        cls._metrics_sink = sink
+
+    @classmethod
+    def configure_budget(cls, prices: Optional[PriceList] = None, budget: Optional[BudgetGuard] = None):
+        """Задаёт цены моделей и/или общий лимит расходов (аргумент None — оставить как есть)"""
+        if prices is not None:
+            cls._prices = prices
+        if budget is not None:
+            cls._budget = budget
+
+    @classmethod
+    def budget(cls) -> Optional[BudgetGuard]:
+        return cls._budget
+
+    @classmethod
+    def configure_pool(cls, pool_size: Optional[int] = None, connect_retries: Optional[int] = None):
+        """
+        Меняет параметры пула соединений.
+        Уже открытые сессии закрываются и будут созданы заново при следующем запросе.
+        """
+        with cls._sessions_lock:
+            if pool_size is not None:
+                cls._pool_size = max(1, pool_size)
+            if connect_retries is not None:
+                cls._connect_retries = max(0, connect_retries)
+            sessions = list(cls._sessions.values())
+            cls._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    @classmethod
+    def get_session(cls, url: str) -> requests.Session:
+        """Возвращает keep-alive сессию для хоста из url (создаёт при первом обращении)"""
+        parts = urlsplit(url)
+        host_key = f"{parts.scheme}://{parts.netloc}"
+
+        session = cls._sessions.get(host_key)
+        if session is not None:
+            return session
+
+        with cls._sessions_lock:
+            session = cls._sessions.get(host_key)
+            if session is None:
+                session = cls._create_session()
+                cls._sessions[host_key] = session
+                print(f"   🔌 Новый пул соединений: {host_key} (размер {cls._pool_size})")
+            return session
+
+    @classmethod
+    def _create_session(cls) -> requests.Session:
+        """Сессия с пулом соединений и повтором неудачных подключений"""
+        retry = Retry(
+            total=cls._connect_retries,
+            connect=cls._connect_retries,
+            read=0,        # POST не идемпотентен — повторяем только подключение
+            status=0,
+            other=0,
+            backoff_factor=0.3,
+            allowed_methods=None,
+            respect_retry_after_header=False,  # 429/503 с Retry-After повторяет RetryState
+        )
+        adapter = TimedHTTPAdapter(
+            # Пул urllib3 различается и по verify: к одному хосту могут идти запросы
+            # с проверкой сертификата и без (как к mock_server.py) — держим оба
+            pool_connections=2,
+            pool_maxsize=cls._pool_size,
+            max_retries=retry,
+            pool_block=False,
+        )
+        session = requests.Session()
+        session.headers.update({"Connection": "keep-alive"})
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @classmethod
+    def close_sessions(cls):
+        """Закрывает все соединения (при выходе из приложения)"""
+        cls.configure_pool()
+
     @staticmethod
-    def send_prompt_to_model(model_data: dict, prompt: str) -> str:
+    def _post(url: str, retry: Optional[RetryState] = None, **kwargs) -> requests.Response:
+        """
+        POST через пул соединений.
+        С retry — временные сбои (таймаут, обрыв, 429, 5xx) повторяются по его правилам,
+        и таймаут каждой попытки укладывается в общий дедлайн запроса.
+        """
+        session = Network.get_session(url)
+
+        def send(timeout):
+            metrics = current_metrics()
+            if metrics is None:
+                return session.post(url, timeout=timeout, **kwargs)
+            metrics.begin_attempt()
+            response = session.post(url, timeout=timeout, **kwargs)
+            metrics.observe(response)
+            return response
+
+        if retry is None:
+            return send(DEFAULT_REQUEST_TIMEOUT)
+        return retry.execute(send)
+
+    @staticmethod
+    def is_error_response(text: str) -> bool:
+        """True, если строка — сообщение об ошибке, а не ответ модели"""
+        return not text or text.lstrip().startswith(ERROR_PREFIXES)
+
+    @staticmethod
+    def send_prompt_to_model(model_data: dict, prompt: str,
+                             on_token: Optional[Callable[[str], None]] = None,
+                             cache=None, bypass_cache: bool = False,
+                             info: Optional[dict] = None,
+                             cancel_token: Optional[CancelToken] = None,
+                             budget: Optional[BudgetGuard] = None) -> str:
         """
         Отправляет промт в указанную модель и возвращает ответ или сообщение об ошибке.
 
         :param model: объект Model
         :param prompt: текст промта
+        :param on_token: если задан — ответ запрашивается потоком (SSE),
+                         и каждый новый фрагмент текста передаётся в on_token
+        :param cache: ResponseCache — повторный запрос отдаётся из кэша без обращения к API
+        :param bypass_cache: не читать кэш (свежий ответ всё равно сохраняется)
+        :param info: словарь, куда записываются подробности запроса:
+                     attempts — сколько попыток понадобилось (0 — ответ из кэша),
+                     cancelled — True, если запрос отменён через cancel_token,
+                     usage — {prompt_tokens, completion_tokens, total_tokens}, cost — ₽
+        :param cancel_token: CancelToken рассылки — при отмене запрос перестаёт ждать
+                             очереди и повторов, поток ответа закрывается
+        :param budget: лимит расходов (по умолчанию — общий, см. configure_budget);
+                       запрос, который мог бы выйти за лимит, не отправляется
         :return: строка — ответ или ошибка
+
+        Если у провайдера исчерпан лимит (rate_limit_rps, max_concurrency модели),
+        запрос ждёт своей очереди, а не возвращает ошибку. Временные сбои (таймаут,
+        обрыв соединения, 429, 5xx) повторяются с растущей паузой (см. retry.py).
         """
+        if cancel_token is not None and cancel_token.is_cancelled():
+            if info is not None:
+                info.update(attempts=0, cancelled=True)
+            return cancel_token.message
+
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(model_data, prompt, DEFAULT_TEMPERATURE, DEFAULT_MAX_TOKENS)
+            if not bypass_cache:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    print(f"💾 {model_data['name']}: ответ из кэша")
+                    if info is not None:
+                        info["attempts"] = 0
+                    if on_token is not None:
+                        on_token(cached)
+                    return cached
+
+        # Резервируем худшую стоимость запроса, пока он не отправлен
+        guard = budget if budget is not None else Network._budget
+        reserved = Network._prices.estimate(model_data.get("id"), prompt, DEFAULT_MAX_TOKENS)
+        if guard is not None:
+            try:
+                guard.reserve(reserved)
+            except BudgetExceeded as e:
+                response = f"💸 {model_data['name']}: запрос не отправлен — {e}"
+                print(response)
+                if info is not None:
+                    info.update(attempts=0, cancelled=False, budget_exceeded=True)
+                return response
+
+        # Сколько текста уже пришло потоком: если запрос прервут, эта часть всё равно оплачена
+        partial_chars = 0
+        if on_token is not None:
+            forward_token = on_token
+
+            def on_token(chunk: str):
+                nonlocal partial_chars
+                partial_chars += len(chunk)
+                forward_token(chunk)
+
+        limiter = Network._limiters.get(model_data)
+        if limiter.in_flight >= limiter.max_concurrency > 0:
+            print(f"⏳ {model_data['name']}: ждёт очереди к провайдеру ({limiter.in_flight} в работе)")
+        attempts = 0
+        retry = None
+        metrics = RequestMetrics(model_data, stream=on_token is not None)
+        try:
+            with limiter.slot(cancel_token=cancel_token), collect_metrics(metrics):
+                metrics.start_sending()
+                # Дедлайн повторов отсчитывается с момента, когда подошла очередь
+                retry = RetryState(policy_for(model_data.get("provider")), on_throttle=limiter.pause,
+                                   cancel_token=cancel_token)
+                try:
+                    response = Network._send_to_provider(model_data, prompt, on_token, retry)
+                finally:
+                    retry.release()
+        except RateLimitTimeout as e:
+            response = f"❌ {model_data['name']}: {e}"
+            print(response)
+        except Cancelled:
+            response = cancel_token.message
+        if retry is not None:
+            attempts = retry.attempts
+
+        # Поток, закрытый при отмене, заканчивается ошибкой чтения — это тоже отмена
+        cancelled = (cancel_token is not None and cancel_token.is_cancelled()
+                     and Network.is_error_response(response))
+        if cancelled:
+            response = cancel_token.message
+            print(f"⛔ {model_data['name']}: {cancel_token.reason}")
+
+        cost = 0.0
+        if attempts:
+            cost = Network._request_cost(model_data, prompt, response, metrics.usage,
+                                         partial_chars, interrupted=cancelled)
+        metrics.cost = cost
+        metrics.cancelled = cancelled
+        if guard is not None:
+            guard.settle(reserved, cost)
+
+        if info is not None:
+            info.update(attempts=attempts, cancelled=cancelled, usage=metrics.usage, cost=cost)
+        # Замеры пишем для всех запросов, которые дошли до провайдера, — и для отменённых:
+        # по ним считаются расходы за день
+        if attempts and Network._metrics_sink is not None:
+            metrics.finish(ok=not Network.is_error_response(response), attempts=attempts)
+            Network._record_metrics(metrics)
+        if attempts > 1 and not cancelled and Network.is_error_response(response):
+            response = f"{response} (попыток: {attempts})"
+
+        if cache_key is not None and not Network.is_error_response(response):
+            cache.put(cache_key, response, model_data.get("id"))
+        return response
+
+    @staticmethod
+    def _request_cost(model_data: dict, prompt: str, response: str, usage: dict,
+                      partial_chars: int = 0, interrupted: bool = False) -> float:
+        """
+        Стоимость запроса по usage; если провайдер его не прислал — оценка по длине текста.
+
+        :param partial_chars: сколько символов ответа успело прийти потоком
+        :param interrupted: запрос отменён после отправки — провайдер уже списал промт
+                            и отправленную часть ответа, даже если ответа мы не получили
+        """
+        model_id = model_data.get("id")
+        if Network._prices.get(model_id) is None:
+            return 0.0
+        if usage:
+            return Network._prices.cost(model_id, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        if not Network.is_error_response(response):
+            return Network._prices.cost(model_id, estimate_tokens(prompt), estimate_tokens(response))
+        if interrupted or partial_chars:
+            # Отмена или обрыв потока: минимум — промт и пришедшая часть ответа
+            return Network._prices.cost(model_id, estimate_tokens(prompt), partial_chars // CHARS_PER_TOKEN)
+        return 0.0
+
+    @staticmethod
+    def _record_metrics(metrics: RequestMetrics):
+        sink = Network._metrics_sink
+        if sink is None:
+            return
+        try:
+            sink(metrics.to_row())
+        except Exception as e:
+            print(f"   ⚠️ Не удалось записать замеры запроса: {e}")
+
+    @staticmethod
+    def _send_to_provider(model_data: dict, prompt: str,
+                          on_token: Optional[Callable[[str], None]] = None,
+                          retry: Optional[RetryState] = None) -> str:
+        """Выбирает способ отправки по провайдеру модели"""
         print(f"📤 Отправляю промт в {model_data['name']}...")
 
+        if on_token is not None:
+            return Network._collect_stream(model_data, prompt, on_token, retry)
+
         try:
             # 🔹 GigaChat — особый случай
             if model_data["provider"] == "gigachat":
-                return Network._send_to_gigachat(prompt)
+                return Network._send_to_gigachat(prompt, retry=retry)
             elif model_data["provider"] == "yandex":
-                return Network._send_to_yandex(prompt)
+                return Network._send_to_yandex(prompt, retry=retry)
             else:
                 # 🔹 OpenAI-совместимые: GPT, Claude, DeepSeek, Groq и др.
-                return Network._send_openai_compatible(model_data, prompt)
+                return Network._send_openai_compatible(model_data, prompt, retry)
 
         except Exception as e:
             error_msg = f"❌ Критическая ошибка: {str(e)}"
@@ -42,7 +355,282 @@ class Network:
             return error_msg
 
     @staticmethod
-    def _send_openai_compatible(model: dict, prompt: str) -> str:
+    def send_prompt_to_models(models: list, prompt: str,
+                              max_workers: int = DEFAULT_MAX_WORKERS,
+                              on_token: Optional[Callable[[int, str], None]] = None,
+                              cache=None, bypass_cache: bool = False,
+                              cancel_token: Optional[CancelToken] = None,
+                              budget: Optional[BudgetGuard] = None
+                              ) -> Iterator[Tuple[int, dict, str, dict]]:
+        """
+        Параллельно отправляет промт во все модели.
+
+        Запросы выполняются в пуле потоков, поэтому общее время равно времени
+        самой медленной модели, а не сумме всех.
+
+        :param models: список моделей (словари из БД)
+        :param prompt: текст промта
+        :param max_workers: максимум одновременных запросов
+        :param on_token: потоковый режим — вызывается как on_token(индекс модели, фрагмент)
+        :param cache: ResponseCache (см. send_prompt_to_model)
+        :param bypass_cache: не читать кэш
+        :param cancel_token: при отмене генератор сразу заканчивается, не дожидаясь
+                             оставшихся моделей (их индексы не будут выданы)
+        :param budget: лимит расходов рассылки (см. send_prompt_to_model)
+        :return: генератор (индекс модели, модель, ответ, info) в порядке готовности;
+                 info — подробности запроса (см. send_prompt_to_model)
+        """
+        if not models:
+            return
+
+        def token_callback(idx):
+            if on_token is None:
+                return None
+            return lambda chunk: on_token(idx, chunk)
+
+        workers = max(1, min(max_workers, len(models)))
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chatlist-send")
+        try:
+            futures = {}
+            for idx, model in enumerate(models):
+                info = {}
+                future = pool.submit(Network.send_prompt_to_model, model, prompt, token_callback(idx),
+                                     cache, bypass_cache, info, cancel_token, budget)
+                futures[future] = (idx, model, info)
+
+            pending = set(futures)
+            poll = CANCEL_POLL_INTERVAL if cancel_token is not None else None
+            while pending:
+                # После отмены забираем только уже готовые ответы — и выходим
+                cancelled = cancel_token is not None and cancel_token.is_cancelled()
+                done, pending = wait(pending, timeout=0 if cancelled else poll, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx, model, info = futures[future]
+                    # send_prompt_to_model сам перехватывает ошибки и возвращает строку
+                    yield idx, model, future.result(), info
+                if cancelled:
+                    break
+        finally:
+            # Отменённые запросы не ждём: зависший HTTP-запрос доработает в фоне
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # === Потоковый режим (SSE) ===
+    @staticmethod
+    def stream_prompt_to_model(model_data: dict, prompt: str,
+                               retry: Optional[RetryState] = None) -> Iterator[str]:
+        """
+        Отправляет промт с stream=true и отдаёт ответ по фрагментам.
+
+        :return: генератор фрагментов текста
+        :raises NetworkError: при ошибке HTTP или сети
+        """
+        provider = model_data["provider"]
+        if provider == "gigachat":
+            yield from Network._stream_gigachat(prompt, retry)
+        elif provider == "yandex":
+            yield from Network._stream_yandex(prompt, retry)
+        else:
+            yield from Network._stream_openai_compatible(model_data, prompt, retry)
+
+    @staticmethod
+    def _collect_stream(model_data: dict, prompt: str, on_token: Callable[[str], None],
+                        retry: Optional[RetryState] = None) -> str:
+        """Читает поток до конца, передавая фрагменты в on_token; возвращает полный текст"""
+        parts = []
+        try:
+            for chunk in Network.stream_prompt_to_model(model_data, prompt, retry):
+                parts.append(chunk)
+                on_token(chunk)
+        except NetworkError as e:
+            error_msg = f"❌ {e}"
+            print(error_msg)
+            return error_msg
+        except requests.exceptions.Timeout:
+            error_msg = "❌ Ошибка: Таймаут запроса (30 сек)"
+            print(error_msg)
+            return error_msg
+        except requests.exceptions.ConnectionError:
+            error_msg = "❌ Ошибка: Нет подключения к интернету"
+            print(error_msg)
+            return error_msg
+        except Exception as e:
+            error_msg = f"❌ Критическая ошибка: {str(e)}"
+            print(error_msg)
+            return error_msg
+
+        text = "".join(parts).strip()
+        if not text:
+            return "⚠️ Ответ получен, но пустой"
+        print("   ✅ Ответ получен (поток)")
+        return text
+
+    @staticmethod
+    def _iter_sse(response: requests.Response) -> Iterator[dict]:
+        """Разбирает text/event-stream: отдаёт JSON из строк 'data: ...' до [DONE]"""
+        response.encoding = "utf-8"
+        lines = response.iter_lines(chunk_size=None, decode_unicode=True)
+        for line in lines:
+            record_stream_line(line)
+            if not line or not line.startswith("data:"):
+                continue  # пустые строки-разделители, комментарии, event:
+            data = line[5:].strip()
+            if data == "[DONE]":
+                # Дочитываем завершающий чанк: недочитанный ответ закрывает соединение,
+                # а дочитанный возвращает его в пул keep-alive
+                for _ in lines:
+                    pass
+                return
+            try:
+                yield json.loads(data)
+            except ValueError:
+                print(f"   ⚠️ Не удалось разобрать фрагмент: {data[:100]}")
+
+    @staticmethod
+    def _stream_error(response: requests.Response) -> NetworkError:
+        """Превращает неуспешный ответ в NetworkError"""
+        if response.status_code == 402:
+            return NetworkError(
+                "Модель недоступна.<br>"
+                "• Проверьте <a href='https://polza.ai'>баланс на polza.ai</a><br>"
+                "• Или выберите другую модель"
+            )
+        try:
+            error = response.json().get("error", {})
+            detail = error.get("message", response.text) if isinstance(error, dict) else error
+        except ValueError:
+            detail = response.text
+        return NetworkError(f"{response.status_code}: {detail}")
+
+    @staticmethod
+    def _stream_openai_compatible(model: dict, prompt: str, retry: Optional[RetryState] = None) -> Iterator[str]:
+        """Потоковый ответ OpenAI-совместимого API (choices[0].delta.content)"""
+        try:
+            api_key = Config.get_api_key(model["api_key_var"])
+        except ValueError as e:
+            raise NetworkError(f"Ошибка ключа: {e}")
+
+        model_name = (model["model_name"] or "").strip()
+        if not model_name:
+            raise NetworkError("Не указано имя модели в БД")
+
+        print(f"   🌐 POST (stream) {model['api_key_var']} [model: {model_name}]")
+        with Network._post(
+            model["api_url"], retry,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+            },
+            json={
+                "model": model_name,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": DEFAULT_TEMPERATURE,
+                "max_tokens": DEFAULT_MAX_TOKENS,
+                "stream": True,
+            },
+            verify=False,
+            stream=True,
+        ) as response:
+            print(f"   🔎 Status: {response.status_code}")
+            if response.status_code not in (200, 201):
+                raise Network._stream_error(response)
+            for event in Network._iter_sse(response):
+                record_usage(event.get("usage"))
+                choices = event.get("choices") or [{}]
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
+
+    @staticmethod
+    def _stream_gigachat(prompt: str, retry: Optional[RetryState] = None) -> Iterator[str]:
+        """Потоковый ответ GigaChat — тот же формат SSE, что у OpenAI"""
+        for attempt in range(2):
+            access_token = _gigachat_tokens.get()
+            with Network._post(
+                GIGACHAT_CHAT_URL, retry,
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "text/event-stream",
+                    "Authorization": f"Bearer {access_token}"
+                },
+                json={
+                    "model": "GigaChat",
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": DEFAULT_TEMPERATURE,
+                    "max_tokens": DEFAULT_MAX_TOKENS,
+                    "stream": True,
+                },
+                verify=False,
+                stream=True,
+            ) as response:
+                print(f"   💬 Запрос в GigaChat (stream): {response.status_code}")
+                if response.status_code == 401 and attempt == 0:
+                    _gigachat_tokens.invalidate()
+                    continue
+                if response.status_code != 200:
+                    raise NetworkError(f"Ошибка GigaChat: {response.text}")
+                for event in Network._iter_sse(response):
+                    record_usage(event.get("usage"))
+                    choices = event.get("choices") or [{}]
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        yield content
+                return
+
+    @staticmethod
+    def _stream_yandex(prompt: str, retry: Optional[RetryState] = None) -> Iterator[str]:
+        """
+        Потоковый ответ Yandex GPT.
+        Сервер присылает JSON-объекты построчно, в каждом — весь текст на текущий момент,
+        поэтому отдаём только прирост.
+        """
+        for attempt in range(2):
+            iam_token, folder_id = Config.get_yandex_credentials()
+            with Network._post(
+                YANDEX_COMPLETION_URL, retry,
+                headers={
+                    "Authorization": f"Bearer {iam_token}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "modelUri": f"gpt://{folder_id}/yandexgpt/latest",
+                    "completionOptions": {
+                        "stream": True,
+                        "temperature": DEFAULT_TEMPERATURE,
+                        "maxTokens": str(DEFAULT_MAX_TOKENS)
+                    },
+                    "messages": [{"role": "user", "text": prompt}]
+                },
+                stream=True,
+            ) as response:
+                print(f"   🔎 Yandex GPT (stream): {response.status_code}")
+                if response.status_code == 401 and attempt == 0:
+                    Config.invalidate_yandex_token()
+                    continue
+                if response.status_code != 200:
+                    raise Network._stream_error(response)
+
+                response.encoding = "utf-8"
+                sent = 0
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    record_stream_line(line)
+                    if not line:
+                        continue
+                    if line.startswith("data:"):
+                        line = line[5:].strip()
+                    try:
+                        result = json.loads(line)["result"]
+                        text = result["alternatives"][0]["message"]["text"]
+                    except (ValueError, KeyError, IndexError, TypeError):
+                        continue
+                    record_usage(result.get("usage"))
+                    if len(text) > sent:
+                        yield text[sent:]
+                        sent = len(text)
+                return
+
+    @staticmethod
+    def _send_openai_compatible(model: dict, prompt: str, retry: Optional[RetryState] = None) -> str:
         """Отправка в OpenAI-совместимые API с полной поддержкой БД"""
         try:
             # 🔑 Получаем API-ключ по имени переменной из БД
@@ -74,17 +662,16 @@ class Network:
             payload = {
                 "model": model_name,
                 "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.7,
-                "max_tokens": 1024,
+                "temperature": DEFAULT_TEMPERATURE,
+                "max_tokens": DEFAULT_MAX_TOKENS,
             }
 
             # 🌐 Отправляем
             print(f"   🌐 POST {model["api_key_var"]} [model: {model_name}]")
-            response = requests.post(
-                model["api_url"],
+            response = Network._post(
+                model["api_url"], retry,
                 headers=headers,
                 json=payload,
-                timeout=30,
                 verify=False  # ⚠️ Только если API требует (например, GigaChat)
             )
 
@@ -101,6 +688,7 @@ class Network:
             if response.status_code in (200, 201):
                 try:
                     data = response.json()
+                    record_usage(data.get("usage"))
                     content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
                     if content:
                         print("   ✅ Ответ получен")
@@ -134,43 +722,53 @@ class Network:
             return error_msg
 
     @staticmethod
-    def _send_to_gigachat(prompt: str) -> str:
+    def _fetch_gigachat_token() -> Tuple[str, float]:
+        """Запрашивает новый access_token GigaChat; возвращает (токен, истечение в секундах Unix)"""
+        client_id, client_secret = Config.get_gigachat_credentials()
+
+        auth_str = f"{client_id}:{client_secret}"
+        encoded = base64.b64encode(auth_str.encode()).decode()
+
+        token_response = Network.get_session(GIGACHAT_AUTH_URL).post(
+            GIGACHAT_AUTH_URL,
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Accept": "application/json",
+                "RqUID": str(uuid.uuid4()),
+                "Authorization": f"Basic {encoded}"
+            },
+            data={"scope": "GIGACHAT_API_PERS"},
+            timeout=DEFAULT_REQUEST_TIMEOUT,
+            verify=False  # 🔥 Отключаем проверку SSL
+        )
+
+        print(f"   🔐 Получение токена: {token_response.status_code}")
+
+        if token_response.status_code != 200:
+            error = token_response.text
+            print(f"   🚫 Ошибка токена: {error}")
+            raise NetworkError(f"Ошибка авторизации: {error}")
+
+        data = token_response.json()
+        access_token = data.get("access_token")
+        if not access_token:
+            raise NetworkError("Не получен access_token")
+
+        # expires_at приходит в миллисекундах; по умолчанию токен живёт 30 минут
+        expires_at = data.get("expires_at")
+        expires_at = expires_at / 1000 if expires_at else time.time() + 30 * 60
+        return access_token, expires_at
+
+    @staticmethod
+    def _send_to_gigachat(prompt: str, retry_auth: bool = False, retry: Optional[RetryState] = None) -> str:
         """Отправка запроса в GigaChat (через Сбер)"""
         try:
-            client_id, client_secret = Config.get_gigachat_credentials()
-
-            # 1. Получаем access_token
-            auth_str = f"{client_id}:{client_secret}"
-            encoded = base64.b64encode(auth_str.encode()).decode()
-
-            token_response = requests.post(
-                "https://ngw.devices.sberbank.ru:9443/api/v2/oauth",
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded",
-                    "Accept": "application/json",
-                    "RqUID": str(uuid.uuid4()),
-                    "Authorization": f"Basic {encoded}"
-                },
-                data={"scope": "GIGACHAT_API_PERS"},
-                verify=False  # 🔥 Отключаем проверку SSL
-            )
-
-            print(f"   🔐 Получение токена: {token_response.status_code}")
-
-            if token_response.status_code != 200:
-                error = token_response.text
-                print(f"   🚫 Ошибка токена: {error}")
-                return f"❌ Ошибка авторизации: {error}"
-
-            access_token = token_response.json().get("access_token")
-            if not access_token:
-                msg = "Не получен access_token"
-                print(f"   🚫 {msg}")
-                return f"❌ {msg}"
+            # 1. Токен берём из кэша — новый запрашивается только при истечении
+            access_token = _gigachat_tokens.get()
 
             # 2. Отправляем промт
-            chat_response = requests.post(
-                "https://gigachat.devices.sberbank.ru/api/v1/chat/completions",
+            chat_response = Network._post(
+                GIGACHAT_CHAT_URL, retry,
                 headers={
                     "Content-Type": "application/json",
                     "Authorization": f"Bearer {access_token}"
@@ -178,17 +776,23 @@ class Network:
                 json={
                     "model": "GigaChat",
                     "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7,
-                    "max_tokens": 1024
+                    "temperature": DEFAULT_TEMPERATURE,
+                    "max_tokens": DEFAULT_MAX_TOKENS
                 },
-                timeout=30,
                 verify=False  # 🔥
             )
 
             print(f"   💬 Запрос в GigaChat: {chat_response.status_code}")
 
+            if chat_response.status_code == 401 and not retry_auth:
+                # Токен отозван раньше срока — получаем новый и повторяем один раз
+                _gigachat_tokens.invalidate()
+                return Network._send_to_gigachat(prompt, retry_auth=True, retry=retry)
+
             if chat_response.status_code == 200:
-                content = chat_response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+                data = chat_response.json()
+                record_usage(data.get("usage"))
+                content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
                 if content:
                     print("   ✅ Ответ получен")
                     return content.strip()
@@ -199,13 +803,18 @@ class Network:
                 print(f"   🚫 Ошибка: {error}")
                 return f"❌ Ошибка GigaChat: {error}"
 
+        except NetworkError as e:
+            error_msg = f"❌ {e}"
+            print(error_msg)
+            return error_msg
+
         except Exception as e:
             error_msg = f"❌ GigaChat: {str(e)}"
             print(error_msg)
             return error_msg
         
     @staticmethod
-    def _send_to_yandex(prompt: str) -> str:
+    def _send_to_yandex(prompt: str, retry_auth: bool = False, retry: Optional[RetryState] = None) -> str:
         """Отправка в Yandex GPT через requests (без SDK)"""
         try:
             # Получаем креды
@@ -215,8 +824,8 @@ class Network:
             payload = {
                 "modelUri": f"gpt://{folder_id}/yandexgpt/latest",
                 "completionOptions": {
-                    "temperature": 0.7,
-                    "maxTokens": "1024"
+                    "temperature": DEFAULT_TEMPERATURE,
+                    "maxTokens": str(DEFAULT_MAX_TOKENS)
                 },
                 "messages": [{"role": "user", "text": prompt}]
             }
@@ -227,18 +836,24 @@ class Network:
             }
 
             print(f"   🌐 POST Yandex GPT (folder: {folder_id})")
-            response = requests.post(
-                "https://llm.api.cloud.yandex.net/foundationModels/v1/completion",
+            response = Network._post(
+                YANDEX_COMPLETION_URL, retry,
                 headers=headers,
                 json=payload,
-                timeout=30
             )
 
             print(f"   🔎 Status: {response.status_code}")
 
+            if response.status_code == 401 and not retry_auth:
+                # IAM-токен отозван раньше срока — обновляем и повторяем один раз
+                Config.invalidate_yandex_token()
+                return Network._send_to_yandex(prompt, retry_auth=True, retry=retry)
+
             if response.status_code == 200:
                 try:
-                    text = response.json()["result"]["alternatives"][0]["message"]["text"]
+                    result = response.json()["result"]
+                    record_usage(result.get("usage"))
+                    text = result["alternatives"][0]["message"]["text"]
                     print("   ✅ Ответ получен")
                     return text.strip()
                 except (KeyError, IndexError) as e:
@@ -254,4 +869,13 @@ class Network:
         except Exception as e:
             error_msg = f"❌ Yandex GPT: {str(e)}"
             print(error_msg)
-            return error_msg
\ No newline at end of file
+            return error_msg
+
+
+# Кэш токена GigaChat: общий для всех потоков, переживает перезапуск приложения
+_gigachat_tokens = TokenCache(
+    Network._fetch_gigachat_token,
+    cache_file=".gigachat_token_cache.json",
+    token_field="access_token",
+    name="токен GigaChat",
+)
@@ -0,0 +1,175 @@
+# ratelimit.py
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from cancel import CancelToken
+
+# Лимиты по умолчанию, если у модели в БД не задано rate_limit_rps / max_concurrency.
+# Все модели с одним провайдером и одним ключом делят общий лимит.
+DEFAULT_RATE_LIMIT_RPS = 5.0
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Провайдеры с более строгими квотами: (запросов в секунду, одновременных запросов)
+PROVIDER_LIMITS = {
+    "gigachat": (1.0, 1),  # персональный ключ GigaChat — один поток на клиента
+    "yandex": (10.0, 10),
+}
+
+# Сколько запрос может ждать своей очереди, прежде чем вернуть ошибку
+DEFAULT_QUEUE_TIMEOUT = 120.0
+
+
+class RateLimitTimeout(Exception):
+    """Очередь к провайдеру не подошла за отведённое время"""
+    pass
+
+
+class RateLimiter:
+    """
+    Ограничитель запросов к одному провайдеру (одному ключу):
+    token bucket по частоте и предел одновременных запросов.
+
+    acquire() не отказывает, а ждёт, пока появятся свободный токен и свободное место.
+    rate <= 0 или max_concurrency <= 0 — без ограничения по этому параметру.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE_LIMIT_RPS,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, burst: Optional[float] = None):
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._updated = time.monotonic()
+        self._tokens = float("inf")  # configure() урежет до burst — старт с полным ведром
+        self._paused_until = 0.0
+        self.configure(rate, max_concurrency, burst)
+
+    def configure(self, rate: float, max_concurrency: int, burst: Optional[float] = None):
+        """Меняет лимиты на лету (ожидающие запросы пересчитают время ожидания)"""
+        with self._cond:
+            self.rate = float(rate or 0)
+            self.max_concurrency = int(max_concurrency or 0)
+            # По умолчанию разрешаем всплеск не больше секунды трафика, но не меньше одного запроса
+            self.burst = float(burst) if burst else max(1.0, self.rate)
+            self._tokens = min(self._tokens, self.burst)
+            self._cond.notify_all()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: Optional[float] = None, cancel_token: Optional[CancelToken] = None) -> bool:
+        """
+        Ждёт своей очереди; False — не дождались за timeout секунд.
+        :raises Cancelled: cancel_token отменён, пока запрос ждал
+        """
+        if cancel_token is None:
+            return self._acquire(timeout, None)
+
+        def wake():
+            with self._cond:
+                self._cond.notify_all()
+
+        cancel_token.add_callback(wake)
+        try:
+            return self._acquire(timeout, cancel_token)
+        finally:
+            cancel_token.remove_callback(wake)
+
+    def _acquire(self, timeout: Optional[float], cancel_token: Optional[CancelToken]) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if cancel_token is not None:
+                    cancel_token.check()
+                now = time.monotonic()
+                self._refill(now)
+
+                paused = now < self._paused_until
+                slot_free = self.max_concurrency <= 0 or self._in_flight < self.max_concurrency
+                token_free = self.rate <= 0 or self._tokens >= 1
+                if slot_free and token_free and not paused:
+                    if self.rate > 0:
+                        self._tokens -= 1
+                    self._in_flight += 1
+                    return True
+
+                # Место освободит release() (notify); токен и конец паузы — через известное время
+                if paused:
+                    wait = self._paused_until - now
+                elif not slot_free:
+                    wait = None
+                else:
+                    wait = (1 - self._tokens) / self.rate
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return False
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def pause(self, seconds: float):
+        """Провайдер ответил 429 — новые запросы ждут seconds секунд (Retry-After)"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+    def release(self):
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = DEFAULT_QUEUE_TIMEOUT, cancel_token: Optional[CancelToken] = None):
+        """with limiter.slot(): запрос — ждёт очереди, место освобождается при выходе"""
+        if not self.acquire(timeout, cancel_token):
+            raise RateLimitTimeout(f"нет свободного места в очереди за {timeout:.0f} сек")
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class RateLimiterRegistry:
+    """Ограничители по ключу (провайдер, переменная API-ключа); создаются при первом запросе"""
+
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, str], RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def limits_for(model_data: dict) -> Tuple[float, int]:
+        """Лимиты модели: из БД, иначе — по провайдеру, иначе — по умолчанию"""
+        provider = (model_data.get("provider") or "").lower()
+        default_rate, default_concurrency = PROVIDER_LIMITS.get(
+            provider, (DEFAULT_RATE_LIMIT_RPS, DEFAULT_MAX_CONCURRENCY)
+        )
+        rate = model_data.get("rate_limit_rps")
+        max_concurrency = model_data.get("max_concurrency")
+        return (
+            default_rate if rate is None else float(rate),
+            default_concurrency if max_concurrency is None else int(max_concurrency),
+        )
+
+    def get(self, model_data: dict) -> RateLimiter:
+        """Ограничитель для модели; лимиты обновляются, если в БД их поменяли"""
+        key = ((model_data.get("provider") or "").lower(), model_data.get("api_key_var") or "")
+        rate, max_concurrency = self.limits_for(model_data)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = RateLimiter(rate, max_concurrency)
+                self._limiters[key] = limiter
+                return limiter
+        if (limiter.rate, limiter.max_concurrency) != (rate, max_concurrency):
+            limiter.configure(rate, max_concurrency)
+        return limiter
+
+    def clear(self):
+        with self._lock:
+            self._limiters.clear()
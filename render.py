@@ -0,0 +1,245 @@
+# render.py
+import hashlib
+import threading
+from collections import OrderedDict
+
+import markdown
+
+# Сколько отрисованных предпросмотров держать в памяти
+DEFAULT_PREVIEW_CACHE_ENTRIES = 64
+
+# Расширения Markdown для предпросмотра
+MARKDOWN_EXTENSIONS = [
+    'fenced_code',
+    'tables',
+    'codehilite'  # ← подсветка синтаксиса
+]
+
+# Цвета предпросмотра для каждой темы
+PREVIEW_COLORS = {
+    "dark": {
+        "bg": "#2b2b2b",
+        "text": "#ffffff",
+        "code_bg": "#1e1e1e",
+        "code_color": "#dcdcdc",
+        "blockquote_bg": "#3c3c3c",
+        "blockquote_border": "#007acc",
+        "heading": "#00aaff",
+        "link": "#64b5f6",
+    },
+    "light": {
+        "bg": "#ffffff",
+        "text": "#333333",
+        "code_bg": "#f5f5f5",
+        "code_color": "#000000",
+        "blockquote_bg": "#f9f9f9",
+        "blockquote_border": "#ccc",
+        "heading": "#007acc",
+        "link": "#1976d2",
+    },
+}
+
+
+def build_preview_markdown(responses: list) -> str:
+    """
+    Собирает Markdown предпросмотра из строк get_responses_by_result_id:
+    заголовок — промт, далее ответ каждой модели цитатой.
+    """
+    md_lines = []
+    md_lines.append(f"# {responses[0]['prompt'].strip()}")
+    md_lines.append(f"*Дата: {responses[0]['saved_at']}*")
+    md_lines.append("")  # Пустая строка
+
+    for r in responses:
+        md_lines.append(f"## {r['model_name']}")
+        response_text = r['response'].strip()
+        # Экранируем, чтобы не сломать Markdown
+        lines = response_text.splitlines()
+        for line in lines:
+            if line.strip() == '':
+                md_lines.append("")  # Пустая строка
+            else:
+                md_lines.append(f"> {line}")
+        md_lines.append("")  # Отступ между моделями
+
+    return "\n".join(md_lines)
+
+
+def content_hash(md_text: str) -> str:
+    """Хэш содержимого — часть ключа кэша: изменился текст — отрисуем заново"""
+    return hashlib.sha1(md_text.encode("utf-8")).hexdigest()
+
+
+# Конвертер Markdown не потокобезопасен — у каждого потока свой экземпляр
+_local = threading.local()
+
+
+def get_markdown() -> markdown.Markdown:
+    """
+    Общий конвертер Markdown текущего потока.
+    Создаётся при первом вызове: расширения загружаются и настраиваются один раз,
+    а не на каждый документ, как при markdown.markdown().
+    """
+    md = getattr(_local, "md", None)
+    if md is None:
+        md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+        _local.md = md
+    return md
+
+
+def markdown_to_html(md_text: str) -> str:
+    """Markdown → HTML общим конвертером; состояние сбрасывается после каждого документа"""
+    md = get_markdown()
+    try:
+        return md.convert(md_text)
+    finally:
+        md.reset()
+
+
+def render_preview_html(md_text: str, theme: str) -> str:
+    """Markdown → HTML-страница предпросмотра в цветах темы"""
+    return wrap_preview_html(markdown_to_html(md_text), theme)
+
+
+def wrap_preview_html(html: str, theme: str) -> str:
+    """Добавляет стили темы и обёртку"""
+    colors = PREVIEW_COLORS.get(theme, PREVIEW_COLORS["light"])
+    bg = colors["bg"]
+    text = colors["text"]
+    code_bg = colors["code_bg"]
+    code_color = colors["code_color"]
+    blockquote_bg = colors["blockquote_bg"]
+    blockquote_border = colors["blockquote_border"]
+    heading = colors["heading"]
+    link = colors["link"]
+
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <style>
+            body, html {{
+                margin: 0;
+                padding: 20px;
+                background: {bg};
+                color: {text};
+                font-family: 'Segoe UI', Arial, sans-serif;
+                line-height: 1.6;
+                font-size: 14px;
+            }}
+            h1, h2, h3 {{
+                color: {heading};
+                border-bottom: 1px solid {blockquote_border};
+                padding-bottom: 5px;
+            }}
+            a {{
+                color: {link};
+                text-decoration: none;
+            }}
+            a:hover {{
+                text-decoration: underline;
+            }}
+            code {{
+                font-family: 'Consolas', 'Courier New', monospace;
+                background: {code_bg};
+                color: {code_color};
+                padding: 2px 6px;
+                border-radius: 3px;
+                font-size: 0.9em;
+            }}
+            pre {{
+                background: {code_bg};
+                color: {code_color};
+                padding: 15px;
+                border-radius: 6px;
+                overflow: auto;
+                margin: 10px 0;
+                border: 1px solid {blockquote_border};
+            }}
+            pre code {{
+                background: none;
+                color: inherit;
+                padding: 0;
+                font-size: inherit;
+            }}
+            blockquote {{
+                background: {blockquote_bg};
+                border-left: 4px solid {blockquote_border};
+                margin: 15px 0;
+                padding: 12px 15px;
+                font-style: italic;
+                border-radius: 0 4px 4px 0;
+            }}
+            ul, ol {{
+                margin: 10px 0;
+                padding-left: 25px;
+            }}
+            table {{
+                border-collapse: collapse;
+                width: 100%;
+                margin: 15px 0;
+            }}
+            table th, table td {{
+                border: 1px solid {blockquote_border};
+                padding: 8px;
+                text-align: left;
+            }}
+            table th {{
+                background: {blockquote_bg};
+                color: {heading};
+            }}
+        </style>
+    </head>
+    <body>
+        {html}
+    </body>
+    </html>
+    """
+
+
+class PreviewCache:
+    """
+    LRU-кэш отрисованного HTML предпросмотра.
+    Ключ — (result_id, тема, хэш содержимого); доступ из GUI и из потока отрисовки.
+    latest() отдаёт последнюю отрисовку результата, не зная хэша — GUI не читает
+    текст ответов из БД, актуальность проверяет поток отрисовки.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_PREVIEW_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._latest = {}  # (result_id, тема) → последний ключ
+
+    def get(self, key):
+        """HTML из кэша или None"""
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+            return html
+
+    def latest(self, result_id: int, theme: str):
+        """(ключ, HTML) последней отрисовки результата в теме или None"""
+        with self._lock:
+            key = self._latest.get((result_id, theme))
+            if key is None:
+                return None
+            self._entries.move_to_end(key)
+            return key, self._entries[key]
+
+    def put(self, key, html: str):
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            self._latest[key[:2]] = key
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                if self._latest.get(evicted[:2]) == evicted:
+                    del self._latest[evicted[:2]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
@@ -0,0 +1,225 @@
+# retry.py
+import random
+import socket
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+import requests
+
+from cancel import CancelToken
+
+# Время ожидания ответа на одну попытку (секунды)
+DEFAULT_REQUEST_TIMEOUT = 30
+
+# Сервер отказал, не начав обрабатывать запрос — повтор ничего не продублирует
+RETRY_SAFE_STATUSES = {429, 503}
+# Запрос мог быть обработан (и оплачен) — повтор возможен, но ограничен max_unsafe_retries
+RETRY_UNSAFE_STATUSES = {500, 502, 504}
+
+
+class RetryPolicy:
+    """
+    Правила повтора запроса к провайдеру.
+
+    :param max_attempts: всего попыток, включая первую
+    :param base_delay: пауза перед первым повтором; дальше растёт вдвое (экспоненциально)
+    :param max_delay: верхняя граница паузы
+    :param deadline: на весь запрос со всеми повторами — не больше стольких секунд
+    :param max_unsafe_retries: сколько раз можно повторить запрос, который сервер мог
+                               уже выполнить (таймаут ответа, обрыв, 500/502/504)
+    :param request_timeout: таймаут одной попытки
+    """
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 20.0,
+                 deadline: float = 90.0, max_unsafe_retries: int = 1,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.max_unsafe_retries = max_unsafe_retries
+        self.request_timeout = request_timeout
+
+    def backoff(self, retry_number: int) -> float:
+        """Пауза перед retry_number-м повтором: случайная в [0, base * 2^(n-1)] ("full jitter"),
+        чтобы одновременно упавшие запросы не повторялись хором"""
+        cap = min(self.max_delay, self.base_delay * (2 ** (retry_number - 1)))
+        return random.uniform(0, cap)
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+# Провайдеры, которым нужны другие правила (ключ — models.provider в нижнем регистре)
+PROVIDER_RETRY_POLICIES = {
+    # 429 у GigaChat приходит при превышении одного потока — ждём дольше
+    "gigachat": RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=30.0, deadline=120.0),
+    "yandex": RetryPolicy(max_attempts=4, base_delay=1.0),
+}
+
+
+def policy_for(provider: Optional[str]) -> RetryPolicy:
+    return PROVIDER_RETRY_POLICIES.get((provider or "").lower(), DEFAULT_RETRY_POLICY)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Заголовок Retry-After → секунды ожидания (число секунд или HTTP-дата)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class RetryState:
+    """
+    Повторы одного запроса: счётчик попыток и общий дедлайн.
+
+    Создаётся на каждый вызов send_prompt_to_model и передаётся вниз до HTTP-запроса,
+    поэтому повторная авторизация (401) и основной запрос тратят один бюджет.
+
+    :param on_throttle: on_throttle(секунды) — сервер попросил подождать (429 / Retry-After);
+                        например, RateLimiter.pause, чтобы ждали и остальные запросы к провайдеру
+    :param cancel_token: отмена всей рассылки — повторы прекращаются, таймаут попытки
+                         не выходит за её дедлайн, открытый ответ закрывается
+    """
+
+    def __init__(self, policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+                 on_throttle: Optional[Callable[[float], None]] = None,
+                 cancel_token: Optional[CancelToken] = None):
+        self.policy = policy
+        self.on_throttle = on_throttle
+        self.cancel_token = cancel_token
+        self.attempts = 0
+        self.unsafe_retries = 0
+        self.started = time.monotonic()
+        self._abort_callback = None  # колбэк отмены для текущего ответа (см. _watch)
+
+    def remaining(self) -> float:
+        remaining = self.policy.deadline - (time.monotonic() - self.started)
+        if self.cancel_token is not None and self.cancel_token.remaining() is not None:
+            remaining = min(remaining, self.cancel_token.remaining())
+        return remaining
+
+    def timeout(self) -> float:
+        """Таймаут очередной попытки — не дольше, чем осталось до дедлайна"""
+        return max(1.0, min(self.policy.request_timeout, self.remaining()))
+
+    def execute(self, send: Callable[[float], requests.Response]) -> requests.Response:
+        """
+        Выполняет send(timeout) с повторами.
+
+        :return: первый ответ, который не нужно повторять, либо последний полученный
+        :raises: исключение requests последней попытки, если ответа так и не было
+        :raises Cancelled: рассылка отменена
+        """
+        while True:
+            # Предыдущий ответ (повтор, повторная авторизация) больше не читается
+            self.release()
+            if self.cancel_token is not None:
+                self.cancel_token.check()
+            self.attempts += 1
+            response, error = None, None
+            try:
+                response = send(self.timeout())
+            except requests.exceptions.ConnectTimeout as e:
+                error, safe = e, True   # соединение не установлено — запрос не ушёл
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                error, safe = e, False  # ответ не дошёл — сервер мог запрос выполнить
+            else:
+                if response.status_code in RETRY_SAFE_STATUSES:
+                    safe = True
+                elif response.status_code in RETRY_UNSAFE_STATUSES:
+                    safe = False
+                else:
+                    return self._watch(response)
+
+            delay = self._next_delay(response, safe)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return self._watch(response)
+
+            reason = type(error).__name__ if error is not None else f"HTTP {response.status_code}"
+            if response is not None:
+                response.close()
+            print(f"   🔁 {reason}: повтор {self.attempts + 1}/{self.policy.max_attempts} через {delay:.1f} с")
+            if self.cancel_token is not None:
+                self.cancel_token.sleep(delay)
+            else:
+                time.sleep(delay)
+
+    def _watch(self, response: requests.Response) -> requests.Response:
+        """
+        При отмене рассылки соединение обрывается — чтение потока (SSE) сразу прерывается.
+        Колбэк снимается release(): при следующей попытке или когда ответ дочитан,
+        иначе токен рассылки держал бы все ответы до её конца.
+        """
+        if self.cancel_token is not None:
+            self._abort_callback = lambda: abort_response(response)
+            self.cancel_token.add_callback(self._abort_callback)
+        return response
+
+    def release(self):
+        """Ответ дочитан (или попытка повторяется) — отмена его больше не касается"""
+        callback, self._abort_callback = self._abort_callback, None
+        if callback is not None and self.cancel_token is not None:
+            self.cancel_token.remove_callback(callback)
+
+    def _next_delay(self, response: Optional[requests.Response], safe: bool) -> Optional[float]:
+        """Пауза перед следующей попыткой или None, если повторять нельзя"""
+        if self.attempts >= self.policy.max_attempts:
+            return None
+        if not safe and self.unsafe_retries >= self.policy.max_unsafe_retries:
+            return None
+
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        delay = retry_after if retry_after is not None else self.policy.backoff(self.attempts)
+        if response is not None and response.status_code == 429 and self.on_throttle is not None:
+            self.on_throttle(delay)
+
+        # Ждать и повторять есть смысл, только если на попытку останется хоть секунда
+        if self.remaining() - delay < 1.0:
+            return None
+        if not safe:
+            self.unsafe_retries += 1
+        return delay
+
+
+def _response_socket(response: requests.Response) -> Optional[socket.socket]:
+    """
+    Сокет, из которого читается ответ, или None.
+
+    Закрытых атрибутов urllib3 (HTTPResponse._connection → HTTPConnection.sock) касается
+    только эта функция; проверено на urllib3 1.26.20 и 2.8.0.
+    """
+    return getattr(getattr(response.raw, "_connection", None), "sock", None)
+
+
+def abort_response(response: requests.Response):
+    """
+    Обрывает соединение ответа из любого потока.
+
+    response.close() здесь не годится: он ждёт блокировку буфера, которую держит
+    поток, застрявший в чтении, — а shutdown сокета будит этот поток сразу.
+    Если до сокета не добраться (другая версия urllib3), закрываем raw-ответ:
+    чтение прервётся не сразу, но прервётся.
+    """
+    sock = _response_socket(response)
+    if sock is None:
+        try:
+            response.raw.close()
+        except Exception:
+            pass  # ответ уже закрыт или дочитан
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # соединение уже закрыто
@@ -36,7 +36,7 @@ STYLES = {
         QPushButton:hover {
             background-color: #c0c0c0;
         }
-        QTableWidget {
+        QTableView {
             background-color: white;
             alternate-background-color: #f8f8f8;
             gridline-color: #ddd;
@@ -89,7 +89,7 @@ STYLES = {
         QPushButton:hover {
             background-color: #4c4c4c;
         }
-        QTableWidget {
+        QTableView {
             background-color: #2b2b2b;
             alternate-background-color: #333;
             gridline-color: #444;
@@ -0,0 +1,605 @@
+# views.py
+import re
+
+from PyQt6.QtCore import (
+    Qt, QAbstractTableModel, QEvent, QModelIndex, QPersistentModelIndex, QRect,
+    QSortFilterProxyModel, QTimer, pyqtSignal
+)
+from PyQt6.QtGui import QColor, QFont, QPalette
+from PyQt6.QtWidgets import (
+    QApplication, QStyle, QStyleOptionButton, QStyledItemDelegate, QTableView, QHeaderView,
+    QAbstractItemView
+)
+
+# Ограничения высоты строки с ответом (как у прежней QScrollArea)
+RESPONSE_MIN_HEIGHT = 60
+RESPONSE_MAX_HEIGHT = 200
+# Для расчёта высоты хватает начала текста — всё, что длиннее, всё равно обрежется
+MEASURE_TEXT_LIMIT = 4000
+
+# Высота строки таблицы промтов и размер кнопок "Копировать"/"Удалить"
+PROMPT_ROW_HEIGHT = 45
+ACTION_BUTTON_WIDTH = 90
+ACTION_BUTTON_HEIGHT = 30
+ACTION_BUTTON_SPACING = 3
+
+# Роль, по которой модели отдают строку целиком (словарь)
+ROW_ROLE = Qt.ItemDataRole.UserRole
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def html_to_plain(text: str) -> str:
+    """Убирает HTML-разметку из сообщений об ошибках (<br>, ссылки)"""
+    return _TAG_RE.sub("", text.replace("<br>", "\n"))
+
+
+class PagedTableModel(QAbstractTableModel):
+    """
+    Табличная модель поверх списка словарей (строка = словарь, колонки — HEADERS).
+
+    Строки можно загружать страницами (set_page_source): следующую страницу
+    представление запрашивает само через canFetchMore/fetchMore при прокрутке вниз.
+    """
+
+    HEADERS = []
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._fetch_page = None   # fetch_page(last_row | None) -> list[dict]
+        self._has_more = False
+
+    # === Qt API ===
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._has_more:
+            return
+        rows = self._fetch_page(self._rows[-1] if self._rows else None)
+        if not rows:
+            self._has_more = False
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    # === Работа со строками ===
+    def reset_rows(self, rows: list):
+        """Заменяет все строки"""
+        self.beginResetModel()
+        self._rows = list(rows)
+        self._fetch_page = None
+        self._has_more = False
+        self.endResetModel()
+
+    def set_page_source(self, fetch_page):
+        """
+        Очищает таблицу и загружает первую страницу из fetch_page;
+        остальные подгружаются при прокрутке.
+        """
+        self.reset_rows([])
+        self._fetch_page = fetch_page
+        self._has_more = True
+        self.fetchMore()
+
+    def clear(self):
+        self.reset_rows([])
+
+    def row(self, row_idx: int) -> dict:
+        return self._rows[row_idx]
+
+    def rows(self) -> list:
+        return self._rows
+
+
+class ResultsTableModel(PagedTableModel):
+    """
+    Данные таблицы результатов: строка — словарь
+    {model_id, model_name, response, checked, saved, pending, is_error, attempts, cancelled,
+    usage, cost}.
+
+    Чекбокс "Выбрать" хранится в модели (checked), а не в виджете;
+    сохранённые в БД строки (saved) отмечены и не снимаются.
+
+    У строк истории из БД (set_page_source) в response лежит превью; полный текст
+    читается через response_loader(result_id) только когда он действительно нужен
+    (full_response).
+    """
+
+    COL_MODEL, COL_RESPONSE, COL_SELECT = range(3)
+    HEADERS = ["Модель", "Ответ", "Выбрать"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.response_loader = None  # response_loader(result_id) -> str
+
+    # === Qt API ===
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        col = index.column()
+
+        if role == ROW_ROLE:
+            return row
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if col == self.COL_MODEL:
+                if row["cancelled"]:
+                    return f"{row['model_name']}\n⛔ прервано"
+                if row["attempts"] > 1:
+                    return f"{row['model_name']}\n🔁 попыток: {row['attempts']}"
+                return row["model_name"]
+            if col == self.COL_RESPONSE:
+                if row["pending"] and not row["response"]:
+                    return "⏳ Ожидание ответа..."
+                return html_to_plain(row["response"]) if row["is_error"] else row["response"]
+            return None
+
+        if role == Qt.ItemDataRole.CheckStateRole and col == self.COL_SELECT and not row["pending"]:
+            return Qt.CheckState.Checked if row["checked"] else Qt.CheckState.Unchecked
+
+        if role == Qt.ItemDataRole.ForegroundRole and col == self.COL_RESPONSE and row["is_error"]:
+            return QColor("#aa0000")
+
+        if role == Qt.ItemDataRole.FontRole and col == self.COL_RESPONSE and row["is_error"]:
+            font = QFont()
+            font.setBold(True)
+            return font
+
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            if col == self.COL_SELECT:
+                return Qt.AlignmentFlag.AlignCenter
+            return Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft
+
+        if role == Qt.ItemDataRole.ToolTipRole and col == self.COL_RESPONSE and not row["pending"]:
+            return "Двойной щелчок — показать ответ полностью"
+
+        if role == Qt.ItemDataRole.ToolTipRole and col == self.COL_MODEL:
+            lines = []
+            if row["cancelled"]:
+                lines.append("Рассылка прервана до полного ответа модели")
+            elif row["attempts"] == 0:
+                lines.append("Ответ из кэша")
+            elif row["attempts"] > 1 and row["is_error"]:
+                lines.append(f"Ошибка после {row['attempts']} попыток")
+            elif row["attempts"] > 1:
+                lines.append(f"Ответ получен с {row['attempts']}-й попытки (временные сбои провайдера)")
+            if row["usage"]:
+                lines.append(f"Токены: {row['usage'].get('prompt_tokens', '?')} → "
+                             f"{row['usage'].get('completion_tokens', '?')}")
+            if row["cost"]:
+                lines.append(f"Стоимость: {row['cost']:.4f} ₽")
+            return "\n".join(lines) or None
+
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if (index.isValid() and role == Qt.ItemDataRole.CheckStateRole
+                and index.column() == self.COL_SELECT):
+            row = self._rows[index.row()]
+            if row["saved"] or row["pending"]:
+                return False
+            row["checked"] = Qt.CheckState(value) == Qt.CheckState.Checked
+            self.dataChanged.emit(index, index, [role])
+            return True
+        return False
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.column() == self.COL_SELECT:
+            row = self._rows[index.row()]
+            if row["saved"] or row["pending"]:
+                return Qt.ItemFlag.ItemIsSelectable  # Уже в БД — снять нельзя
+            flags |= Qt.ItemFlag.ItemIsUserCheckable
+        return flags
+
+    # === Работа со строками ===
+    @staticmethod
+    def make_row(model_id, model_name: str, response: str = "", checked: bool = False,
+                 saved: bool = False, pending: bool = False, is_error: bool = False,
+                 result_id=None, saved_at: str = None, truncated: bool = False,
+                 attempts: int = 1, cancelled: bool = False, usage: dict = None,
+                 cost: float = None) -> dict:
+        return {
+            "model_id": model_id,
+            "model_name": model_name,
+            "response": response,
+            "checked": checked,
+            "saved": saved,
+            "pending": pending,
+            "is_error": is_error,
+            "result_id": result_id,
+            "saved_at": saved_at,
+            "truncated": truncated,
+            "attempts": attempts,
+            "cancelled": cancelled,
+            "usage": usage or {},
+            "cost": cost,
+        }
+
+    def set_response(self, row_idx: int, response: str, is_error: bool = False, attempts: int = 1,
+                     cancelled: bool = False, usage: dict = None, cost: float = None):
+        """Записывает окончательный ответ модели (attempts — сколько понадобилось попыток;
+        cancelled — рассылка прервана, response — то, что успело прийти, или причина отмены;
+        usage, cost — токены и стоимость запроса)"""
+        row = self._rows[row_idx]
+        row.update(response=response, pending=False, is_error=is_error, attempts=attempts,
+                   cancelled=cancelled, usage=usage or {}, cost=cost)
+        self.dataChanged.emit(self.index(row_idx, 0), self.index(row_idx, self.COL_SELECT))
+
+    def append_text(self, row_idx: int, chunk: str):
+        """Дописывает фрагмент потокового ответа"""
+        row = self._rows[row_idx]
+        row["response"] += chunk
+        index = self.index(row_idx, self.COL_RESPONSE)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
+
+    def full_response(self, row: dict) -> str:
+        """Полный текст ответа строки; обрезанное превью дочитывается из БД"""
+        if row["truncated"] and self.response_loader is not None:
+            response = self.response_loader(row["result_id"])
+            if response is not None:
+                row.update(response=response, truncated=False)
+        return row["response"]
+
+    def checked_rows(self) -> list:
+        """Отмеченные строки с готовым ответом"""
+        return [row for row in self._rows if row["checked"] and not row["pending"]]
+
+    def completed_count(self) -> int:
+        return sum(1 for row in self._rows if not row["pending"])
+
+    def cancelled_count(self) -> int:
+        return sum(1 for row in self._rows if row["cancelled"])
+
+
+class ResponseDelegate(QStyledItemDelegate):
+    """
+    Отрисовка ответа с переносом строк.
+    Высота строки считается по тексту, но не выходит за RESPONSE_MIN/MAX_HEIGHT;
+    длинный ответ целиком открывается по двойному щелчку.
+    """
+
+    def sizeHint(self, option, index):
+        hint = super().sizeHint(option, index)
+        text = index.data(Qt.ItemDataRole.DisplayRole) or ""
+        width = max(option.rect.width(), 50) - 8
+        rect = option.fontMetrics.boundingRect(
+            QRect(0, 0, width, RESPONSE_MAX_HEIGHT * 4),
+            int(Qt.TextFlag.TextWordWrap),
+            text[:MEASURE_TEXT_LIMIT],
+        )
+        height = min(max(rect.height() + 12, RESPONSE_MIN_HEIGHT), RESPONSE_MAX_HEIGHT)
+        hint.setHeight(height)
+        return hint
+
+
+class ResultsView(QTableView):
+    """
+    Таблица результатов.
+    Высота строк измеряется лениво — только для строк, попавших в видимую область.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWordWrap(True)
+        self.setTextElideMode(Qt.TextElideMode.ElideRight)
+        self.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setItemDelegateForColumn(ResultsTableModel.COL_RESPONSE, ResponseDelegate(self))
+
+        vheader = self.verticalHeader()
+        vheader.setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        vheader.setDefaultSectionSize(RESPONSE_MIN_HEIGHT)
+
+        self._measured = set()
+        self._measure_timer = QTimer(self)
+        self._measure_timer.setSingleShot(True)
+        self._measure_timer.setInterval(30)
+        self._measure_timer.timeout.connect(self.resize_visible_rows)
+        self.verticalScrollBar().valueChanged.connect(self.schedule_resize)
+
+    def setModel(self, model):
+        super().setModel(model)
+        model.modelReset.connect(self._forget_measurements)
+        model.layoutChanged.connect(self._forget_measurements)
+        model.rowsInserted.connect(self.schedule_resize)
+        model.dataChanged.connect(self._on_data_changed)
+        self.horizontalHeader().sectionResized.connect(self._forget_measurements)
+
+    def schedule_resize(self, *args):
+        self._measure_timer.start()
+
+    def remeasure_row(self, row: int):
+        """Пересчитать высоту строки (например, после прихода ответа)"""
+        self._measured.discard(row)
+        self.schedule_resize()
+
+    def resize_visible_rows(self):
+        """Подгоняет высоту только видимых строк, каждую — один раз"""
+        model = self.model()
+        if model is None or model.rowCount() == 0:
+            return
+        first = self.rowAt(0)
+        last = self.rowAt(self.viewport().height() - 1)
+        if first < 0:
+            first = 0
+        if last < 0:
+            last = model.rowCount() - 1
+        for row in range(first, last + 1):
+            if row not in self._measured:
+                self._measured.add(row)
+                self.resizeRowToContents(row)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.schedule_resize()
+
+    def _forget_measurements(self, *args):
+        self._measured.clear()
+        self.schedule_resize()
+
+    def _on_data_changed(self, top_left, bottom_right, roles=()):
+        if roles and Qt.ItemDataRole.DisplayRole not in roles:
+            return
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            self._measured.discard(row)
+        self.schedule_resize()
+
+
+class ResultsProxyModel(QSortFilterProxyModel):
+    """Сортировка результатов по клику на заголовок; номера строк источника не меняются"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSortCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+
+
+class PromptsTableModel(PagedTableModel):
+    """
+    Данные таблицы промтов: строка — словарь {id, created_at, prompt, tags}.
+    У строк из полнотекстового поиска есть ещё snippet и matched_in.
+    Колонка "Действия" данных не содержит — кнопки рисует PromptActionsDelegate.
+    """
+
+    COL_ID, COL_DATE, COL_PROMPT, COL_TAGS, COL_ACTIONS = range(5)
+    HEADERS = ["ID", "Дата", "Промт", "Теги", "Действия"]
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        col = index.column()
+
+        if role == ROW_ROLE:
+            return row
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if col == self.COL_ID:
+                return row["id"]  # int — сортировка по числу, а не по строке
+            if col == self.COL_DATE:
+                return row["created_at"]
+            if col == self.COL_PROMPT:
+                return row["prompt"]
+            if col == self.COL_TAGS:
+                return row["tags"] or ""
+            return None
+
+        if role == Qt.ItemDataRole.ToolTipRole and col == self.COL_PROMPT and row.get("snippet"):
+            where = "в ответе модели" if row["matched_in"] == "response" else "в промте"
+            return f"Найдено {where}:<br>{row['snippet']}"
+
+        if role == Qt.ItemDataRole.TextAlignmentRole and col == self.COL_PROMPT:
+            return Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft
+
+        return None
+
+    def find_prompt(self, prompt_id: int) -> int:
+        """Номер строки промта или -1"""
+        for row_idx, row in enumerate(self._rows):
+            if row["id"] == prompt_id:
+                return row_idx
+        return -1
+
+    def insert_prompt(self, prompt: dict):
+        """Добавляет новый промт в начало таблицы"""
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self._rows.insert(0, prompt)
+        self.endInsertRows()
+
+    def sync_rows(self, rows: list):
+        """
+        Приводит таблицу к списку rows, сравнивая строки по id: лишние удаляются,
+        недостающие вставляются, переставленные переносятся, изменившиеся
+        обновляются на месте. Загрузка страницами при этом отключается.
+        """
+        self._fetch_page = None
+        self._has_more = False
+        new_ids = {row["id"] for row in rows}
+
+        # 1. Удаляем строки, которых нет в новом списке (блоками, снизу вверх)
+        row_idx = len(self._rows) - 1
+        while row_idx >= 0:
+            if self._rows[row_idx]["id"] in new_ids:
+                row_idx -= 1
+                continue
+            last = row_idx
+            while row_idx >= 0 and self._rows[row_idx]["id"] not in new_ids:
+                row_idx -= 1
+            self.beginRemoveRows(QModelIndex(), row_idx + 1, last)
+            del self._rows[row_idx + 1:last + 1]
+            self.endRemoveRows()
+
+        # 2. Расставляем строки в новом порядке
+        present = {row["id"] for row in self._rows}
+        target = 0
+        while target < len(rows):
+            row = rows[target]
+            if row["id"] not in present:
+                # Подряд идущие новые строки вставляем одним блоком
+                end = target
+                while end + 1 < len(rows) and rows[end + 1]["id"] not in present:
+                    end += 1
+                self.beginInsertRows(QModelIndex(), target, end)
+                self._rows[target:target] = rows[target:end + 1]
+                self.endInsertRows()
+                target = end + 1
+                continue
+
+            current = target
+            while self._rows[current]["id"] != row["id"]:
+                current += 1
+            if current != target:
+                self.beginMoveRows(QModelIndex(), current, current, QModelIndex(), target)
+                self._rows.insert(target, self._rows.pop(current))
+                self.endMoveRows()
+            if self._rows[target] != row:
+                self._rows[target] = row
+                self.dataChanged.emit(self.index(target, 0), self.index(target, self.COL_TAGS))
+            target += 1
+
+    def remove_prompt(self, prompt_id: int):
+        """Убирает промт из таблицы (если он загружен)"""
+        row_idx = self.find_prompt(prompt_id)
+        if row_idx < 0:
+            return
+        self.beginRemoveRows(QModelIndex(), row_idx, row_idx)
+        del self._rows[row_idx]
+        self.endRemoveRows()
+
+
+class PromptsProxyModel(QSortFilterProxyModel):
+    """
+    Сортировка и мгновенная фильтрация уже загруженных промтов.
+    Строки, пришедшие из полнотекстового поиска (есть matched_in), не отсеиваются:
+    они могли совпасть по тексту ответа, которого в таблице нет.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSortCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self._words = []
+
+    def set_filter_text(self, text: str):
+        """Оставляет строки, в промте или тегах которых есть все слова text"""
+        words = re.findall(r"\w+", text.lower())
+        if words == self._words:
+            return
+        self._words = words
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self._words:
+            return True
+        row = self.sourceModel().row(source_row)
+        if row.get("matched_in"):
+            return True
+        haystack = f"{row['prompt'] or ''} {row['tags'] or ''}".lower()
+        return all(word in haystack for word in self._words)
+
+
+class PromptActionsDelegate(QStyledItemDelegate):
+    """
+    Рисует в ячейке кнопки "Копировать" и "Удалить" без создания виджетов
+    и сообщает о нажатии сигналом со строкой промта (словарь).
+    """
+
+    copy_requested = pyqtSignal(object)
+    delete_requested = pyqtSignal(object)
+
+    ACTIONS = (("copy", "📋 Копировать"), ("delete", "🗑️ Удалить"))
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pressed = None  # (QPersistentModelIndex, действие) нажатой кнопки
+
+    def _button_rects(self, rect: QRect) -> list:
+        total_width = len(self.ACTIONS) * ACTION_BUTTON_WIDTH + (len(self.ACTIONS) - 1) * ACTION_BUTTON_SPACING
+        x = rect.x() + max((rect.width() - total_width) // 2, 0)
+        y = rect.y() + max((rect.height() - ACTION_BUTTON_HEIGHT) // 2, 0)
+        return [
+            QRect(x + i * (ACTION_BUTTON_WIDTH + ACTION_BUTTON_SPACING), y,
+                  ACTION_BUTTON_WIDTH, ACTION_BUTTON_HEIGHT)
+            for i in range(len(self.ACTIONS))
+        ]
+
+    def _action_at(self, rect: QRect, pos):
+        for (action, _), button_rect in zip(self.ACTIONS, self._button_rects(rect)):
+            if button_rect.contains(pos):
+                return action
+        return None
+
+    def paint(self, painter, option, index):
+        widget = option.widget
+        style = widget.style() if widget else QApplication.style()
+        style.drawPrimitive(QStyle.PrimitiveElement.PE_PanelItemViewItem, option, painter, widget)
+
+        for (action, text), rect in zip(self.ACTIONS, self._button_rects(option.rect)):
+            button = QStyleOptionButton()
+            button.rect = rect
+            button.text = text
+            button.palette = option.palette
+            button.state = QStyle.StateFlag.State_Enabled | QStyle.StateFlag.State_Raised
+            if self._pressed and self._pressed[1] == action and self._pressed[0] == index:
+                button.state = QStyle.StateFlag.State_Enabled | QStyle.StateFlag.State_Sunken
+            if action == "delete":
+                button.palette.setColor(QPalette.ColorRole.ButtonText, QColor("#aa0000"))
+            style.drawControl(QStyle.ControlElement.CE_PushButton, button, painter, widget)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.Type.MouseButtonPress and event.button() == Qt.MouseButton.LeftButton:
+            action = self._action_at(option.rect, event.position().toPoint())
+            if action:
+                self._pressed = (QPersistentModelIndex(index), action)
+                return True
+
+        elif event.type() == QEvent.Type.MouseButtonRelease and self._pressed:
+            pressed_index, action = self._pressed
+            self._pressed = None
+            if pressed_index == index and self._action_at(option.rect, event.position().toPoint()) == action:
+                row = index.data(ROW_ROLE)
+                if action == "copy":
+                    self.copy_requested.emit(row)
+                else:
+                    self.delete_requested.emit(row)
+            return True
+
+        return super().editorEvent(event, model, option, index)
+
+
+class PromptsView(QTableView):
+    """Таблица промтов: строки фиксированной высоты, кнопки действий рисует делегат"""
+
+    copy_requested = pyqtSignal(object)
+    delete_requested = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWordWrap(True)
+        self.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+
+        vheader = self.verticalHeader()
+        vheader.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        vheader.setDefaultSectionSize(PROMPT_ROW_HEIGHT)
+
+        self.actions_delegate = PromptActionsDelegate(self)
+        self.actions_delegate.copy_requested.connect(self.copy_requested)
+        self.actions_delegate.delete_requested.connect(self.delete_requested)
+        self.setItemDelegateForColumn(PromptsTableModel.COL_ACTIONS, self.actions_delegate)
@@ -0,0 +1,314 @@
+# workers.py
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from cancel import CANCEL_POLL_INTERVAL, CancelToken
+from network import Network, DEFAULT_MAX_WORKERS
+from render import build_preview_markdown, content_hash, render_preview_html
+from exporter import ExportCancelled, export_rows, groups_by_prompt
+
+# Сколько ждать ответа на запрос улучшения промта (секунды)
+ENHANCE_TIMEOUT_SEC = 60
+
+
+class PromptDispatcher(QThread):
+    """
+    Фоновая рассылка промта во все активные модели.
+
+    Запросы выполняются параллельно (см. Network.send_prompt_to_models),
+    каждый готовый ответ сразу передаётся в GUI через сигнал result_ready.
+    В потоковом режиме фрагменты ответа приходят раньше — через token_received.
+
+    cancel() или истечение deadline (секунды на всю рассылку) прекращают ожидание:
+    полученные ответы остаются, а для остальных моделей result_ready приходит
+    с info["cancelled"] = True — поток не ждёт зависших провайдеров.
+
+    budget — BudgetGuard рассылки: её лимит и итоговые расходы (budget.spent).
+    """
+
+    # индекс строки, модель (dict), ответ, подробности запроса (dict: attempts)
+    result_ready = pyqtSignal(int, object, str, object)
+    # индекс строки, очередной фрагмент ответа (только в потоковом режиме)
+    token_received = pyqtSignal(int, str)
+
+    def __init__(self, models: list, prompt: str, max_workers: int = DEFAULT_MAX_WORKERS,
+                 stream: bool = False, cache=None, bypass_cache: bool = False,
+                 deadline: float = None, budget=None, parent=None):
+        super().__init__(parent)
+        self.models = models
+        self.prompt = prompt
+        self.max_workers = max_workers
+        self.stream = stream
+        self.cache = cache
+        self.bypass_cache = bypass_cache
+        self.deadline = deadline
+        self.budget = budget
+        self.cancel_token = None
+
+    def start(self, *args, **kwargs):
+        # Дедлайн отсчитывается от запуска рассылки
+        self.cancel_token = CancelToken(self.deadline)
+        super().start(*args, **kwargs)
+
+    def cancel(self):
+        """Прерывает рассылку: неполученные ответы помечаются как отменённые"""
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+
+    def run(self):
+        token = self.cancel_token
+        on_token = self.token_received.emit if self.stream else None
+        finished = set()
+        for row_idx, model, response, info in Network.send_prompt_to_models(
+            self.models, self.prompt, max_workers=self.max_workers, on_token=on_token,
+            cache=self.cache, bypass_cache=self.bypass_cache, cancel_token=token, budget=self.budget
+        ):
+            finished.add(row_idx)
+            self.result_ready.emit(row_idx, model, response, info)
+
+        for row_idx, model in enumerate(self.models):
+            if row_idx not in finished:
+                self.result_ready.emit(row_idx, model, token.message, {"attempts": 0, "cancelled": True})
+        token.close()
+
+
+class EnhanceWorker(QThread):
+    """
+    Запрос улучшения промта в фоновом потоке — к одной или сразу к нескольким моделям.
+
+    Ответ каждой модели приходит сигналом variant_ready, как только он готов.
+    cancel() и истечение timeout прекращают ожидание: поток завершается сразу,
+    а зависшие HTTP-запросы отменяются через CancelToken — соединения обрываются,
+    слоты RateLimiter освобождаются и не задерживают основную рассылку.
+    """
+
+    # индекс модели, модель (dict), ответ
+    variant_ready = pyqtSignal(int, object, str)
+
+    def __init__(self, models: list, prompt: str, timeout: float = ENHANCE_TIMEOUT_SEC, parent=None):
+        super().__init__(parent)
+        self.models = models
+        self.prompt = prompt
+        self.timeout = timeout
+        # Дедлайн токена ограничивает и таймаут чтения каждой попытки (см. RetryState.timeout)
+        self._token = CancelToken(deadline=timeout)
+        self._cancelled_by_user = False
+
+    def cancel(self):
+        self._cancelled_by_user = True
+        self._token.cancel()
+
+    def is_cancelled(self) -> bool:
+        """Отменён пользователем (истечение timeout отменой не считается — о нём сообщается)"""
+        return self._cancelled_by_user
+
+    def run(self):
+        deadline = time.monotonic() + self.timeout
+        pool = ThreadPoolExecutor(max_workers=max(1, len(self.models)), thread_name_prefix="chatlist-enhance")
+        futures = {
+            pool.submit(Network.send_prompt_to_model, model, self.prompt, cancel_token=self._token): (idx, model)
+            for idx, model in enumerate(self.models)
+        }
+        try:
+            pending = set(futures)
+            while pending and not self._token.is_cancelled():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=min(remaining, CANCEL_POLL_INTERVAL),
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx, model = futures[future]
+                    # send_prompt_to_model сам перехватывает ошибки и возвращает строку
+                    self.variant_ready.emit(idx, model, future.result())
+
+            if pending and not self._cancelled_by_user:
+                # Иначе зависшие запросы повторялись бы до дедлайна RetryState, занимая слот
+                # провайдера (у GigaChat он один — основная рассылка ждала бы их)
+                self._token.cancel(f"нет ответа за {self.timeout:.0f} сек")
+                for future in pending:
+                    idx, model = futures[future]
+                    self.variant_ready.emit(idx, model, f"❌ {model['name']}: нет ответа за {self.timeout:.0f} сек")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._token.close()
+
+
+class SearchWorker(QThread):
+    """
+    Полнотекстовый поиск промтов в фоновом потоке.
+
+    search() ставит запрос в очередь и возвращает его номер (поколение).
+    Выполняется только самый свежий запрос: устаревшие выбрасываются из очереди,
+    а уже идущий SQL-запрос прерывается (sqlite3 interrupt). Результат приходит
+    сигналом results_ready только для последнего поколения.
+    """
+
+    # поколение, запрос, строки (list[dict])
+    results_ready = pyqtSignal(int, str, object)
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._conn = None      # соединение этого потока — для interrupt()
+        self._busy = False
+
+    def search(self, query: str) -> int:
+        """Запускает поиск, отменяя предыдущий; возвращает номер поколения"""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            if self._busy and self._conn is not None:
+                self._conn.interrupt()
+        self._jobs.put((generation, query))
+        return generation
+
+    def cancel(self) -> int:
+        """Отменяет текущий поиск: его результат уже не будет отправлен"""
+        with self._lock:
+            self._generation += 1
+            if self._busy and self._conn is not None:
+                self._conn.interrupt()
+            return self._generation
+
+    def stop(self):
+        """Останавливает поток (при закрытии приложения)"""
+        self.cancel()
+        self._jobs.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            job = self._jobs.get()
+            # Из накопившихся запросов нужен только последний
+            while job is not None:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+            if job is None:
+                return
+
+            generation, query = job
+            with self._lock:
+                if generation != self._generation:
+                    continue
+                self._conn = self.db.conn
+                self._busy = True
+            try:
+                rows = self.db.full_text_search(query)
+            finally:
+                with self._lock:
+                    self._busy = False
+                    current = generation == self._generation
+            if current:
+                self.results_ready.emit(generation, query, rows)
+
+
+class PreviewRenderer(QThread):
+    """
+    Отрисовка Markdown-предпросмотра в фоновом потоке.
+
+    render() — предпросмотр, который пользователь ждёт прямо сейчас;
+    prefetch() — соседние строки, которые, скорее всего, откроют следующими.
+    Сначала выполняются запросы render() (самый свежий — первым), затем prefetch().
+    Текст результата читается из БД в этом потоке; готовый HTML кладётся в кэш
+    и отправляется сигналом rendered.
+    """
+
+    # ключ (result_id, тема, хэш содержимого; None — результата нет), HTML
+    rendered = pyqtSignal(object, str)
+
+    PRIORITY_RENDER = 0
+    PRIORITY_PREFETCH = 1
+
+    def __init__(self, db, cache, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.cache = cache
+        self._jobs = queue.PriorityQueue()
+        self._seq = itertools.count()
+
+    def render(self, result_id: int, theme: str):
+        """Отрисовать сохранённый результат, который открыл пользователь"""
+        self._jobs.put((self.PRIORITY_RENDER, -next(self._seq), result_id, theme))
+
+    def prefetch(self, result_id: int, theme: str):
+        """Заранее отрисовать сохранённый результат"""
+        self._jobs.put((self.PRIORITY_PREFETCH, -next(self._seq), result_id, theme))
+
+    def stop(self):
+        """Останавливает поток (при закрытии приложения)"""
+        self._jobs.put((-1, 0, None, None))
+        self.wait()
+
+    def run(self):
+        while True:
+            _, _, result_id, theme = self._jobs.get()
+            if result_id is None:
+                return
+            key = (result_id, theme, None)
+            try:
+                responses = self.db.get_responses_by_result_id(result_id)
+                if not responses:
+                    self.rendered.emit(key, "<p><i>Нет данных</i></p>")
+                    continue
+                md_text = build_preview_markdown(responses)
+                key = (result_id, theme, content_hash(md_text))
+
+                html = self.cache.get(key)
+                if html is None:
+                    html = render_preview_html(md_text, key[1])
+                    self.cache.put(key, html)
+                self.rendered.emit(key, html)
+            except Exception as e:
+                print(f"[PREVIEW] Ошибка отрисовки {key}: {e}")
+
+
+class ExportWorker(QThread):
+    """
+    Экспорт результатов в файл в фоновом потоке (см. exporter.export_rows).
+    rows_factory(group_by_prompt) вызывается уже в этом потоке — строки можно читать
+    из БД курсором; group_by_prompt — формату файла нужны строки, сгруппированные по промту.
+    """
+
+    # сколько строк записано
+    progress = pyqtSignal(int)
+    # путь к файлу, число строк
+    export_finished = pyqtSignal(str, int)
+    # текст ошибки
+    export_failed = pyqtSignal(str)
+
+    def __init__(self, rows_factory, file_path: str, theme: str = "light", parent=None):
+        super().__init__(parent)
+        self.rows_factory = rows_factory
+        self.file_path = file_path
+        self.theme = theme
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+    def run(self):
+        try:
+            count = export_rows(
+                self.rows_factory(groups_by_prompt(self.file_path)), self.file_path, theme=self.theme,
+                progress=self.progress.emit, is_cancelled=lambda: self._cancelled
+            )
+        except ExportCancelled:
+            self.export_failed.emit("Экспорт отменён")
+        except Exception as e:
+            self.export_failed.emit(str(e))
+        else:
+            self.export_finished.emit(self.file_path, count)